@@ -0,0 +1,381 @@
+"""
+コピーエンジンと並列数ごとのコピー性能を計測する
+
+合成したツリー (小さなファイルが大量、巨大なファイルが少数、深い階層、
+幅の広い階層) を tmpfs (/dev/shm) または一時ディレクトリに作成し、
+CopyBatch でコピーして files/s・MB/s・ピーク RSS・システムコール数を計測する。
+各計測は独立した子プロセスで行うため、ピーク RSS は計測ごとの値になる。
+Windows ではピーク RSS の計測に psutil を使い、インストールされていなければ省く。
+
+使用例:
+    python benchmarks/bench_copy.py
+    python benchmarks/bench_copy.py --shapes tiny deep --engines native -j 1 8
+    python benchmarks/bench_copy.py --scale 0.1 --json > before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # 任意の依存 (Windows でピーク RSS を計測する場合に使う)
+    psutil = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 1 つのツリーを分割するコピー元の数 (並列コピーでジョブ単位の並列度を得るため)
+_SOURCES = 4
+
+# 形状ごとの (ディレクトリ構成, ファイル数, ファイルサイズ)。--scale で件数・サイズを調整する
+SHAPES = {
+    # 1 KiB のファイルが 50 個ずつ 50 ディレクトリに分かれて並ぶ
+    "tiny": {"dirs": 50, "depth": 1, "files": 50, "size": 1024},
+    # 64 MiB のファイルが 1 つ
+    "huge": {"dirs": 1, "depth": 1, "files": 1, "size": 64 * 1024 * 1024},
+    # 64 階層の入れ子の各階層に 4 KiB のファイルが 4 つ
+    "deep": {"dirs": 1, "depth": 64, "files": 4, "size": 4096},
+    # 1 つのディレクトリ直下に 1000 個のサブディレクトリ、それぞれにファイルが 1 つ
+    "wide": {"dirs": 1000, "depth": 1, "files": 1, "size": 4096},
+}
+
+# native-unbatched は小さなファイルのまとめコピーを無効にした native (比較用)
+ENGINES = ["auto", "native", "native-unbatched"]
+
+# --engines に指定できる、登録されたその他のバックエンド (既定では測定しない)
+EXTRA_ENGINES = ["rsync", "robocopy", "reflink", "tar"]
+
+_BLOCK = os.urandom(1024 * 1024)
+
+
+def _write_file(path: str, size: int):
+    with open(path, "wb") as f:
+        while size > 0:
+            chunk = _BLOCK[: min(size, len(_BLOCK))]
+            f.write(chunk)
+            size -= len(chunk)
+
+
+def make_tree(base: str, shape: str, scale: float) -> list:
+    """
+    合成したコピー元ツリーを作成する
+
+    Returns:
+    list: コピー元ディレクトリのパスのリスト
+    """
+    spec = SHAPES[shape]
+    count_scale = scale if shape != "huge" else 1
+    size_scale = scale if shape == "huge" else 1
+    dirs = max(1, int(spec["dirs"] * count_scale))
+    size = max(1, int(spec["size"] * size_scale))
+    sources = []
+    for n in range(_SOURCES):
+        src = os.path.join(base, f"{shape}-{n}")
+        for d in range(dirs):
+            path = os.path.join(src, f"d{d:04d}")
+            for level in range(spec["depth"]):
+                if level:
+                    path = os.path.join(path, f"l{level:02d}")
+                os.makedirs(path, exist_ok=True)
+                for f in range(spec["files"]):
+                    _write_file(os.path.join(path, f"f{f:04d}.bin"), size)
+        sources.append(src)
+    return sources
+
+
+def _proc_io() -> dict:
+    """
+    /proc/self/io の読み書きシステムコール数 (Linux のみ)
+
+    回収済みの子プロセス (rsync など) の値も合算される。
+    """
+    try:
+        with open("/proc/self/io") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return {}
+    return {"syscr": int(values["syscr"]), "syscw": int(values["syscw"])}
+
+
+def _max_rss_kb(who) -> int:
+    """ピーク RSS (KiB)。macOS はバイト単位で返すため換算する"""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _peak_rss() -> dict:
+    """
+    このプロセスと子プロセスのピーク RSS (KiB)
+
+    resource のない Windows では psutil があればこのプロセスのピークの
+    ワーキングセットを返し、どちらもなければ空の辞書を返す。
+    """
+    if resource is not None:
+        return {
+            "peak_rss_kb": _max_rss_kb(resource.RUSAGE_SELF),
+            "peak_rss_children_kb": _max_rss_kb(resource.RUSAGE_CHILDREN),
+        }
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return {"peak_rss_kb": getattr(memory, "peak_wset", memory.rss) // 1024}
+    return {}
+
+
+def run_case(case: dict) -> dict:
+    """
+    子プロセス内で 1 回分のコピーを実行して計測する
+
+    Parameters:
+    case (dict): sources, dest, engine, workers を持つ辞書。noop が真の場合は
+        モジュールの読み込みだけを行う (strace の基準値用)
+    """
+    from mod.copy_support.batch import CopyBatch
+
+    if case.get("noop"):
+        return {}
+
+    errors = []
+    engine = case["engine"]
+    batch = CopyBatch(
+        case["sources"],
+        case["dest"],
+        parallel_copy=case["workers"] > 1,
+        engine="native" if engine == "native-unbatched" else engine,
+        max_workers=case["workers"] if case["workers"] > 1 else None,
+        error_callback=lambda src, attempt, retries, message: errors.append(message),
+    )
+    if engine == "native-unbatched":
+        # 比較用: 小さなファイルもまとめずに1つずつコピーする
+        batch.copy_manager.copy_handler.small_file_threshold = 0
+    io_before = _proc_io()
+    start = time.perf_counter()
+    succeeded = batch.run()
+    seconds = time.perf_counter() - start
+    io_after = _proc_io()
+
+    result = {
+        "succeeded": succeeded,
+        "errors": errors[:5],
+        "seconds": seconds,
+        **_peak_rss(),
+    }
+    if io_before:
+        result["read_syscalls"] = io_after["syscr"] - io_before["syscr"]
+        result["write_syscalls"] = io_after["syscw"] - io_before["syscw"]
+    return result
+
+
+def _spawn(case: dict, strace: bool) -> dict:
+    """計測を子プロセスで実行し、結果を返す"""
+    command = [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)]
+    strace_out = None
+    if strace:
+        fd, strace_out = tempfile.mkstemp(suffix=".strace")
+        os.close(fd)
+        command = ["strace", "-f", "-c", "-o", strace_out] + command
+    try:
+        completed = subprocess.run(
+            command, capture_output=True, text=True, check=True, cwd=ROOT
+        )
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        if strace_out:
+            result["syscalls"] = _strace_total(strace_out)
+    finally:
+        if strace_out:
+            os.remove(strace_out)
+    return result
+
+
+def _strace_total(path: str) -> int:
+    """strace -c の集計からシステムコールの総数を取り出す"""
+    with open(path) as f:
+        for line in f:
+            # % time, seconds, usecs/call (省略されることがある), calls, errors, syscall
+            match = re.match(
+                r"^100\.00\s+\S+\s+(?:\S+\s+)?(\d+)\s+(?:\d+\s+)?total", line
+            )
+            if match:
+                return int(match.group(1))
+    return 0
+
+
+def _engine_available(engine: str) -> bool:
+    from mod.copy_support.backends import available_backends, default_backend
+
+    if engine.startswith("native"):
+        return True
+    if engine == "auto":
+        # auto は比較のため、プラットフォーム標準のツールがある場合だけ測定する
+        return default_backend() != "native"
+    return engine in available_backends()
+
+
+def _tree_stats(sources: list) -> tuple:
+    """コピー元のファイル数と合計バイト数"""
+    from mod.copy_support.scan import scan_sources
+
+    index = scan_sources(sources)
+    return index.total_files, index.total_bytes
+
+
+def bench(args) -> dict:
+    """すべての形状・エンジン・並列数の組み合わせを計測する"""
+    base_dir = args.dir
+    if base_dir is None and os.access("/dev/shm", os.W_OK):
+        base_dir = "/dev/shm"
+    strace = args.strace and shutil.which("strace") is not None
+
+    work = tempfile.mkdtemp(prefix="copyman-bench-", dir=base_dir)
+    results = []
+    try:
+        # インタプリタ起動とモジュール読み込みのシステムコールは差し引く
+        baseline = _spawn({"noop": True}, strace).get("syscalls", 0) if strace else 0
+        for shape in args.shapes:
+            sources = make_tree(os.path.join(work, "src"), shape, args.scale)
+            files, nbytes = _tree_stats(sources)
+            for engine in args.engines:
+                if not _engine_available(engine):
+                    results.append(
+                        {"shape": shape, "engine": engine, "skipped": "not installed"}
+                    )
+                    if not args.json:
+                        print(f"{shape:<6} {engine:<16} skipped: not installed")
+                    continue
+                for workers in args.workers:
+                    best = None
+                    for _ in range(args.repeat):
+                        dest = os.path.join(work, "dest")
+                        result = _spawn(
+                            {
+                                "sources": sources,
+                                "dest": dest,
+                                "engine": engine,
+                                "workers": workers,
+                            },
+                            strace,
+                        )
+                        shutil.rmtree(dest, ignore_errors=True)
+                        if best is None or result["seconds"] < best["seconds"]:
+                            best = result
+                    if "syscalls" in best:
+                        best["syscalls"] = max(best["syscalls"] - baseline, 0)
+                    seconds = best["seconds"] or 1e-9
+                    best.update(
+                        shape=shape,
+                        engine=engine,
+                        workers=workers,
+                        files=files,
+                        bytes=nbytes,
+                        files_per_s=files / seconds,
+                        mb_per_s=nbytes / 1024 / 1024 / seconds,
+                    )
+                    results.append(best)
+                    if not args.json:
+                        _print_result(best)
+            shutil.rmtree(os.path.join(work, "src"))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    gains = _batching_gains(results)
+    if not args.json:
+        for gain in gains:
+            print(
+                f"{gain['shape']:<6} j={gain['workers']:<3} small-file batching:"
+                f" {gain['files_per_s_gain']:.2f}x files/s"
+            )
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "dir": base_dir or tempfile.gettempdir(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "results": results,
+        "batching_gains": gains,
+    }
+
+
+def _batching_gains(results: list) -> list:
+    """native と native-unbatched の files/s の比を形状・並列数ごとに計算する"""
+    measured = {
+        (r["shape"], r["engine"], r["workers"]): r for r in results if "skipped" not in r
+    }
+    gains = []
+    for (shape, engine, workers), result in measured.items():
+        unbatched = measured.get((shape, "native-unbatched", workers))
+        if engine != "native" or unbatched is None:
+            continue
+        gains.append(
+            {
+                "shape": shape,
+                "workers": workers,
+                "files_per_s_gain": result["files_per_s"] / unbatched["files_per_s"],
+            }
+        )
+    return gains
+
+
+def _print_result(result: dict):
+    syscalls = result.get("syscalls")
+    if syscalls is None and "read_syscalls" in result:
+        syscalls = result["read_syscalls"] + result["write_syscalls"]
+    # ピーク RSS を計測できない場合 (psutil のない Windows) は列を省く
+    rss = result.get("peak_rss_kb")
+    print(
+        f"{result['shape']:<6} {result['engine']:<16} j={result['workers']:<3}"
+        f" {result['files_per_s']:10.0f} files/s {result['mb_per_s']:9.1f} MB/s"
+        + (f" rss {rss / 1024:6.1f} MB" if rss is not None else "")
+        + f" syscalls {syscalls if syscalls is not None else '-'}"
+        + ("" if result["succeeded"] else "  FAILED")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES)
+    )
+    parser.add_argument(
+        "--engines", nargs="+", choices=ENGINES + EXTRA_ENGINES, default=ENGINES
+    )
+    parser.add_argument("-j", "--workers", nargs="+", type=int, default=[1, 4])
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="ファイル数 (huge はサイズ) の倍率"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="各組み合わせの実行回数 (最速の回を採用)"
+    )
+    parser.add_argument(
+        "--dir", help="ツリーを作成するディレクトリ (省略時は /dev/shm)"
+    )
+    parser.add_argument(
+        "--strace", action="store_true", help="strace -c で全システムコールを数える"
+    )
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    report = bench(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
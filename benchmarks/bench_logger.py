@@ -0,0 +1,95 @@
+"""
+TomaLogger のフォーマッタごとの1レコードあたりの処理時間を計測する
+
+使用例:
+    python benchmarks/bench_logger.py
+    python benchmarks/bench_logger.py --records 50000 --json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import xml.dom.minidom
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mod.toma_logger.logger import TomaLogger  # noqa: E402
+
+
+class LegacyXmlFormatter(logging.Formatter):
+    """比較用: ElementTree で組み立てて minidom で整形する従来の XML フォーマッタ"""
+
+    def format(self, record):
+        log_entry = ET.Element("entry")
+        ET.SubElement(log_entry, "timestamp").text = self.formatTime(record)
+        ET.SubElement(log_entry, "name").text = record.name
+        ET.SubElement(log_entry, "level").text = record.levelname
+        ET.SubElement(log_entry, "message").text = record.getMessage()
+        rough_string = ET.tostring(log_entry, encoding="unicode")
+        return xml.dom.minidom.parseString(rough_string).toprettyxml(indent="  ")
+
+
+def _formatters():
+    """計測対象のフォーマッタを作成する"""
+    with tempfile.TemporaryDirectory() as log_dir:
+        toma = TomaLogger(log_name="bench.log", log_dir=log_dir)
+        for handler in list(toma.logger.handlers):
+            toma.logger.removeHandler(handler)
+            handler.close()
+        return {
+            "text": logging.Formatter(
+                "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+            ),
+            "json": toma._get_json_formatter(),
+            "xml": toma._get_xml_formatter(),
+            "xml (legacy minidom)": LegacyXmlFormatter(),
+        }
+
+
+def bench(records: int) -> dict:
+    """
+    各フォーマッタで records 件をフォーマットし、1レコードあたりの時間を返す
+
+    Returns:
+    dict: フォーマッタ名から 1 レコードあたりのマイクロ秒への辞書
+    """
+    record = logging.LogRecord(
+        "copy_manager",
+        logging.INFO,
+        __file__,
+        0,
+        "Progress: 524288/2097152 (25%) 1.0MB/s ETA 0:03 <a&b>",
+        None,
+        None,
+    )
+    results = {}
+    for name, formatter in _formatters().items():
+        formatter.format(record)  # ウォームアップ
+        start = time.perf_counter()
+        for _ in range(records):
+            formatter.format(record)
+        results[name] = (time.perf_counter() - start) / records * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args()
+
+    results = bench(args.records)
+    if args.json:
+        print(json.dumps({"records": args.records, "usec_per_record": results}))
+        return
+    for name, usec in results.items():
+        print(f"{name:<22} {usec:8.2f} us/record")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,79 +17,70 @@ from PyQt6.QtWidgets import (
     QTextEdit,
     QMenu,
     QListWidgetItem,
+    QSpinBox,
 )
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from mod.copy_support.main import CopyManager
+from mod.copy_support.batch import CopyBatch
+from mod.copy_support.concurrency import DEFAULT_MAX_WORKERS
 from mod.toma_logger.logger import TomaLogger
-import concurrent.futures
 
 
 # ロガーを初期化 (ログフォーマットやログディレクトリなどを指定)
-logger = TomaLogger(log_name="copy_manager.log", log_dir="logs", log_format="text")
+# 進捗ログがコピー処理を遅らせないよう、書き出しは別スレッドで行う
+logger = TomaLogger(
+    log_name="copy_manager.log", log_dir="logs", log_format="text", async_mode=True
+)
 
 
 class CopyThread(QThread):
     progress = pyqtSignal(str)
     progress_percent = pyqtSignal(int)
+    # コピー元ごとの進行状況を含む ProgressSnapshot
+    progress_snapshot = pyqtSignal(object)
     finished = pyqtSignal()
     cancelled = False
 
-    def __init__(self, src_dirs, dest_dir, parallel_copy=False):
+    def __init__(
+        self,
+        src_dirs,
+        dest_dir,
+        parallel_copy=False,
+        engine="auto",
+        sync=False,
+        checksum=False,
+        max_workers=None,
+        autotune=True,
+        verify=False,
+        dedup=False,
+        stat_cache=False,
+        mirror_dirs=None,
+    ):
         super().__init__()
         self.src_dirs = src_dirs
         self.dest_dir = dest_dir
         self.parallel_copy = parallel_copy
-        self.copy_manager = CopyManager(self.report_progress, self.report_error)
+        self.batch = CopyBatch(
+            src_dirs,
+            dest_dir,
+            parallel_copy,
+            engine=engine,
+            sync=sync,
+            checksum=checksum,
+            max_workers=max_workers,
+            autotune=autotune,
+            verify=verify,
+            dedup=dedup,
+            stat_cache=stat_cache,
+            mirror_dirs=mirror_dirs,
+            message_callback=self.report_message,
+            progress_callback=self.report_progress,
+            error_callback=self.report_error,
+        )
+        self.copy_manager = self.batch.copy_manager
 
     def run(self):
         try:
-            total_dirs = len(self.src_dirs)
-            if self.parallel_copy:
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    futures = []
-                    for i, src_dir in enumerate(self.src_dirs):
-                        if self.cancelled:
-                            self.progress.emit("コピーがキャンセルされました。")
-                            logger.info("Copy canceled by user.")
-                            break
-
-                        dest_path = os.path.join(
-                            self.dest_dir, os.path.basename(src_dir)
-                        )
-                        if os.path.exists(dest_path):
-                            self.progress.emit(
-                                f"Skipping {src_dir}: already exists in destination."
-                            )
-                            logger.info(f"Skipping {src_dir}: already exists.")
-                            continue
-
-                        self.progress.emit(f"Copying {src_dir} to {dest_path}")
-                        logger.info(f"Copying {src_dir} to {dest_path}")
-                        futures.append(
-                            executor.submit(self.copy_manager.copy, src_dir, dest_path)
-                        )
-
-                    for future in concurrent.futures.as_completed(futures):
-                        future.result()
-            else:
-                for i, src_dir in enumerate(self.src_dirs):
-                    if self.cancelled:
-                        self.progress.emit("コピーがキャンセルされました。")
-                        logger.info("Copy canceled by user.")
-                        break
-
-                    dest_path = os.path.join(self.dest_dir, os.path.basename(src_dir))
-                    if os.path.exists(dest_path):
-                        self.progress.emit(
-                            f"Skipping {src_dir}: already exists in destination."
-                        )
-                        logger.info(f"Skipping {src_dir}: already exists.")
-                        continue
-
-                    self.progress.emit(f"Copying {src_dir} to {dest_path}")
-                    logger.info(f"Copying {src_dir} to {dest_path}")
-                    self.copy_manager.copy(src_dir, dest_path)
-
+            self.batch.run()
             self.finished.emit()
             logger.info("Copy operation completed.")
         except Exception as e:
@@ -97,10 +88,24 @@ class CopyThread(QThread):
             self.progress.emit(error_msg)
             logger.error(error_msg)
 
-    def report_progress(self, current, total, current_percent, total_percent):
-        self.progress_percent.emit(int(total_percent))
-        self.progress.emit(f"Copying: {current}/{total} ({current_percent}%)")
-        logger.info(f"Progress: {current}/{total} ({current_percent}%)")
+    def report_message(self, message):
+        self.progress.emit(message)
+        logger.info(message)
+
+    def report_progress(self, snapshot):
+        # ProgressAggregator から最大 10 回/秒だけ呼ばれるため、そのまま UI へ送る
+        overall = snapshot.overall
+        self.progress_percent.emit(int(overall.percent))
+        self.progress_snapshot.emit(snapshot)
+        message = (
+            f"{overall.done / 1024 / 1024:.1f}/{overall.total / 1024 / 1024:.1f}MB"
+            f" ({overall.percent:.1f}%) {overall.rate / 1024 / 1024:.1f}MB/s"
+        )
+        if overall.eta is not None:
+            minutes, seconds = divmod(int(overall.eta), 60)
+            message += f" ETA {minutes}:{seconds:02d}"
+        self.progress.emit(f"Copying: {message}")
+        logger.info(f"Progress: {message}")
 
     def report_error(self, src, attempt, retries, message):
         self.progress.emit(f"Error copying {src}: {message}")
@@ -108,6 +113,7 @@ class CopyThread(QThread):
 
     def cancel(self):
         self.cancelled = True
+        self.batch.cancel()
 
 
 class DroppableQListWidget(QListWidget):
@@ -148,6 +154,14 @@ class DirectoryCopierApp(QWidget):
         self.history_file = "directory_selection_history.json"
         self.copy_thread = None
         self.parallel_copy = False
+        self.copy_engine = "auto"
+        self.sync_mode = False
+        self.max_workers = DEFAULT_MAX_WORKERS
+        self.autotune = True
+        self.verify_mode = False
+        self.dedup_mode = False
+        self.stat_cache_mode = False
+        self.mirror_dirs = []
 
     def initUI(self):
         self.setWindowTitle("copyMan_v4")
@@ -191,11 +205,60 @@ class DirectoryCopierApp(QWidget):
         self.select_dest_dir_button.clicked.connect(self.selectDestDirectory)
         right_button_layout.addWidget(self.select_dest_dir_button)
 
+        # 追加のコピー先ディレクトリ選択ボタン (コピー元を1回読んで同時にコピーする)
+        self.select_mirror_dir_button = QPushButton("追加のコピー先を選択", self)
+        self.select_mirror_dir_button.clicked.connect(self.selectMirrorDirectory)
+        right_button_layout.addWidget(self.select_mirror_dir_button)
+
+        # 追加のコピー先をすべて解除するボタン
+        self.clear_mirror_dirs_button = QPushButton("追加のコピー先を解除", self)
+        self.clear_mirror_dirs_button.clicked.connect(self.clearMirrorDirectories)
+        right_button_layout.addWidget(self.clear_mirror_dirs_button)
+
         # 並列コピーオプション
         self.parallel_copy_checkbox = QCheckBox("並列コピーを有効にする", self)
         self.parallel_copy_checkbox.stateChanged.connect(self.toggleParallelCopy)
         right_button_layout.addWidget(self.parallel_copy_checkbox)
 
+        # 並列コピーの同時コピー数の上限 (同じディスクへのコピーが多すぎると遅くなる)
+        self.max_workers_spinbox = QSpinBox(self)
+        self.max_workers_spinbox.setPrefix("最大同時コピー数: ")
+        self.max_workers_spinbox.setRange(1, 64)
+        self.max_workers_spinbox.setValue(DEFAULT_MAX_WORKERS)
+        self.max_workers_spinbox.valueChanged.connect(self.setMaxWorkers)
+        right_button_layout.addWidget(self.max_workers_spinbox)
+
+        # 同時コピー数の自動調整オプション
+        self.autotune_checkbox = QCheckBox("同時コピー数を自動調整する", self)
+        self.autotune_checkbox.setChecked(True)
+        self.autotune_checkbox.stateChanged.connect(self.toggleAutotune)
+        right_button_layout.addWidget(self.autotune_checkbox)
+
+        # ネイティブコピーエンジンオプション
+        self.native_engine_checkbox = QCheckBox("ネイティブコピーを使用する", self)
+        self.native_engine_checkbox.stateChanged.connect(self.toggleNativeEngine)
+        right_button_layout.addWidget(self.native_engine_checkbox)
+
+        # 同期モードオプション
+        self.sync_checkbox = QCheckBox("既存のコピー先と同期する", self)
+        self.sync_checkbox.stateChanged.connect(self.toggleSyncMode)
+        right_button_layout.addWidget(self.sync_checkbox)
+
+        # 検証モードオプション (ハッシュ値のマニフェストを記録・照合する)
+        self.verify_checkbox = QCheckBox("コピー結果をハッシュ値で検証する", self)
+        self.verify_checkbox.stateChanged.connect(self.toggleVerifyMode)
+        right_button_layout.addWidget(self.verify_checkbox)
+
+        # 重複ファイルのリンクオプション (ネイティブコピーで処理するコピー元のみ)
+        self.dedup_checkbox = QCheckBox("同じ内容のファイルをリンクで作成する", self)
+        self.dedup_checkbox.stateChanged.connect(self.toggleDedupMode)
+        right_button_layout.addWidget(self.dedup_checkbox)
+
+        # メタデータキャッシュオプション (変更のないファイルの比較を次回から省略する)
+        self.stat_cache_checkbox = QCheckBox("前回のコピー結果を記録して同期を速くする", self)
+        self.stat_cache_checkbox.stateChanged.connect(self.toggleStatCache)
+        right_button_layout.addWidget(self.stat_cache_checkbox)
+
         top_layout.addLayout(right_button_layout, 1)
 
         # コピー先ディレクトリ表示エリア
@@ -207,6 +270,13 @@ class DirectoryCopierApp(QWidget):
         # self.dest_dir_display.dropEvent = self.dropEvent # 不要なので削除
         bottom_layout.addWidget(self.dest_dir_display)
 
+        # 追加のコピー先ディレクトリ表示エリア
+        self.mirror_dirs_display = QLineEdit(self)
+        self.mirror_dirs_display.setReadOnly(True)
+        self.mirror_dirs_display.setAcceptDrops(False)
+        self.mirror_dirs_display.setPlaceholderText("追加のコピー先なし")
+        bottom_layout.addWidget(self.mirror_dirs_display)
+
         # コピー開始ボタン
         self.copy_button = QPushButton("作業を開始", self)
         self.copy_button.clicked.connect(self.confirmAndStartCopy)
@@ -276,6 +346,25 @@ class DirectoryCopierApp(QWidget):
         if directory:
             self.dest_dir_display.setText(directory)
 
+    def selectMirrorDirectory(self):
+        options = QFileDialog.Option.ShowDirsOnly
+        directory = QFileDialog.getExistingDirectory(
+            self, "追加のコピー先を選択", "", options
+        )
+
+        if directory and directory not in self.mirror_dirs:
+            if directory == self.dest_dir_display.text():
+                QMessageBox.warning(
+                    self, "警告", "コピー先ディレクトリと同じディレクトリです。"
+                )
+                return
+            self.mirror_dirs.append(directory)
+            self.mirror_dirs_display.setText("; ".join(self.mirror_dirs))
+
+    def clearMirrorDirectories(self):
+        self.mirror_dirs = []
+        self.mirror_dirs_display.clear()
+
     def confirmAndStartCopy(self):
         dest_dir = self.dest_dir_display.text()
         if not dest_dir:
@@ -285,7 +374,7 @@ class DirectoryCopierApp(QWidget):
             return
 
         for src_dir in self.selected_directories:
-            if src_dir == dest_dir:
+            if src_dir == dest_dir or src_dir in self.mirror_dirs:
                 QMessageBox.warning(
                     self,
                     "警告",
@@ -311,7 +400,17 @@ class DirectoryCopierApp(QWidget):
             os.makedirs(dest_dir)
 
         self.copy_thread = CopyThread(
-            self.selected_directories, dest_dir, self.parallel_copy
+            self.selected_directories,
+            dest_dir,
+            self.parallel_copy,
+            self.copy_engine,
+            sync=self.sync_mode,
+            max_workers=self.max_workers,
+            autotune=self.autotune,
+            verify=self.verify_mode,
+            dedup=self.dedup_mode,
+            stat_cache=self.stat_cache_mode,
+            mirror_dirs=list(self.mirror_dirs),
         )
         self.copy_thread.progress.connect(self.updateStatusBar)
         self.copy_thread.progress_percent.connect(self.updateProgressBar)
@@ -370,6 +469,28 @@ class DirectoryCopierApp(QWidget):
     def toggleParallelCopy(self, state):
         self.parallel_copy = state == Qt.CheckState.Checked
 
+    def toggleNativeEngine(self, state):
+        checked = Qt.CheckState(state) == Qt.CheckState.Checked
+        self.copy_engine = "native" if checked else "auto"
+
+    def toggleSyncMode(self, state):
+        self.sync_mode = Qt.CheckState(state) == Qt.CheckState.Checked
+
+    def setMaxWorkers(self, value):
+        self.max_workers = value
+
+    def toggleAutotune(self, state):
+        self.autotune = Qt.CheckState(state) == Qt.CheckState.Checked
+
+    def toggleVerifyMode(self, state):
+        self.verify_mode = Qt.CheckState(state) == Qt.CheckState.Checked
+
+    def toggleDedupMode(self, state):
+        self.dedup_mode = Qt.CheckState(state) == Qt.CheckState.Checked
+
+    def toggleStatCache(self, state):
+        self.stat_cache_mode = Qt.CheckState(state) == Qt.CheckState.Checked
+
     def showContextMenu(self, pos):
         menu = QMenu(self)
         remove_action = menu.addAction("選択を解除")
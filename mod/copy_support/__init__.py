@@ -1,3 +1,10 @@
-from .main import CopyManager
-
 __all__ = ["CopyManager"]
+
+
+def __getattr__(name):
+    # CLI の --help などで CopyManager 一式を読み込まないよう、初回参照時に読み込む
+    if name == "CopyManager":
+        from .main import CopyManager
+
+        return CopyManager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,208 @@
+"""
+コマンドラインからコピーを実行するエントリポイント
+
+GUI (PyQt6) を読み込まずに CopyBatch を実行するため、ヘッドレスサーバーや
+cron から利用できる。
+
+使用例:
+    python -m mod.copy_support /data/a /data/b -d /backup -j 4
+    python -m mod.copy_support --history directory_selection_history.json -d /backup --json
+    python -m mod.copy_support /data/a -d /backup --mirror /mnt/nas/backup
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from .backends import backend_names
+
+
+def _load_history(path: str) -> list:
+    """GUI で保存したディレクトリ選択履歴 (JSON のリスト) を読み込む"""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _parse_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m mod.copy_support",
+        description="複数のディレクトリをコピー先ディレクトリへコピーします。",
+    )
+    parser.add_argument("sources", nargs="*", help="コピー元のディレクトリ")
+    parser.add_argument("-d", "--dest", required=True, help="コピー先ディレクトリ")
+    parser.add_argument(
+        "--mirror",
+        action="append",
+        default=[],
+        metavar="DIR",
+        help="同じ内容をコピーする追加のコピー先 (複数指定可)。コピー元は1回だけ読まれる",
+    )
+    parser.add_argument(
+        "-j",
+        "--parallel",
+        type=int,
+        default=1,
+        metavar="N",
+        help="並列コピーの同時コピー数の上限 (1 で逐次コピー)",
+    )
+    parser.add_argument(
+        "--min-workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="並列数を自動調整するときの下限",
+    )
+    parser.add_argument(
+        "--autotune",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="スループットに応じて並列数をデバイスごとに自動調整する (-j が上限になる)",
+    )
+    parser.add_argument(
+        "--history", help="ディレクトリ選択履歴ファイル (コピー元に追加される)"
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["auto", *backend_names()],
+        default="auto",
+        help="コピーエンジン (auto はコピー元・コピー先の組ごとに選ぶ)",
+    )
+    parser.add_argument(
+        "--sync", action="store_true", help="既存のコピー先に変更分だけをコピーする"
+    )
+    parser.add_argument(
+        "--checksum", action="store_true", help="変更の判定にチェックサムを使用する"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="ハッシュ値のマニフェストを記録し、既存のコピー先をマニフェストと照合する",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="同じ内容のファイルをコピーせずリンクで作成する (native でコピーする場合のみ)",
+    )
+    parser.add_argument(
+        "--stat-cache",
+        action="store_true",
+        help="コピーしたファイルの情報をコピー先に記録し、次回の同期で比較を省略する",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="進行状況を JSON Lines で出力する"
+    )
+    return parser.parse_args(argv)
+
+
+class _Reporter:
+    def __init__(self, as_json: bool):
+        """
+        進行状況を標準出力へ書き出すクラス
+
+        Parameters:
+        as_json (bool): JSON Lines 形式で出力するかどうか
+        """
+        self.as_json = as_json
+
+    def _emit(self, record: dict, text: str):
+        if self.as_json:
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        else:
+            print(text, flush=True)
+
+    def message(self, message):
+        self._emit({"event": "message", "message": message}, message)
+
+    def progress(self, snapshot):
+        overall = snapshot.overall
+        record = {
+            "event": "progress",
+            "done": overall.done,
+            "total": overall.total,
+            "percent": round(overall.percent, 1),
+            "rate": round(overall.rate),
+            "eta": None if overall.eta is None else round(overall.eta, 1),
+            "sources": {
+                src: {
+                    "done": progress.done,
+                    "total": progress.total,
+                    "rate": round(progress.rate),
+                }
+                for src, progress in snapshot.sources.items()
+            },
+        }
+        text = (
+            f"Copying: {overall.done}/{overall.total} bytes ({overall.percent:.1f}%)"
+            f" {overall.rate / 1024 / 1024:.1f}MB/s"
+        )
+        self._emit(record, text)
+
+    def error(self, src, attempt, retries, message):
+        record = {
+            "event": "error",
+            "src": src,
+            "attempt": attempt,
+            "retries": retries,
+            "message": message,
+        }
+        self._emit(record, f"Error copying {src}: {message}")
+
+    def finished(self, succeeded: bool):
+        text = "コピーが完了しました。" if succeeded else "一部のコピーに失敗しました。"
+        self._emit({"event": "finished", "succeeded": succeeded}, text)
+
+
+def main(argv: list = None) -> int:
+    """
+    コマンドラインのエントリポイント
+
+    Returns:
+    int: 終了コード (すべて成功した場合は 0)
+    """
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+    sources = list(args.sources)
+    if args.history:
+        sources += _load_history(args.history)
+    if not sources:
+        print("コピー元が指定されていません。", file=sys.stderr)
+        return 2
+
+    # --help や引数エラーで終わる場合に CopyBatch 一式を読み込まないよう、ここで読み込む
+    from .batch import CopyBatch
+
+    reporter = _Reporter(args.json)
+    batch = CopyBatch(
+        [os.path.abspath(src) for src in sources],
+        os.path.abspath(args.dest),
+        parallel_copy=args.parallel > 1,
+        engine=args.engine,
+        sync=args.sync,
+        checksum=args.checksum,
+        max_workers=args.parallel if args.parallel > 1 else None,
+        min_workers=args.min_workers,
+        autotune=args.autotune,
+        verify=args.verify,
+        dedup=args.dedup,
+        stat_cache=args.stat_cache,
+        mirror_dirs=[os.path.abspath(mirror) for mirror in args.mirror],
+        message_callback=reporter.message,
+        progress_callback=reporter.progress,
+        error_callback=reporter.error,
+    )
+    try:
+        succeeded = batch.run()
+    except KeyboardInterrupt:
+        batch.cancel()
+        reporter.message("コピーがキャンセルされました。")
+        return 130
+    except Exception as e:
+        reporter.message(f"Error during copy: {e}")
+        return 1
+
+    reporter.finished(succeeded)
+    return 0 if succeeded else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import asyncio
+import os
+import re
+import signal
+import time
+from typing import Callable
+
+from . import mac_linux
+from .cancel import _KILL_GRACE, CancelToken
+from .concurrency import ConcurrencyController, group_by_device
+from .mac_linux import _parse_progress2, rsync_command
+
+# 標準出力を読み出す単位
+_READ_SIZE = 64 * 1024
+
+# エラー報告用に保持する標準エラーの末尾の大きさ
+_STDERR_TAIL = 64 * 1024
+
+# 自動調整で上限が上がったかを確認する間隔 (秒)
+_GATE_POLL = 0.25
+
+# progress2 の進捗行は \r、その他の出力は \n で区切られる
+_LINE_BREAK = re.compile(r"[\r\n]")
+
+
+class _DeviceGate:
+    def __init__(self, limit):
+        """
+        イベントループ上で1組のデバイスへの同時実行数を DeviceLimit の上限に抑える
+
+        DeviceLimit.acquire はスレッドを止めて待つため、イベントループ上では
+        使わずに上限 (limit.limit) だけを参照する。
+        """
+        self.limit = limit
+        self.in_flight = 0
+        self._released = asyncio.Event()
+
+    async def __aenter__(self):
+        while self.in_flight >= self.limit.limit:
+            self._released.clear()
+            try:
+                # 自動調整で上限が上がった場合にも気付けるよう一定間隔で確認する
+                await asyncio.wait_for(self._released.wait(), _GATE_POLL)
+            except asyncio.TimeoutError:
+                pass
+        self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        self._released.set()
+
+
+class AsyncRsyncRunner:
+    def __init__(
+        self,
+        error_callback: Callable = None,
+        checksum: bool = False,
+        timeout: float = None,
+        retries: int = 3,
+        cancel_token: CancelToken = None,
+    ):
+        """
+        1つのイベントループで多数の rsync を並行して実行するクラス
+
+        asyncio.create_subprocess_exec で子プロセスを起動し、標準出力の進捗行は
+        届いた順に解析して報告する (出力をメモリに溜めない)。コピーごとに
+        スレッドを使わないため、数百の rsync を同時に実行できる。子プロセスごとに
+        制限時間とキャンセルを適用し、止める際は終了を要求してから猶予後に
+        強制終了する。
+
+        Parameters:
+        error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        checksum (bool): サイズと更新日時ではなくチェックサムで変更を判定する
+        timeout (float): rsync 1回あたりの制限時間 (秒、None で無制限)。
+            超えた場合は終了させて失敗として扱い、リトライする
+        retries (int): コピー失敗時の最大リトライ回数
+        cancel_token (CancelToken): キャンセルを受け取るトークン
+        """
+        self.error_callback = error_callback
+        self.checksum = checksum
+        self.timeout = timeout
+        self.retries = retries
+        self.cancel_token = cancel_token or CancelToken()
+
+    def run(
+        self,
+        jobs: list,
+        concurrency: ConcurrencyController = None,
+        progress_factory: Callable = None,
+    ) -> list:
+        """
+        すべてのジョブを実行し、終わるまで待つ
+
+        Parameters:
+        jobs (list): (コピー元, コピー先) の組のリスト
+        concurrency (ConcurrencyController): デバイスの組ごとの同時実行数の制御
+        progress_factory (Callable): (コピー元, DeviceLimit) を受け取り、その
+            ジョブの進行状況コールバックを返す関数
+
+        Returns:
+        list: ジョブごとの、コピーに成功したかどうかのリスト
+        """
+        concurrency = concurrency or ConcurrencyController()
+        return asyncio.run(self.run_async(jobs, concurrency, progress_factory))
+
+    async def run_async(
+        self,
+        jobs: list,
+        concurrency: ConcurrencyController,
+        progress_factory: Callable = None,
+    ) -> list:
+        """run のコルーチン版 (実行中のイベントループで使う)"""
+        loop = asyncio.get_running_loop()
+        tasks = [None] * len(jobs)
+        for key, entries in group_by_device(jobs).items():
+            limit = concurrency.limit_for(key)
+            gate = _DeviceGate(limit)
+            for index, src, dest in entries:
+                progress = progress_factory(src, limit) if progress_factory else None
+                tasks[index] = asyncio.ensure_future(
+                    self._run_job(gate, src, dest, progress)
+                )
+
+        def cancel_all():
+            # cancel() は別のスレッドから呼ばれるため、イベントループに依頼する
+            loop.call_soon_threadsafe(lambda: [task.cancel() for task in tasks])
+
+        self.cancel_token.add_callback(cancel_all)
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.cancel_token.remove_callback(cancel_all)
+        return [result is True for result in results]
+
+    async def _run_job(self, gate: _DeviceGate, src: str, dest: str, progress) -> bool:
+        """1つのジョブを枠を確保してから実行し、失敗時はリトライする"""
+        async with gate:
+            for attempt in range(1, self.retries + 1):
+                returncode = await self._run_once(src, dest, progress, attempt)
+                if returncode == 0:
+                    return True
+                if attempt < self.retries:
+                    self._report_error(src, attempt, "リトライ中...")
+                else:
+                    self._report_error(src, attempt, "コピーに失敗しました。")
+        return False
+
+    async def _run_once(self, src: str, dest: str, progress, attempt: int) -> int:
+        """
+        rsync を1回実行し、進捗を報告しながら終了を待つ
+
+        Parameters:
+        attempt (int): 何回目の実行か (エラーの報告に使う)
+
+        Returns:
+        int: rsync の終了コード (起動できなかった場合は 127)
+        """
+        command, streaming = rsync_command(src, dest, self.checksum)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                # rsync が起動する子プロセスもまとめて止められるよう別のグループにする
+                start_new_session=True,
+            )
+        except OSError as e:
+            # rsync がインストールされていない場合など
+            self._report_error(src, attempt, str(e))
+            return 127
+        stderr_tail = bytearray()
+        latest = []
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    self._read_progress(process.stdout, progress, latest),
+                    self._read_tail(process.stderr, stderr_tail),
+                    process.wait(),
+                ),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            await _stop(process)
+            self._report_error(
+                src, attempt, f"{self.timeout} 秒以内に終了しませんでした。"
+            )
+            return process.returncode or 1
+        except asyncio.CancelledError:
+            # キャンセルされたジョブの rsync は終了させてから伝える
+            await asyncio.shield(_stop(process))
+            raise
+
+        if process.returncode == 0:
+            if progress is not None:
+                if streaming:
+                    done = latest[0][0] if latest else 0
+                    rate = latest[0][3] if latest else 0.0
+                    progress(done, done, 100, 100, rate=rate, eta=0)
+                else:
+                    progress(1, 1, 100, 100)
+        else:
+            self._report_error(src, attempt, stderr_tail.decode(errors="replace"))
+        return process.returncode
+
+    async def _read_progress(self, stream, progress, latest: list):
+        """標準出力を読みながら progress2 の進捗行を解析して報告する"""
+        pending = ""
+        last_report = 0.0
+        while True:
+            chunk = await stream.read(_READ_SIZE)
+            if not chunk:
+                return
+            *lines, pending = _LINE_BREAK.split(
+                pending + chunk.decode(errors="replace")
+            )
+            for line in lines:
+                parsed = _parse_progress2(line)
+                if parsed is None:
+                    continue
+                latest[:] = [parsed]
+                now = time.monotonic()
+                interval = mac_linux._PROGRESS_INTERVAL
+                if progress is not None and now - last_report >= interval:
+                    last_report = now
+                    done, total, percent, rate, eta = parsed
+                    progress(done, total, percent, percent, rate=rate, eta=eta)
+
+    async def _read_tail(self, stream, tail: bytearray):
+        """標準エラーを読み、末尾の _STDERR_TAIL バイトだけを保持する"""
+        while True:
+            chunk = await stream.read(_READ_SIZE)
+            if not chunk:
+                return
+            tail += chunk
+            del tail[:-_STDERR_TAIL]
+
+    def _report_error(self, src: str, attempt: int, message: str):
+        if self.error_callback:
+            self.error_callback(src, attempt, self.retries, message)
+
+
+async def _stop(process: asyncio.subprocess.Process):
+    """
+    子プロセスのグループに終了を要求し、猶予を過ぎても終了しなければ強制終了する
+
+    rsync の子プロセスがパイプを開いたまま残らないよう、グループごと止めてから
+    パイプの残りを読み切る。
+    """
+    if process.returncode is None:
+        _signal_group(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), _KILL_GRACE)
+        except asyncio.TimeoutError:
+            _signal_group(process, signal.SIGKILL)
+            await process.wait()
+    try:
+        await asyncio.wait_for(process.communicate(), _KILL_GRACE)
+    except asyncio.TimeoutError:
+        pass
+
+
+def _signal_group(process: asyncio.subprocess.Process, sig: int):
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
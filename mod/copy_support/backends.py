@@ -0,0 +1,295 @@
+import functools
+import os
+import platform
+import re
+import shutil
+import sys
+from typing import Callable
+
+from .concurrency import device_key
+from .mac_linux import MacLinuxCopy
+from .native import LARGE_FILE_THRESHOLD, SMALL_FILE_THRESHOLD, NativeCopy
+from .reflink import ReflinkCopy, cp_supports_reflink
+from .tarpipe import TarPipeCopy, tar_available
+from .win import WindowsCopy
+
+# reflink (データブロックの共有) に対応したファイルシステム
+_REFLINK_FILESYSTEMS = frozenset({"btrfs", "xfs", "bcachefs", "ocfs2"})
+
+# ネットワーク越しのファイルシステム (外部ツールの差分転送と再試行に任せる)
+_NETWORK_FILESYSTEMS = frozenset(
+    {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "afpfs", "9p"}
+)
+
+# 小さなファイルが多いツリーとみなす最小のファイル数
+_MANY_FILES = 1000
+
+# /proc/self/mounts でエスケープされた文字 (空白は \040 など)
+_MOUNT_ESCAPE_RE = re.compile(r"\\([0-7]{3})")
+
+
+class Backend:
+    __slots__ = ("name", "factory", "probe", "description", "incremental")
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable,
+        probe: Callable,
+        description: str = "",
+        incremental: bool = True,
+    ):
+        """
+        登録されたコピーバックエンド
+
+        Parameters:
+        name (str): エンジン名 (CopyManager の engine に指定する)
+        factory (Callable): (progress_callback, error_callback, checksum,
+            cancel_token=) を受け取り、コピー実行クラスを返す関数
+        probe (Callable): このプラットフォームで利用可能かを返す関数
+        description (str): コマンドラインのヘルプに表示する説明
+        incremental (bool): 既存のコピー先へ変更分だけをコピーできるか (ファイルごとの
+            比較、ジャーナル、メタデータキャッシュに従う)。False のバックエンドは
+            同期・再開やメタデータキャッシュの使用時には自動選択しない
+        """
+        self.name = name
+        self.factory = factory
+        self.probe = probe
+        self.description = description
+        self.incremental = incremental
+
+    def __repr__(self):
+        return f"Backend(name={self.name!r})"
+
+
+_BACKENDS = {}
+
+
+def register_backend(
+    name: str,
+    factory: Callable,
+    probe: Callable,
+    description: str = "",
+    incremental: bool = True,
+):
+    """
+    コピーバックエンドを登録する (同じ名前のバックエンドは置き換える)
+
+    Parameters:
+    name (str): エンジン名
+    factory (Callable): コピー実行クラスを作る関数 (Backend を参照)
+    probe (Callable): このプラットフォームで利用可能かを返す関数
+    description (str): コマンドラインのヘルプに表示する説明
+    incremental (bool): 変更分だけをコピーできるか (Backend を参照)
+    """
+    _BACKENDS[name] = Backend(name, factory, probe, description, incremental)
+    backend_available.cache_clear()
+    available_backends.cache_clear()
+
+
+def backend_names() -> list:
+    """登録されているバックエンドの名前のリスト (登録順)"""
+    return list(_BACKENDS)
+
+
+def get_backend(name: str) -> Backend:
+    """
+    名前からバックエンドを取得する
+
+    Raises:
+    ValueError: 登録されていない名前の場合
+    """
+    try:
+        return _BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"不明なコピーエンジンです: {name}") from None
+
+
+@functools.lru_cache(maxsize=None)
+def backend_available(name: str) -> bool:
+    """
+    1つのバックエンドがこのプラットフォームで利用可能かを調べる
+
+    プローブ (ツールの --help の実行など) は必要になったバックエンドについてだけ
+    初めて呼ばれたときに行い、結果をキャッシュする。
+    """
+    backend = _BACKENDS.get(name)
+    if backend is None:
+        return False
+    try:
+        return bool(backend.probe())
+    except OSError:
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def available_backends() -> frozenset:
+    """
+    このプラットフォームで利用可能なバックエンドの名前の集合を返す
+
+    すべてのバックエンドのツールとシステムコールの有無を調べ、結果をキャッシュする。
+    ツールをインストールした後は available_backends.cache_clear() と
+    backend_available.cache_clear() で調べ直す。
+    """
+    return frozenset(name for name in _BACKENDS if backend_available(name))
+
+
+def _availability(available: frozenset = None) -> Callable:
+    """
+    バックエンドの名前が利用可能かを返す関数
+
+    available を省略した場合は、問い合わせたバックエンドだけを調べる。
+    """
+    return backend_available if available is None else available.__contains__
+
+
+def default_backend(available: frozenset = None) -> str:
+    """
+    プラットフォーム標準のツール (robocopy/rsync) の名前を返す
+
+    ツールがインストールされていない場合は native を返す。available を省略した
+    場合は、標準のツールだけを調べる。
+    """
+    preferred = "robocopy" if platform.system() == "Windows" else "rsync"
+    return preferred if _availability(available)(preferred) else "native"
+
+
+def filesystem_type(path: str) -> str:
+    """
+    パスが属するファイルシステムの種類を返す
+
+    /proc/self/mounts から、パスを含む最も深いマウントポイントを探す。
+    存在しないパスも、存在する親ディレクトリと同じマウントポイントで判定できる。
+
+    Returns:
+    str: ファイルシステムの種類 (例: "ext4", "btrfs", "nfs4")。Linux 以外や
+        判定できない場合は None
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    path = os.path.realpath(path)
+    try:
+        with open("/proc/self/mounts", encoding="utf-8", errors="replace") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+
+    best, fstype = None, None
+    for fields in mounts:
+        if len(fields) < 2:
+            continue
+        mount_point = _MOUNT_ESCAPE_RE.sub(
+            lambda m: chr(int(m.group(1), 8)), fields[0]
+        )
+        inside = path == mount_point or path.startswith(
+            mount_point.rstrip("/") + "/"
+        )
+        # 同じマウントポイントに重ねてマウントされている場合は後のものが有効
+        if inside and (best is None or len(mount_point) >= len(best)):
+            best, fstype = mount_point, fields[1]
+    return fstype
+
+
+def choose_backend(
+    src: str,
+    dest: str,
+    tree=None,
+    available: frozenset = None,
+    incremental: bool = False,
+) -> str:
+    """
+    コピー元・コピー先の組に最も速いと見込まれるバックエンドの名前を返す
+
+    1. 同じファイルシステムで reflink に対応している (btrfs/XFS など) 場合は
+       reflink (データをコピーしない)
+    2. どちらもローカルで、大きなファイルが中心の場合 (平均が
+       LARGE_FILE_THRESHOLD 以上) は native (カーネル内コピーと範囲の並列コピー)
+    3. どちらもローカルで、小さなファイルが多数の場合 (_MANY_FILES 以上で平均が
+       SMALL_FILE_THRESHOLD 未満) は tar (読み込みと展開を重ねる tar パイプ)
+    4. それ以外、およびファイルシステムを判定できない場合 (Linux 以外) は
+       プラットフォーム標準のツール (なければ native)
+
+    incremental を指定した場合は、変更分だけをコピーできるバックエンド
+    (native/rsync/robocopy) からだけ選ぶ。reflink と tar はジャーナルや
+    メタデータキャッシュを使わず、reflink は既存のファイルもすべて作り直す。
+
+    Parameters:
+    src (str): コピー元のパス
+    dest (str): コピー先のパス
+    tree (TreeSize): コピー元のファイル数と合計サイズ (省略時は 2. と 3. を判定しない)
+    available (frozenset): 利用可能なバックエンド (省略時は判定に必要な
+        バックエンドだけを backend_available で調べる)
+    incremental (bool): 既存のコピー先への同期・再開や、メタデータキャッシュを
+        使う場合に True
+
+    Returns:
+    str: バックエンドの名前
+    """
+    probe = _availability(available)
+    if incremental:
+
+        def usable(name):
+            backend = _BACKENDS.get(name)
+            return probe(name) and (backend is None or backend.incremental)
+
+    else:
+        usable = probe
+
+    src_dev, dest_dev = device_key(src, dest)
+    src_fs = filesystem_type(src)
+    if (
+        src_dev is not None
+        and src_dev == dest_dev
+        and src_fs in _REFLINK_FILESYSTEMS
+        and usable("reflink")
+    ):
+        return "reflink"
+
+    dest_fs = filesystem_type(dest)
+    if src_fs is None or dest_fs is None:
+        # ファイルシステムを判定できない (Linux 以外など) 場合は標準のツールに任せる
+        return default_backend(available)
+    local = src_fs not in _NETWORK_FILESYSTEMS and dest_fs not in _NETWORK_FILESYSTEMS
+    if local and tree is not None and tree.files and usable("native"):
+        average = tree.size / tree.files
+        if average >= LARGE_FILE_THRESHOLD:
+            return "native"
+        if tree.files >= _MANY_FILES and average < SMALL_FILE_THRESHOLD:
+            return "tar" if usable("tar") else "native"
+    return default_backend(available)
+
+
+def _rsync_available() -> bool:
+    """rsync がインストールされているか (Windows では使わない)"""
+    return platform.system() != "Windows" and shutil.which("rsync") is not None
+
+
+def _robocopy_available() -> bool:
+    """robocopy が使えるか (Windows のみ)"""
+    return platform.system() == "Windows" and shutil.which("robocopy") is not None
+
+
+register_backend(
+    "native",
+    NativeCopy,
+    lambda: True,
+    "Python 内でコピーする (copy_file_range/sendfile/reflink)",
+)
+register_backend("rsync", MacLinuxCopy, _rsync_available, "rsync -a でコピーする")
+register_backend(
+    "robocopy", WindowsCopy, _robocopy_available, "robocopy /MIR でコピーする"
+)
+register_backend(
+    "reflink",
+    ReflinkCopy,
+    cp_supports_reflink,
+    "cp --reflink でデータブロックを共有する (btrfs/XFS など)",
+    incremental=False,
+)
+register_backend(
+    "tar",
+    TarPipeCopy,
+    tar_available,
+    "tar ストリームをパイプで展開する (小さなファイルが多いツリー向け)",
+    incremental=False,
+)
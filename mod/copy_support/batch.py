@@ -0,0 +1,436 @@
+import os
+from typing import Callable
+
+from .backends import get_backend
+from .concurrency import ConcurrencyController
+from .dedup import DedupIndex, HashCache, default_cache_path
+from .journal import CopyJournal, JOURNAL_NAME
+from .main import CopyManager
+from .manifest import DEFAULT_ALGORITHM, Manifest, manifest_path
+from .progress import ProgressAggregator
+from .scan import scan_sources
+from .statcache import STAT_CACHE_NAME, StatCache
+
+
+class CopyBatch:
+    def __init__(
+        self,
+        src_dirs: list,
+        dest_dir: str,
+        parallel_copy: bool = False,
+        engine: str = "auto",
+        sync: bool = False,
+        checksum: bool = False,
+        max_workers: int = None,
+        min_workers: int = 1,
+        autotune: bool = True,
+        verify: bool = False,
+        dedup: bool = False,
+        stat_cache: bool = False,
+        mirror_dirs: list = None,
+        message_callback: Callable = None,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+    ):
+        """
+        複数のコピー元をコピー先ディレクトリへまとめてコピーするクラス
+
+        コピー先に既に存在するコピー元の除外、中断されたコピーの再開、
+        事前のサイズ集計、逐次/並列コピーを行う。GUI (CopyThread) と
+        コマンドライン (python -m mod.copy_support) の両方から使用する。
+
+        Parameters:
+        src_dirs (list): コピー元のパスのリスト
+        dest_dir (str): コピー先ディレクトリ (各コピー元はこの下に同名でコピーされる)
+        parallel_copy (bool): 並列コピーを行うかどうか
+        engine (str): コピーエンジン ("auto" または "native")
+        sync (bool): 既存のコピー先にも変更分をコピーするかどうか
+        checksum (bool): 変更の判定にチェックサムを使用するかどうか
+        max_workers (int): 並列コピーの同時コピー数の上限 (省略時は DEFAULT_MAX_WORKERS)
+        min_workers (int): 自動調整で下げる同時コピー数の下限
+        autotune (bool): スループットに応じて同時コピー数をデバイスごとに自動調整するか
+        verify (bool): コピーしたファイルのハッシュ値をコピー先の隣のマニフェストに
+            記録し、既存のコピー先はマニフェストと照合する
+        dedup (bool): コピー元どうしで同じ内容のファイルを、コピー済みのファイルの
+            reflink またはハードリンクとして作成する (engine が "auto" の場合は
+            native が選ばれたコピー元のみ。それ以外のコピー元はメッセージで通知する)
+        stat_cache (bool): 前回までにコピーしたファイルとコピー元ディレクトリの一覧を
+            コピー先に記録し、次回の同期で変更のないファイルの比較を省略する
+        mirror_dirs (list): 同じ内容をコピーする追加のコピー先ディレクトリのリスト。
+            指定した場合、各コピー元はデータを1回だけ読んで dest_dir と
+            すべての追加のコピー先へ同時にコピーされ (CopyManager.copy_fanout)、
+            進行状況と成否はコピー先ごとに集計される
+        message_callback (Callable): 状況メッセージを受け取るコールバック関数
+        progress_callback (Callable): 進行状況のスナップショット (ProgressSnapshot)
+            を受け取るコールバック関数。コピーの速さに関係なく最大 10 回/秒呼ばれる
+        error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        """
+        self.src_dirs = src_dirs
+        self.dest_dir = dest_dir
+        self.mirror_dirs = list(mirror_dirs or [])
+        self.dest_roots = [dest_dir] + self.mirror_dirs
+        self.parallel_copy = parallel_copy
+        self.sync = sync
+        self.concurrency = ConcurrencyController(max_workers, min_workers, autotune)
+        self.message_callback = message_callback
+        self.progress_callback = progress_callback
+        self.error_callback = error_callback
+        self.copy_manager = CopyManager(
+            self._on_progress, self._on_error, engine=engine, checksum=checksum
+        )
+        self.copy_manager.set_file_callback(self._on_file)
+        self.verify = verify
+        if verify:
+            # native エンジンと複数のコピー先へのコピーでは、コピー中にハッシュ値を
+            # 計算する (データを読み直さない)
+            self.copy_manager.set_digest_callback(self._on_digest)
+        self._manifests = {}
+        self._verify_failed = False
+        self.dedup = None
+        if dedup and engine in ("auto", "native"):
+            # ハッシュ値は実行をまたいで再利用する。"auto" では native が選ばれた
+            # コピー元・コピー先の組だけでリンクを作成する
+            self.dedup = DedupIndex(HashCache(default_cache_path()))
+            self.copy_manager.set_dedup(self.dedup)
+        elif dedup:
+            self._message(
+                f"Duplicate linking is ignored: engine {engine!r} does not support it."
+            )
+        self.use_stat_cache = stat_cache
+        if engine != "auto" and not get_backend(engine).incremental and (
+            sync or stat_cache
+        ):
+            # "auto" では同期・再開とメタデータキャッシュの使用時に選ばれない
+            self._message(
+                f"Engine {engine!r} does not use the journal or stat cache: "
+                "existing destinations are not skipped file by file."
+            )
+        self.stat_cache = None
+        self.cancelled = False
+        self.journal = None
+        self._journals = {}
+        self._job_journals = {}
+        self.size_index = None
+        # 各ワーカーからの進捗をまとめ、一定間隔で progress_callback に通知する
+        self.aggregator = ProgressAggregator(sink=progress_callback)
+        self._job_roots = {}
+        self._current_src = None
+
+    def run(self) -> bool:
+        """
+        コピーを実行する
+
+        Returns:
+        bool: すべてのコピー元のコピーに成功した場合は True
+        """
+        # 中断されたコピーを再開できるよう、各コピー先にジャーナルを記録する
+        for root in self.dest_roots:
+            os.makedirs(root, exist_ok=True)
+            self._journals[root] = CopyJournal(os.path.join(root, JOURNAL_NAME))
+        self.journal = self._journals[self.dest_dir]
+        self.copy_manager.set_journal(self.journal)
+        if self.use_stat_cache:
+            self.stat_cache = StatCache(os.path.join(self.dest_dir, STAT_CACHE_NAME))
+            self.copy_manager.set_stat_cache(self.stat_cache)
+        succeeded = True
+        try:
+            jobs = self.plan_jobs()
+            if jobs and not self.cancelled:
+                self.scan_jobs(jobs)
+                self._report_dedup_skipped(jobs)
+                self.aggregator.start()
+
+            if self.mirror_dirs:
+                succeeded = self._run_fanout(jobs)
+            elif self.parallel_copy:
+                if self.cancelled:
+                    self._message("コピーがキャンセルされました。")
+                elif jobs:
+                    # すべてのコピー元をまとめて1つのワーカープールでコピーする
+                    for src_dir, dest_path in jobs:
+                        self._message(f"Copying {src_dir} to {dest_path}")
+                        self.journal.begin(src_dir, dest_path)
+                    results = self.copy_manager.copy_many(
+                        jobs,
+                        job_progress_callback=self._on_job_progress,
+                        concurrency=self.concurrency,
+                    )
+                    for (src_dir, dest_path), result in zip(jobs, results):
+                        if result:
+                            self._finish_job(src_dir, dest_path)
+                        succeeded = succeeded and bool(result)
+                    if self.cancelled:
+                        self._message("コピーがキャンセルされました。")
+            else:
+                for src_dir, dest_path in jobs:
+                    if self.cancelled:
+                        self._message("コピーがキャンセルされました。")
+                        break
+
+                    self._message(f"Copying {src_dir} to {dest_path}")
+                    self._current_src = src_dir
+                    self.journal.begin(src_dir, dest_path)
+                    if self.copy_manager.copy(src_dir, dest_path):
+                        self._finish_job(src_dir, dest_path)
+                    else:
+                        succeeded = False
+                    self._current_src = None
+        except KeyboardInterrupt:
+            # ジャーナルを閉じる前に実行中のコピーを止め、以降の記録を行わせない
+            self.cancel()
+            raise
+        finally:
+            self.aggregator.stop()
+            if self.stat_cache is not None:
+                self.stat_cache.save()
+            if self.dedup is not None:
+                self.dedup.cache.close()
+                if self.dedup.linked_files:
+                    self._message(
+                        f"Linked {self.dedup.linked_files} duplicate files "
+                        f"({self.dedup.linked_bytes / 1e6:.1f} MB not copied)"
+                    )
+            for journal in self._journals.values():
+                if journal.has_unfinished():
+                    journal.close()
+                else:
+                    journal.discard()
+        return succeeded and not self.cancelled and not self._verify_failed
+
+    def _run_fanout(self, jobs: list) -> bool:
+        """
+        コピー元ごとに、コピーが必要なすべてのコピー先へ1回の読み込みでコピーする
+
+        Returns:
+        bool: すべてのコピー先へのコピーに成功した場合は True
+        """
+        targets = {}
+        for src_dir, dest_path in jobs:
+            targets.setdefault(src_dir, []).append(dest_path)
+
+        succeeded = True
+        for src_dir, dest_paths in targets.items():
+            if self.cancelled:
+                self._message("コピーがキャンセルされました。")
+                break
+
+            self._message(f"Copying {src_dir} to {', '.join(dest_paths)}")
+            for dest_path in dest_paths:
+                self._journal_for(dest_path).begin(src_dir, dest_path)
+            results = self.copy_manager.copy_fanout(src_dir, dest_paths)
+            for dest_path, result in zip(dest_paths, results):
+                if result:
+                    self._finish_job(src_dir, dest_path)
+                else:
+                    # 他のコピー先へのコピーは続ける
+                    self._message(f"Failed to copy {src_dir} to {dest_path}")
+                    succeeded = False
+        return succeeded
+
+    def _report_dedup_skipped(self, jobs: list):
+        """重複ファイルのリンクを行わないコピー元をメッセージで通知する"""
+        if self.dedup is None:
+            return
+        if self.mirror_dirs:
+            self._message(
+                "Duplicate linking is ignored when copying to multiple destinations."
+            )
+            return
+        for src_dir, dest_path in jobs:
+            backend = self.copy_manager.backend_for(src_dir, dest_path)
+            if backend != "native":
+                self._message(
+                    f"Not linking duplicates in {src_dir}: copying with {backend}."
+                )
+
+    def _journal_for(self, dest_path: str) -> CopyJournal:
+        """コピー先が属するコピー先ディレクトリのジャーナルを返す"""
+        return self._job_journals.get(dest_path, self.journal)
+
+    def plan_jobs(self) -> list:
+        """
+        コピーが必要な (コピー元, コピー先) のリストを作成する
+
+        追加のコピー先がある場合は、コピー先ディレクトリごとに判定する。
+
+        Returns:
+        list: (コピー元, コピー先) の組のリスト
+        """
+        jobs = []
+        for src_dir in self.src_dirs:
+            if self.cancelled:
+                break
+            for root in self.dest_roots:
+                dest_path = os.path.join(root, os.path.basename(src_dir))
+                self._job_journals[dest_path] = self._journals[root]
+                if self._plan_job(src_dir, dest_path):
+                    jobs.append((src_dir, dest_path))
+        return jobs
+
+    def _plan_job(self, src_dir: str, dest_path: str) -> bool:
+        """
+        コピー元1つ分のコピー先を確認し、コピーが必要かどうかを判定する
+
+        Returns:
+        bool: コピーが必要な場合は True
+        """
+        interrupted = self._journal_for(dest_path).is_interrupted(src_dir, dest_path)
+        if self.stat_cache is not None and not os.path.exists(dest_path):
+            # 削除されたコピー先の記録が残っているとコピーが省略される
+            self.stat_cache.forget(dest_path)
+        if self.verify and not interrupted and os.path.exists(dest_path):
+            self.verify_existing(src_dir, dest_path)
+        if interrupted:
+            # 前回中断されたコピーは、コピー済みのファイルを飛ばして再開する
+            self._message(f"Resuming {src_dir}: previous copy was interrupted.")
+        elif self.sync and os.path.exists(dest_path):
+            # 同期モードでは既存のコピー先に変更されたファイルだけをコピーする
+            self._message(f"Syncing {src_dir} into existing {dest_path}")
+        elif os.path.exists(dest_path):
+            self._message(f"Skipping {src_dir}: already exists in destination.")
+            return False
+        return True
+
+    def scan_jobs(self, jobs: list):
+        """コピー前にコピー元全体のファイル数と合計サイズを集計する"""
+        self._message("コピー元のサイズを集計しています...")
+        # 複数のコピー先へコピーする場合も、コピー元は1回だけ集計する
+        self.size_index = scan_sources(
+            list(dict.fromkeys(src_dir for src_dir, _ in jobs)),
+            listings=self.stat_cache,
+        )
+        # engine が "auto" の場合はファイルサイズの構成もバックエンドの選択に使う
+        self.copy_manager.set_size_index(self.size_index)
+        total_mb = self.size_index.total_bytes / 1024 / 1024
+        self._message(
+            f"Total: {self.size_index.total_files} files, {total_mb:.1f} MB"
+        )
+        self.aggregator.set_totals(
+            {
+                self._progress_key(src_dir, dest_path): self.size_index[src_dir].size
+                for src_dir, dest_path in jobs
+            }
+        )
+        # native エンジンはコピー元、copy_fanout はコピー先のファイルのパスを報告する
+        self._job_roots = {
+            root: root for root in (self._progress_key(*job) for job in jobs)
+        }
+        if self.verify:
+            for _, dest_path in jobs:
+                manifest = Manifest(manifest_path(dest_path))
+                if manifest.algorithm != DEFAULT_ALGORITHM:
+                    # 以前と異なるアルゴリズムのハッシュ値は比較できないので作り直す
+                    manifest.entries.clear()
+                    manifest.algorithm = DEFAULT_ALGORITHM
+                self._manifests[dest_path] = manifest
+
+    def verify_existing(self, src_dir: str, dest_path: str):
+        """
+        既存のコピー先をマニフェストと照合する
+
+        コピー元を読み直さずに、コピー先のデータが前回コピーしたときのままかを
+        確認する。一致しないファイルはエラーとして報告し、同期モードでは
+        削除して再びコピーされるようにする。
+        """
+        manifest = Manifest(manifest_path(dest_path))
+        if not manifest.entries:
+            return
+        self._message(f"Verifying {dest_path} against its manifest")
+        failures = manifest.verify(dest_path)
+        for rel, reason in failures:
+            self._on_error(src_dir, 1, 1, f"{rel or dest_path}: {reason} mismatch")
+            path = os.path.join(dest_path, rel) if rel else dest_path
+            if self.sync and reason != "missing":
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            if self.stat_cache is not None:
+                # 記録が残っていると再コピーされない
+                self.stat_cache.forget(path)
+        self._message(
+            f"Verified {len(manifest.entries)} files: {len(failures)} mismatched"
+        )
+        if failures:
+            self._verify_failed = True
+
+    def _finish_job(self, src_dir: str, dest_path: str):
+        """コピー元1つ分のコピー完了を記録する"""
+        self._journal_for(dest_path).finish(src_dir, dest_path)
+        self.aggregator.complete(self._progress_key(src_dir, dest_path))
+        manifest = self._manifests.get(dest_path)
+        if manifest is not None:
+            if not (
+                self.mirror_dirs
+                or self.copy_manager.streams_digests(src_dir, dest_path)
+            ):
+                # 外部コマンドでコピーした場合はコピー直後のコピー先から作成する
+                manifest.add_tree(dest_path)
+            manifest.save()
+
+    def _progress_key(self, src_dir: str, dest_path: str) -> str:
+        """
+        進行状況を集計する単位を返す
+
+        追加のコピー先がある場合はコピー先ごと、ない場合はコピー元ごとに集計する。
+        """
+        return dest_path if self.mirror_dirs else src_dir
+
+    def cancel(self):
+        """
+        コピーをキャンセルする
+
+        実行中のコピー (rsync/robocopy の子プロセスや native エンジンの
+        コピーループ) もすぐに中断し、実行待ちのコピーは行わない。
+        中断されたコピー元はジャーナルに未完了として残り、次回再開される。
+        """
+        self.cancelled = True
+        self.copy_manager.cancel()
+
+    def _message(self, message: str):
+        if self.message_callback:
+            self.message_callback(message)
+
+    def _on_progress(
+        self, current, total, current_percent, total_percent, rate=None, eta=None
+    ):
+        """逐次コピー中のコピーエンジンからの進捗を集計する"""
+        if self._current_src is not None:
+            self._on_job_progress(
+                self._current_src, current, total, current_percent, total_percent, rate
+            )
+
+    def _on_job_progress(
+        self, src, current, total, current_percent, total_percent, rate=None, eta=None
+    ):
+        """外部コマンドからのコピー元ごとの進捗を集計する"""
+        if rate is not None:
+            # rsync の progress2 はバイト単位で進捗を報告する
+            self.aggregator.update(src, current)
+
+    def _on_file(self, path, size):
+        """native エンジンで処理したファイルのサイズを、属するコピー元に加算する"""
+        parent = path
+        while parent not in self._job_roots:
+            next_parent = os.path.dirname(parent)
+            if next_parent == parent:
+                return
+            parent = next_parent
+        self.aggregator.add(self._job_roots[parent], size)
+
+    def _on_digest(self, src, dest, src_stat, digest):
+        """コピー中に計算されたハッシュ値を、属するコピー先のマニフェストに記録する"""
+        root = dest
+        while root not in self._manifests:
+            parent = os.path.dirname(root)
+            if parent == root:
+                return
+            root = parent
+        rel = os.path.relpath(dest, root) if dest != root else ""
+        self._manifests[root].add(
+            rel, src_stat.st_size, src_stat.st_mtime_ns, digest
+        )
+
+    def _on_error(self, src, attempt, retries, message):
+        if self.error_callback:
+            self.error_callback(src, attempt, retries, message)
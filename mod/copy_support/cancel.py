@@ -0,0 +1,106 @@
+import subprocess
+import threading
+
+# 終了要求に応じない子プロセスを強制終了するまでの猶予 (秒)
+_KILL_GRACE = 2.0
+
+
+class CopyCancelled(Exception):
+    """コピーがキャンセルされたことを表す例外 (OSError ではないためリトライされない)"""
+
+
+def _terminate(process: subprocess.Popen):
+    """子プロセスに終了を要求し、猶予を過ぎても終了しなければ強制終了する"""
+    if process.poll() is not None:
+        return
+    try:
+        process.terminate()
+    except OSError:
+        return
+
+    def kill():
+        if process.poll() is None:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+    timer = threading.Timer(_KILL_GRACE, kill)
+    timer.daemon = True
+    timer.start()
+
+
+class CancelToken:
+    def __init__(self):
+        """
+        実行中のコピーにキャンセルを伝えるトークン
+
+        CopyManager が作成し、すべてのコピー実行クラスとスケジューラで共有する。
+        Python 内のコピーループは check() でチャンクごとに確認して
+        CopyCancelled を送出し、外部コマンド (rsync/robocopy) は register で
+        登録しておくと cancel() の時点で終了させられる。イベントループ上の
+        子プロセスのように別の方法で止める必要があるものは add_callback で
+        キャンセル時に呼ばれる関数を登録する。
+        """
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        """キャンセルされたかどうか"""
+        return self._event.is_set()
+
+    def cancel(self):
+        """キャンセルし、実行中の子プロセスを終了させる"""
+        with self._lock:
+            self._event.set()
+            processes = list(self._processes)
+            callbacks = list(self._callbacks)
+        for process in processes:
+            _terminate(process)
+        for callback in callbacks:
+            callback()
+
+    def check(self):
+        """
+        キャンセルされていれば例外を送出する
+
+        Raises:
+        CopyCancelled: キャンセルされている場合
+        """
+        if self._event.is_set():
+            raise CopyCancelled()
+
+    def register(self, process: subprocess.Popen):
+        """実行中の子プロセスを登録する (既にキャンセルされていればすぐに終了させる)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._processes.add(process)
+                return
+        _terminate(process)
+
+    def unregister(self, process: subprocess.Popen):
+        """終了した子プロセスの登録を解除する"""
+        with self._lock:
+            self._processes.discard(process)
+
+    def add_callback(self, callback):
+        """
+        キャンセル時に呼ばれる関数を登録する
+
+        cancel() を呼んだスレッドから呼ばれる。既にキャンセルされていれば
+        すぐに呼ぶ。
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        """add_callback で登録した関数の登録を解除する"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+
+# 並列数の既定の上限。CPU コア数が多くても同じディスクへ数十のコピーを同時に行わない
+DEFAULT_MAX_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+# スループットの変化をこの割合より小さい場合は変化なしとみなす
+_TOLERANCE = 0.05
+
+
+def device_key(src: str, dest: str) -> tuple:
+    """
+    コピー元とコピー先のデバイス番号の組を返す
+
+    コピー先がまだ存在しない場合は、存在する最も近い親ディレクトリのデバイスを使う。
+    """
+    try:
+        src_dev = os.stat(src).st_dev
+    except OSError:
+        src_dev = None
+    path = os.path.abspath(dest)
+    while True:
+        try:
+            return src_dev, os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return src_dev, None
+            path = parent
+
+
+class DeviceLimit:
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        autotune: bool = True,
+        window: float = 1.0,
+    ):
+        """
+        1組のコピー元・コピー先デバイスへの同時コピー数の上限
+
+        autotune が有効な場合、window 秒ごとに達成したスループットを測定し、
+        前回より向上していれば上限を1増やし (加算的増加)、低下していれば
+        半分にする (乗算的減少)。同じディスクへのコピーを増やしてもシークが
+        増えるだけの HDD では上限が小さく、SSD やネットワークでは大きく収束する。
+
+        Parameters:
+        min_workers (int): 上限の最小値
+        max_workers (int): 上限の最大値
+        autotune (bool): 上限を自動調整するかどうか (False の場合は max_workers で固定)
+        window (float): スループットを測定する間隔 (秒)
+        """
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.autotune = autotune
+        self.window = window
+        if autotune:
+            self.limit = max(min_workers, max_workers // 2)
+        else:
+            self.limit = max_workers
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._bytes = 0
+        self._window_start = time.monotonic()
+        self._last_throughput = None
+
+    def acquire(self):
+        """同時コピー数が上限未満になるまで待ってから枠を確保する"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        """確保した枠を解放する"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def record(self, nbytes: int):
+        """コピーしたバイト数を記録し、測定間隔が過ぎていれば上限を調整する"""
+        if not self.autotune:
+            return
+        with self._condition:
+            self._bytes += nbytes
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed < self.window:
+                return
+            throughput = self._bytes / elapsed
+            self._bytes = 0
+            self._window_start = now
+            if throughput > 0:
+                self._adjust(throughput)
+
+    def observe(self, throughput: float):
+        """
+        測定したスループットから上限を調整する
+
+        Parameters:
+        throughput (float): 直近の測定間隔のスループット (バイト/秒)
+        """
+        with self._condition:
+            self._adjust(throughput)
+
+    def _adjust(self, throughput: float):
+        """AIMD で上限を調整する (ロック取得済みで呼ぶこと)"""
+        last = self._last_throughput
+        self._last_throughput = throughput
+        if last is None or throughput > last * (1 + _TOLERANCE):
+            self.limit = min(self.limit + 1, self.max_workers)
+        elif throughput < last * (1 - _TOLERANCE):
+            self.limit = max(self.limit // 2, self.min_workers)
+        # 上限が増えた場合は待機中のコピーを起こす
+        self._condition.notify_all()
+
+
+class ConcurrencyController:
+    def __init__(
+        self,
+        max_workers: int = None,
+        min_workers: int = 1,
+        autotune: bool = True,
+        window: float = 1.0,
+    ):
+        """
+        コピー元・コピー先のデバイスの組ごとに同時コピー数を制御するクラス
+
+        Parameters:
+        max_workers (int): デバイスの組ごとの同時コピー数の上限 (省略時は
+            DEFAULT_MAX_WORKERS)。ワーカースレッド数もこの値になる
+        min_workers (int): 自動調整で下げる同時コピー数の下限
+        autotune (bool): スループットに応じて同時コピー数を自動調整するかどうか
+        window (float): スループットを測定する間隔 (秒)
+        """
+        self.max_workers = max(max_workers or DEFAULT_MAX_WORKERS, 1)
+        self.min_workers = max(min(min_workers, self.max_workers), 1)
+        self.autotune = autotune
+        self.window = window
+        self._lock = threading.Lock()
+        self._limits = {}
+
+    def limit_for(self, key) -> DeviceLimit:
+        """デバイスの組に対応する DeviceLimit を返す (初回は作成する)"""
+        with self._lock:
+            limit = self._limits.get(key)
+            if limit is None:
+                limit = DeviceLimit(
+                    self.min_workers, self.max_workers, self.autotune, self.window
+                )
+                self._limits[key] = limit
+            return limit
+
+    def limits(self) -> dict:
+        """デバイスの組から現在の同時コピー数の上限への辞書"""
+        with self._lock:
+            return {key: limit.limit for key, limit in self._limits.items()}
+
+
+def group_by_device(jobs: list) -> dict:
+    """
+    ジョブをコピー元・コピー先のデバイスの組ごとにまとめる
+
+    Parameters:
+    jobs (list): (コピー元, コピー先) の組のリスト
+
+    Returns:
+    dict: デバイスの組から (ジョブ番号, コピー元, コピー先) のリストへの辞書
+        (ジョブの順序は保たれる)
+    """
+    groups = {}
+    for index, (src, dest) in enumerate(jobs):
+        groups.setdefault(device_key(src, dest), []).append((index, src, dest))
+    return groups
+
+
+def feed_per_device(groups: dict, concurrency: ConcurrencyController, feed):
+    """
+    デバイスの組ごとに専用のスレッドで feed(limit, entries) を実行する
+
+    デバイスごとに独立したキューと同時コピー数の枠を持つため、異なるディスク上の
+    コピー元は互いに待たされることなく並行してコピーされ、1台のディスクへの
+    コピーはそのディスクの上限を超えない。
+
+    Parameters:
+    groups (dict): group_by_device の戻り値
+    concurrency (ConcurrencyController): 同時コピー数の制御
+    feed (Callable): (DeviceLimit, エントリのリスト) を受け取り、枠を確保しながら
+        タスクを投入する関数
+    """
+    errors = []
+
+    def run(key, entries):
+        try:
+            feed(concurrency.limit_for(key), entries)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=run, args=item, daemon=True) for item in groups.items()
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,262 @@
+import json
+import os
+import sys
+import threading
+
+from .manifest import DEFAULT_ALGORITHM, new_hasher
+
+# 部分ハッシュで読むファイル先頭の大きさ
+_PARTIAL_SIZE = 64 * 1024
+
+_READ_SIZE = 8 * 1024 * 1024
+
+# 重複を探すファイルの最小サイズ (これより小さいファイルはハッシュを計算するより
+# コピーした方が速い)
+DEFAULT_MIN_SIZE = 128 * 1024
+
+
+def default_cache_path() -> str:
+    """ユーザーごとのキャッシュディレクトリに置くハッシュキャッシュのパス"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "copyman", "hash-cache.jsonl")
+
+
+# ハッシュキャッシュに保持する最大のレコード数 (超えた分は古いものから捨てる)
+MAX_CACHE_ENTRIES = 200_000
+
+
+def _cache_key(st: os.stat_result) -> tuple:
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class HashCache:
+    def __init__(
+        self,
+        path: str = None,
+        algorithm: str = DEFAULT_ALGORITHM,
+        max_entries: int = MAX_CACHE_ENTRIES,
+    ):
+        """
+        ファイルの部分ハッシュと全体ハッシュを実行をまたいで再利用するキャッシュ
+
+        (デバイス, inode, 更新日時, サイズ) をキーにするため、内容が変わった
+        ファイルや別のファイルに同じ値が使われることはない。同じファイル
+        (デバイス, inode) については最新の更新日時・サイズの値だけを保持する。
+        1行1レコードの JSON Lines 形式で追記し、1行目にアルゴリズムを記録する。
+        アルゴリズムが異なるキャッシュは破棄する。
+
+        読み込んだファイルに古い値や書き込み途中の行が含まれている場合、または
+        max_entries を超えている場合は、最新の値だけを (古いものから捨てて) 書き
+        直してから追記を始めるため、ファイルは実行を重ねても大きくなり続けない。
+
+        Parameters:
+        path (str): キャッシュファイルのパス (None の場合はメモリ上だけで保持する)
+        algorithm (str): ハッシュアルゴリズム
+        max_entries (int): 保持する最大のレコード数
+        """
+        self.path = path
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (デバイス, inode, 種類) → (更新日時, サイズ, ハッシュ値)。挿入順が古い順
+        self._digests = {}
+        self._file = None
+        if path is None:
+            return
+        records = self._load()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if records is None or records > len(self._digests):
+            self._rewrite()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        """
+        既存のキャッシュを読み込む
+
+        Returns:
+        int: 読み込んだ行数 (アルゴリズムの行を除く)。キャッシュがないか
+            アルゴリズムが異なる場合は None
+        """
+        if not os.path.exists(self.path):
+            return None
+        records = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                records += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で終了した最終行は無視する (書き直しで消える)
+                    continue
+                if "algorithm" in record:
+                    records -= 1
+                    if record["algorithm"] != self.algorithm:
+                        self._digests.clear()
+                        return None
+                    continue
+                dev, ino, mtime_ns, size = record["key"]
+                value = (mtime_ns, size, record["digest"])
+                self._set((dev, ino, record["kind"]), value)
+        return records
+
+    def _set(self, key: tuple, value: tuple):
+        """最新の値として末尾に入れ、max_entries を超えた分を古いものから捨てる"""
+        self._digests.pop(key, None)
+        self._digests[key] = value
+        while len(self._digests) > self.max_entries:
+            del self._digests[next(iter(self._digests))]
+
+    def _rewrite(self):
+        """保持している最新の値だけでキャッシュファイルを書き直す"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"algorithm": self.algorithm}) + "\n")
+            for (dev, ino, kind), (mtime_ns, size, digest) in self._digests.items():
+                record = {
+                    "key": [dev, ino, mtime_ns, size],
+                    "kind": kind,
+                    "digest": digest,
+                }
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def get(self, st: os.stat_result, kind: str) -> str:
+        """キャッシュされたハッシュ値 (kind は "partial" または "full") を返す"""
+        with self._lock:
+            cached = self._digests.get((st.st_dev, st.st_ino, kind))
+        if cached is None or cached[:2] != (st.st_mtime_ns, st.st_size):
+            return None
+        return cached[2]
+
+    def put(self, st: os.stat_result, kind: str, digest: str):
+        """ハッシュ値をキャッシュに追加する"""
+        value = (st.st_mtime_ns, st.st_size, digest)
+        with self._lock:
+            key = (st.st_dev, st.st_ino, kind)
+            if self._digests.get(key) == value:
+                return
+            self._set(key, value)
+            if self._file is not None:
+                record = {"key": list(_cache_key(st)), "kind": kind, "digest": digest}
+                self._file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        """キャッシュを書き出して閉じる"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _Original:
+    __slots__ = ("src", "stat", "dest")
+
+    def __init__(self, src: str, st: os.stat_result, dest: str):
+        self.src = src
+        self.stat = st
+        self.dest = dest
+
+
+class DedupIndex:
+    def __init__(self, cache: HashCache = None, min_size: int = DEFAULT_MIN_SIZE):
+        """
+        1回のコピーでコピー済みのファイルを内容で引く索引
+
+        サイズ → 先頭の部分ハッシュ → 全体のハッシュの順に絞り込むため、
+        サイズが一致するファイルがなければ読み込みは発生せず、先頭が異なる
+        ファイルは全体を読まずに除外される。ハッシュ値はコピー元の stat を
+        キーに HashCache へ保存し、次回以降の実行では読み直さない。
+
+        Parameters:
+        cache (HashCache): ハッシュキャッシュ (省略時はメモリ上だけで保持する)
+        min_size (int): 重複を探すファイルの最小サイズ (バイト)
+        """
+        self.cache = cache if cache is not None else HashCache()
+        self.min_size = min_size
+        self.linked_files = 0
+        self.linked_bytes = 0
+        self._lock = threading.Lock()
+        self._by_size = {}
+
+    def find(self, src: str, src_stat: os.stat_result):
+        """
+        コピー元と同じ内容のファイルが既にコピーされていれば返す
+
+        Parameters:
+        src (str): コピー元ファイルのパス
+        src_stat (os.stat_result): コピー元の lstat 結果
+
+        Returns:
+        tuple: (コピー済みのファイルのコピー先, そのコピー元の lstat 結果,
+            16進のハッシュ値)。見つからなければ None
+        """
+        if src_stat.st_size < self.min_size:
+            return None
+        with self._lock:
+            candidates = list(self._by_size.get(src_stat.st_size, ()))
+        if not candidates:
+            return None
+
+        partial = self._digest(src, src_stat, "partial")
+        full = None
+        for original in candidates:
+            try:
+                if self._digest(original.src, original.stat, "partial") != partial:
+                    continue
+                if full is None:
+                    full = self._digest(src, src_stat, "full")
+                if self._digest(original.src, original.stat, "full") == full:
+                    return original.dest, original.stat, full
+            except OSError:
+                # コピー後に削除・変更された候補は使わない
+                continue
+        return None
+
+    def register(
+        self, src: str, src_stat: os.stat_result, dest: str, digest: str = None
+    ):
+        """
+        コピーを終えたファイルを索引に追加する
+
+        Parameters:
+        src (str): コピー元ファイルのパス
+        src_stat (os.stat_result): コピー元の lstat 結果
+        dest (str): コピー先ファイルのパス
+        digest (str): コピー中に計算した全体のハッシュ値 (あればキャッシュする)
+        """
+        if src_stat.st_size < self.min_size:
+            return
+        if digest is not None:
+            self.cache.put(src_stat, "full", digest)
+        with self._lock:
+            self._by_size.setdefault(src_stat.st_size, []).append(
+                _Original(src, src_stat, dest)
+            )
+
+    def record_link(self, size: int):
+        """リンクで作成したファイルを統計に加える"""
+        with self._lock:
+            self.linked_files += 1
+            self.linked_bytes += size
+
+    def _digest(self, path: str, st: os.stat_result, kind: str) -> str:
+        """ハッシュ値をキャッシュから取得し、なければ計算してキャッシュする"""
+        digest = self.cache.get(st, kind)
+        if digest is not None:
+            return digest
+        hasher = new_hasher(self.cache.algorithm)
+        with open(path, "rb") as f:
+            if kind == "partial":
+                hasher.update(f.read(_PARTIAL_SIZE))
+            else:
+                for chunk in iter(lambda: f.read(_READ_SIZE), b""):
+                    hasher.update(chunk)
+            # ハッシュ計算中に変更されたファイルの値はキャッシュしない
+            if _cache_key(os.fstat(f.fileno())) != _cache_key(st):
+                raise OSError(f"ハッシュ計算中に変更されました: {path}")
+        digest = hasher.hexdigest()
+        self.cache.put(st, kind, digest)
+        return digest
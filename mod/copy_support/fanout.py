@@ -0,0 +1,350 @@
+import concurrent.futures
+import os
+import stat
+from typing import Callable
+
+from .cancel import CancelToken, CopyCancelled
+from .native import _CHUNK_SIZE, NativeCopy, _copy_metadata
+from .walk import walk
+
+
+def _write_all(fd: int, data: bytes):
+    """データをすべて書き込む (os.write は GIL を解放するため並列に書き込める)"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class _Target:
+    def __init__(self, dest: str):
+        """
+        1つのコピー先のファイルへの書き込み状況
+
+        Parameters:
+        dest (str): コピー先ファイルのパス
+        """
+        self.dest = dest
+        dest_dir, name = os.path.split(dest)
+        self.tmp_path = os.path.join(dest_dir, f".{name}.copyman-tmp")
+        self.fd = None
+
+    def open(self):
+        self.fd = os.open(
+            self.tmp_path,
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+            0o600,
+        )
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def discard(self):
+        """書きかけの一時ファイルを閉じて削除する"""
+        try:
+            self.close()
+        except OSError:
+            pass
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
+
+
+class FanoutCopy(NativeCopy):
+    def __init__(
+        self,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+        checksum: bool = False,
+        cancel_token: CancelToken = None,
+    ):
+        """
+        1つのコピー元を複数のコピー先へ、データを1回だけ読んでコピーするクラス
+
+        ファイルごとにコピー元をチャンク (最大 8 MiB) ずつ読み、同じバッファを
+        コピー先ごとのスレッドから並行して書き込む。書き込み中に次のチャンクを
+        読むため、読み込みと書き込みも重なる。コピー先の判定 (変更のない
+        ファイルの省略)・失敗・リトライはコピー先ごとに行い、1つのコピー先で
+        書き込みに失敗しても他のコピー先へのコピーは続ける。
+
+        属性の扱いと一時ファイルを経由した置き換えは NativeCopy と同じ。
+        データを1回だけ読むため、reflink・範囲の並列コピー・小さなファイルの
+        まとめてコピーは行わない。
+
+        Parameters:
+        progress_callback (Callable): 進行状況を報告するためのコールバック関数
+        error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        checksum (bool): サイズと更新日時ではなくチェックサムで変更を判定する
+        cancel_token (CancelToken): キャンセルを受け取るトークン
+        """
+        super().__init__(
+            progress_callback, error_callback, checksum, cancel_token=cancel_token
+        )
+
+    def copy_fanout(self, src: str, dests: list, retries: int = 3) -> list:
+        """
+        ファイルまたはディレクトリを複数のコピー先へコピーする
+
+        コピー先ごとの規則は NativeCopy.copy と同じ。失敗したコピー先だけを
+        リトライし、エラーはコピー先のパスを含むメッセージで報告する。
+
+        Parameters:
+        src (str): コピー元のパス
+        dests (list): コピー先のパスのリスト
+        retries (int): コピー失敗時の最大リトライ回数
+
+        Returns:
+        list: コピー先ごとの、コピーに成功したかどうかのリスト
+        """
+        results = [False] * len(dests)
+        pending = list(range(len(dests)))
+        attempt = 0
+        while pending and attempt < retries:
+            attempt += 1
+            try:
+                errors = self._run_fanout(src, [dests[i] for i in pending])
+            except CopyCancelled:
+                # 書きかけの一時ファイルは削除済み。リトライもエラー報告もしない
+                return results
+
+            failed = []
+            for index, dest_errors in zip(pending, errors):
+                if not dest_errors:
+                    results[index] = True
+                    continue
+                failed.append(index)
+                if self.error_callback:
+                    message = "\n".join(f"{path}: {e}" for path, e in dest_errors)
+                    self.error_callback(src, attempt, retries, message)
+            pending = failed
+
+            if pending and self.error_callback:
+                if attempt < retries:
+                    self.error_callback(src, attempt, retries, "リトライ中...")
+                else:
+                    self.error_callback(src, attempt, retries, "コピーに失敗しました。")
+
+        if not pending and self.progress_callback:
+            self.progress_callback(1, 1, 100, 100)
+        return results
+
+    def _run_fanout(self, src: str, dests: list) -> list:
+        """
+        1回分のコピーを実行する
+
+        Returns:
+        list: コピー先ごとの、コピーできなかったファイルと例外の組のリスト
+        """
+        errors = [[] for _ in dests]
+        # コピー先ごとに1つの書き込みスレッドを使う
+        with concurrent.futures.ThreadPoolExecutor(len(dests)) as writers:
+            if os.path.isdir(src):
+                self._fanout_tree(src, dests, errors, writers)
+                return errors
+
+            targets = []
+            for i, dest in enumerate(dests):
+                try:
+                    if os.path.isdir(dest):
+                        dest = os.path.join(dest, os.path.basename(src))
+                    else:
+                        os.makedirs(
+                            os.path.dirname(os.path.abspath(dest)), exist_ok=True
+                        )
+                except OSError as e:
+                    errors[i].append((dest, e))
+                    continue
+                targets.append((i, dest))
+            try:
+                self._fanout_entry(src, os.lstat(src), targets, errors, writers)
+            except OSError as e:
+                for i, _ in targets:
+                    errors[i].append((src, e))
+        return errors
+
+    def _fanout_tree(self, src: str, dests: list, errors: list, writers):
+        """ディレクトリツリーを walk で1回だけ走査し、すべてのコピー先へコピーする"""
+        dir_entries = []
+        # ディレクトリを作成できなかったコピー先は、その下をコピーしない
+        missing = [set() for _ in dests]
+
+        def on_walk_error(path, e):
+            for dest_errors in errors:
+                dest_errors.append((path, e))
+
+        for entry in walk(src, on_walk_error):
+            self.cancel_token.check()
+            parent = os.path.dirname(entry.rel)
+            targets = []
+            for i, dest in enumerate(dests):
+                if entry.rel and parent in missing[i]:
+                    if entry.is_dir:
+                        missing[i].add(entry.rel)
+                    continue
+                dest_path = os.path.join(dest, entry.rel) if entry.rel else dest
+                targets.append((i, dest_path))
+
+            if entry.is_dir:
+                for i, dest_path in targets:
+                    try:
+                        os.makedirs(dest_path, exist_ok=True)
+                    except OSError as e:
+                        errors[i].append((dest_path, e))
+                        missing[i].add(entry.rel)
+                        continue
+                    dir_entries.append((entry, dest_path, i))
+                continue
+            try:
+                self._fanout_entry(entry.path, entry.stat, targets, errors, writers)
+            except OSError as e:
+                # コピー元を読めない場合はすべてのコピー先で失敗とする
+                for i, _ in targets:
+                    errors[i].append((entry.path, e))
+
+        for entry, dest_path, i in reversed(dir_entries):
+            try:
+                _copy_metadata(entry.stat, entry.path, dest_path)
+            except OSError as e:
+                errors[i].append((dest_path, e))
+
+    def _fanout_entry(
+        self,
+        src: str,
+        src_stat: os.stat_result,
+        targets: list,
+        errors: list,
+        writers,
+    ):
+        """
+        1つのエントリを、変更のあるコピー先だけにコピーする
+
+        Parameters:
+        src (str): コピー元のパス
+        src_stat (os.stat_result): コピー元の lstat 結果
+        targets (list): (コピー先の番号, コピー先のパス) のリスト
+        errors (list): コピー先ごとのエラーのリスト (失敗を追加する)
+        writers (ThreadPoolExecutor): コピー先へ書き込むスレッドプール
+
+        Raises:
+        OSError: コピー元を読めない場合
+        """
+        changed = []
+        for i, dest in targets:
+            try:
+                unchanged = self._is_unchanged(src, dest, src_stat)
+            except OSError:
+                unchanged = False
+            if unchanged:
+                self._report_file(dest, src_stat)
+            else:
+                changed.append((i, dest))
+        if not changed:
+            return
+
+        if not stat.S_ISREG(src_stat.st_mode):
+            for i, dest in changed:
+                try:
+                    if stat.S_ISLNK(src_stat.st_mode):
+                        self._copy_symlink(src, dest, src_stat)
+                    else:
+                        self._copy_special(src, dest, src_stat)
+                except OSError as e:
+                    errors[i].append((dest, e))
+            return
+
+        hasher = self._new_hasher()
+        written = self._fanout_data(src, changed, errors, writers, hasher)
+        for i, target in written:
+            try:
+                _copy_metadata(src_stat, src, target.tmp_path)
+                os.replace(target.tmp_path, target.dest)
+            except OSError as e:
+                target.discard()
+                errors[i].append((target.dest, e))
+                continue
+            self._report_digest(src, target.dest, src_stat, hasher)
+            self._report_file(target.dest, src_stat)
+
+    def _fanout_data(
+        self, src: str, changed: list, errors: list, writers, hasher=None
+    ) -> list:
+        """
+        コピー元を1回だけ読み、各コピー先の一時ファイルへ並行して書き込む
+
+        チャンクの書き込みをスレッドプールに依頼している間に次のチャンクを読む。
+        書き込みに失敗したコピー先は一時ファイルを削除して以降の書き込みから外す。
+
+        Returns:
+        list: すべてのデータを書き込めた (コピー先の番号, _Target) のリスト
+
+        Raises:
+        OSError: コピー元を読めない場合 (一時ファイルは削除済み)
+        CopyCancelled: コピー中にキャンセルされた場合 (一時ファイルは削除済み)
+        """
+        live = []
+        for i, dest in changed:
+            target = _Target(dest)
+            try:
+                target.open()
+            except OSError as e:
+                errors[i].append((dest, e))
+                continue
+            live.append((i, target))
+        if not live:
+            return []
+
+        src_fd = None
+        futures = []
+        try:
+            src_fd = os.open(src, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            data = os.read(src_fd, _CHUNK_SIZE)
+            while data and live:
+                self.cancel_token.check()
+                if hasher is not None:
+                    hasher.update(data)
+                futures = [
+                    (i, target, writers.submit(_write_all, target.fd, data))
+                    for i, target in live
+                ]
+                # 書き込みを待つ間に次のチャンクを読む
+                data = os.read(src_fd, _CHUNK_SIZE)
+                live = self._collect_writes(futures, errors)
+                futures = []
+            for i, target in list(live):
+                try:
+                    target.close()
+                except OSError as e:
+                    live.remove((i, target))
+                    target.discard()
+                    errors[i].append((target.dest, e))
+        except BaseException:
+            # 書き込み中のファイルディスクリプタを閉じないよう、完了を待ってから削除する
+            concurrent.futures.wait([future for _, _, future in futures])
+            for _, target in live:
+                target.discard()
+            raise
+        finally:
+            if src_fd is not None:
+                os.close(src_fd)
+        return live
+
+    def _collect_writes(self, futures: list, errors: list) -> list:
+        """
+        チャンクの書き込みの完了を待ち、失敗したコピー先を外す
+
+        Returns:
+        list: 書き込みに成功した (コピー先の番号, _Target) のリスト
+        """
+        live = []
+        for i, target, future in futures:
+            try:
+                future.result()
+            except OSError as e:
+                target.discard()
+                errors[i].append((target.dest, e))
+                continue
+            live.append((i, target))
+        return live
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+
+# コピー先ディレクトリに作成するジャーナルファイルの名前
+JOURNAL_NAME = ".copyman_journal.jsonl"
+
+
+class CopyJournal:
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        """
+        コピーの完了状況を記録する追記型のジャーナル
+
+        1行1レコードの JSON Lines 形式で、コピー元ごとの開始・完了と
+        コピーが完了したファイルを記録する。アプリが異常終了した場合でも、
+        次回の実行で未完了のコピー元を検出し、記録済みのファイルを飛ばして
+        再開できる。
+
+        Parameters:
+        path (str): ジャーナルファイルのパス
+        flush_interval (float): ファイルへ書き出す最小間隔 (秒)
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._begun = set()
+        self._finished = set()
+        self._files = {}
+        self._load()
+        self._file = open(path, "a", encoding="utf-8")
+        self._last_flush = time.monotonic()
+
+    def _load(self):
+        """
+        既存のジャーナルを読み込む
+
+        書き込み途中で終了した最終行 (改行で終わっていない行) は切り捨て、
+        次のレコードがその行に続けて追記されないようにする。
+        """
+        if not os.path.exists(self.path):
+            return
+        complete = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                complete += len(line)
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    continue
+                event = record.get("event")
+                if event == "begin":
+                    self._begun.add((record["src"], record["dest"]))
+                elif event == "finish":
+                    self._finished.add((record["src"], record["dest"]))
+                elif event == "file":
+                    self._files[record["dest"]] = (record["size"], record["mtime_ns"])
+        if complete < os.path.getsize(self.path):
+            os.truncate(self.path, complete)
+
+    def _write(self, record: dict, force: bool = False):
+        """レコードを追記する (一定間隔ごとにまとめて書き出す)"""
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            now = time.monotonic()
+            if force or now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def begin(self, src: str, dest: str):
+        """コピー元のコピー開始を記録する"""
+        self._begun.add((src, dest))
+        self._write({"event": "begin", "src": src, "dest": dest}, force=True)
+
+    def finish(self, src: str, dest: str):
+        """コピー元のコピー完了を記録する"""
+        self._finished.add((src, dest))
+        self._write({"event": "finish", "src": src, "dest": dest}, force=True)
+
+    def is_interrupted(self, src: str, dest: str) -> bool:
+        """コピー元のコピーが開始されたまま完了していないかを判定する"""
+        return (src, dest) in self._begun and (src, dest) not in self._finished
+
+    def has_unfinished(self) -> bool:
+        """完了していないコピー元が記録されているかを判定する"""
+        return bool(self._begun - self._finished)
+
+    def record(self, dest: str, src_stat: os.stat_result):
+        """
+        ファイルのコピー完了を記録する
+
+        Parameters:
+        dest (str): コピー先ファイルのパス
+        src_stat (os.stat_result): コピー元ファイルの lstat 結果
+        """
+        self._files[dest] = (src_stat.st_size, src_stat.st_mtime_ns)
+        self._write(
+            {
+                "event": "file",
+                "dest": dest,
+                "size": src_stat.st_size,
+                "mtime_ns": src_stat.st_mtime_ns,
+            }
+        )
+
+    def is_recorded(self, dest: str, src_stat: os.stat_result) -> bool:
+        """
+        コピー元と同じサイズ・更新日時のファイルがコピー済みとして記録されているか
+
+        記録だけを調べる。コピー先のファイルが残っているかは呼び出し側
+        (NativeCopy._is_recorded) が確認する。
+
+        Parameters:
+        dest (str): コピー先ファイルのパス
+        src_stat (os.stat_result): コピー元ファイルの lstat 結果
+        """
+        return self._files.get(dest) == (src_stat.st_size, src_stat.st_mtime_ns)
+
+    def close(self):
+        """ジャーナルを書き出して閉じる"""
+        with self._lock:
+            self._file.close()
+
+    def discard(self):
+        """すべてのコピーが完了した後にジャーナルを閉じて削除する"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,11 +1,125 @@
+import functools
+import re
 import subprocess
 import os
+import threading
+import time
 from typing import Callable
 
+from .cancel import CancelToken
+
+# 進行状況コールバックを呼び出す最小間隔 (秒)
+_PROGRESS_INTERVAL = 0.1
+
+# --info=progress2 の出力行 (例: "  1,234,567  45%   12.34MB/s    0:00:10 (xfr#3, ...)")
+_PROGRESS2_RE = re.compile(
+    r"^\s*([\d,.]+)\s+(\d+)%\s+([\d.]+)([kMGT]?B)/s\s+(\d+):(\d{2}):(\d{2})"
+)
+_RATE_UNITS = {"B": 1, "kB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}
+
+
+def _parse_progress2(line: str):
+    """
+    rsync --info=progress2 の出力行を解析する
+
+    Parameters:
+    line (str): rsync の標準出力の1行
+
+    Returns:
+    tuple: (転送済みバイト数, 全体のバイト数, 進捗率, 転送速度 [バイト/秒], 残り秒数)。
+        進捗行でない場合は None
+    """
+    match = _PROGRESS2_RE.match(line)
+    if not match:
+        return None
+    done = int(re.sub(r"[,.]", "", match.group(1)))
+    percent = int(match.group(2))
+    rate = float(match.group(3)) * _RATE_UNITS[match.group(4)]
+    eta = int(match.group(5)) * 3600 + int(match.group(6)) * 60 + int(match.group(7))
+    total = done * 100 // percent if percent else 0
+    return done, max(total, done), percent, rate, eta
+
+
+@functools.lru_cache(maxsize=None)
+def _supports_progress2() -> bool:
+    """インストールされている rsync が --info=progress2 (3.1.0 以降) に対応しているか"""
+    try:
+        result = subprocess.run(
+            ["rsync", "--version"], capture_output=True, text=True, check=False
+        )
+    except OSError:
+        return False
+    match = re.search(r"version\s+(\d+)\.(\d+)", result.stdout)
+    return bool(match) and (int(match.group(1)), int(match.group(2))) >= (3, 1)
+
+
+def _accepts_transfer_stats(callback: Callable) -> bool:
+    """コールバックが rate/eta キーワード引数を受け取れるかを判定する"""
+    if callback is None:
+        return False
+    import inspect
+
+    try:
+        parameters = inspect.signature(callback).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    names = {p.name for p in parameters}
+    has_kwargs = any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters)
+    return has_kwargs or {"rate", "eta"} <= names
+
+
+def _supports_sparse() -> bool:
+    """
+    rsync の --sparse を使えるか
+
+    openrsync (macOS) などの互換実装が対応しているとは限らないため、samba の
+    rsync 3.1 以降に限る (openrsync は互換バージョンとして 2.6.9 を報告する)。
+    """
+    return _supports_progress2()
+
+
+def rsync_command(src: str, dest: str, checksum: bool = False) -> tuple:
+    """
+    rsync のコマンドラインを組み立てる
+
+    Parameters:
+    src (str): コピー元ディレクトリまたはファイル
+    dest (str): コピー先ディレクトリ
+    checksum (bool): サイズと更新日時ではなくチェックサムで変更を判定する
+
+    Returns:
+    tuple: (コマンドのリスト, progress2 の進捗行が出力されるかどうか)
+    """
+    # srcがディレクトリの場合、rsyncのために末尾にスラッシュを追加
+    if os.path.isdir(src):
+        src_path = os.path.join(src, "")  # os.path.joinで安全にスラッシュを追加
+    else:
+        src_path = src
+
+    # -a: アーカイブモード (パーミッション、シンボリックリンク、タイムスタンプなどを保持)
+    # -E: 拡張属性も含めてコピー (macOS向け)
+    command = ["rsync", "-a", "-E"]
+    if checksum:
+        # -c: サイズと更新日時ではなくチェックサムで変更を判定する
+        command.append("-c")
+    streaming = _supports_progress2()
+    if _supports_sparse():
+        # --sparse: ゼロの範囲を書き込まずに穴にする (VM イメージなどで容量と時間を節約)
+        command.append("--sparse")
+    if streaming:
+        # ファイル単位ではなく転送全体の進捗を1行ごとに出力させる
+        command += ["--info=progress2", "--outbuf=L"]
+    command += [src_path, dest]
+    return command, streaming
+
 
 class MacLinuxCopy:
     def __init__(
-        self, progress_callback: Callable = None, error_callback: Callable = None
+        self,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+        checksum: bool = False,
+        cancel_token: CancelToken = None,
     ):
         """
         macOS/Linux用のファイルコピークラス
@@ -13,9 +127,23 @@ class MacLinuxCopy:
         Parameters:
         progress_callback (Callable): 進行状況を報告するためのコールバック関数
         error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        checksum (bool): サイズと更新日時ではなくチェックサムで変更を判定する
+        cancel_token (CancelToken): キャンセルを受け取るトークン (省略時は専用に作る)
         """
         self.progress_callback = progress_callback
         self.error_callback = error_callback
+        self.checksum = checksum
+        self.cancel_token = cancel_token or CancelToken()
+        self._with_stats = _accepts_transfer_stats(progress_callback)
+
+    def _report_progress(self, done: int, total: int, percent: int, rate, eta):
+        """進行状況コールバックを呼び出す (rate/eta は受け取れる場合のみ渡す)"""
+        if not self.progress_callback:
+            return
+        if self._with_stats:
+            self.progress_callback(done, total, percent, percent, rate=rate, eta=eta)
+        else:
+            self.progress_callback(done, total, percent, percent)
 
     def _run_rsync(self, src: str, dest: str) -> int:
         """
@@ -28,24 +156,54 @@ class MacLinuxCopy:
         Returns:
         int: rsyncの終了コード
         """
-        # srcがディレクトリの場合、rsyncのために末尾にスラッシュを追加
-        if os.path.isdir(src):
-             src_path = os.path.join(src, '') # os.path.joinで安全にスラッシュを追加
-        else:
-             src_path = src
+        command, streaming = rsync_command(src, dest, self.checksum)
+
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+        )
+        # キャンセル時に rsync を終了させられるよう登録する
+        self.cancel_token.register(process)
+
+        # 標準エラーは別スレッドで読み出し、パイプが詰まらないようにする
+        stderr_chunks = []
+        stderr_reader = threading.Thread(
+            target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True
+        )
+        stderr_reader.start()
+
+        # 進捗行は \r 区切りで出力されるが、テキストモードでは1行ずつ読める
+        last_report = 0.0
+        latest = None
+        for line in process.stdout:
+            parsed = _parse_progress2(line)
+            if parsed is None:
+                continue
+            latest = parsed
+            now = time.monotonic()
+            if now - last_report >= _PROGRESS_INTERVAL:
+                last_report = now
+                self._report_progress(*parsed)
 
-        # -a: アーカイブモード (パーミッション、シンボリックリンク、タイムスタンプなどを保持)
-        # -E: 拡張属性も含めてコピー (macOS向け)
-        command = ["rsync", "-a", "-E", src_path, dest] # 変更: src -> src_path
+        returncode = process.wait()
+        self.cancel_token.unregister(process)
+        stderr_reader.join()
 
-        try:
-            result = subprocess.run(command, check=True, capture_output=True, text=True)
-            return result.returncode
-        except subprocess.CalledProcessError as e:
+        if self.cancel_token.cancelled:
+            # 終了させた rsync の出力はエラーとして報告しない
+            return returncode or 1
+        if returncode == 0 and streaming:
+            # 転送バイト数で完了を通知
+            done = latest[0] if latest else 0
+            self._report_progress(done, done, 100, latest[3] if latest else 0.0, 0)
+        elif returncode != 0:
             # エラー時の出力をエラーメッセージとして報告
             if self.error_callback:
-                self.error_callback(src, 1, 3, e.stderr)
-            return e.returncode
+                self.error_callback(src, 1, 3, "".join(stderr_chunks))
+        return returncode
 
     def copy(self, src: str, dest: str, retries: int = 3):
         """
@@ -55,20 +213,28 @@ class MacLinuxCopy:
         src (str): コピー元のパス
         dest (str): コピー先のパス
         retries (int): コピー失敗時の最大リトライ回数
+
+        Returns:
+        bool: コピーに成功した場合は True
         """
         attempt = 0
         while attempt < retries:
+            if self.cancel_token.cancelled:
+                return False
             attempt += 1
             result_code = self._run_rsync(src, dest)
+            if self.cancel_token.cancelled:
+                return False
 
             # rsyncの終了コード 0 は成功
             if result_code == 0:
-                if self.progress_callback:
+                # progress2 に対応している場合は _run_rsync 内で完了を通知済み
+                if self.progress_callback and not _supports_progress2():
                     # 成功を通知
                     self.progress_callback(
                         1, 1, 100, 100
                     )  # 1つのファイルコピーとして報告
-                return
+                return True
 
             # エラー発生時、再試行を行うかどうかを決定
             if attempt < retries:
@@ -77,6 +243,11 @@ class MacLinuxCopy:
             else:
                 if self.error_callback:
                     self.error_callback(src, attempt, retries, "コピーに失敗しました。")
+        return False
+
+    def cancel(self):
+        """実行中の rsync を終了させ、以降のコピーとリトライを行わない"""
+        self.cancel_token.cancel()
 
     def set_progress_callback(self, callback: Callable):
         """
@@ -86,6 +257,7 @@ class MacLinuxCopy:
         callback (Callable): 進行状況を報告するためのコールバック関数
         """
         self.progress_callback = callback
+        self._with_stats = _accepts_transfer_stats(callback)
 
     def set_error_callback(self, callback: Callable):
         """
@@ -1,17 +1,27 @@
+import concurrent.futures
 import os
-import platform
 from typing import Callable
 
-# プラットフォームによって異なるモジュールをインポート
-if platform.system() == "Windows":
-    from .win import WindowsCopy
-else:
-    from .mac_linux import MacLinuxCopy
+from .backends import (
+    choose_backend,
+    default_backend,
+    get_backend,
+)
+from .cancel import CancelToken
+from .concurrency import ConcurrencyController, feed_per_device, group_by_device
+from .fanout import FanoutCopy
+from .native import NativeCopy
+from .scheduler import CopyScheduler
 
 
 class CopyManager:
     def __init__(
-        self, progress_callback: Callable = None, error_callback: Callable = None
+        self,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+        engine: str = "auto",
+        checksum: bool = False,
+        timeout: float = None,
     ):
         """
         ファイルコピーを管理するクラス。
@@ -19,15 +29,107 @@ class CopyManager:
         Parameters:
         progress_callback (Callable): 進行状況を報告するコールバック関数
         error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        engine (str): コピーエンジン。"auto" はコピー元・コピー先の組ごとに
+            ファイルシステムの種類とファイルサイズの構成から最も速いバックエンドを
+            選ぶ (choose_backend)。その他は登録されたバックエンドの名前
+            ("native"、"rsync"、"robocopy"、"reflink" など) で、常にそれを使用する
+        checksum (bool): コピー先の既存ファイルとの比較にサイズと更新日時ではなく
+            チェックサムを使用する
+        timeout (float): copy_many で並列実行する rsync 1回あたりの制限時間
+            (秒、None で無制限)
         """
         self.progress_callback = progress_callback
         self.error_callback = error_callback
+        self.engine = engine
 
-        # プラットフォーム別のコピー実行クラスをインスタンス化
-        if platform.system() == "Windows":
-            self.copy_handler = WindowsCopy(progress_callback, error_callback)
+        if engine == "auto":
+            # 標準のツールだけを調べる。その他のバックエンドは choose_backend で
+            # 必要になったときに調べる (起動を遅くしないため)
+            self.default_backend = default_backend()
         else:
-            self.copy_handler = MacLinuxCopy(progress_callback, error_callback)
+            get_backend(engine)
+            self.default_backend = engine
+        self.checksum = checksum
+        self.timeout = timeout
+        self.file_callback = None
+        self.digest_callback = None
+        self.journal = None
+        self.stat_cache = None
+        self.dedup = None
+        self.size_index = None
+        # すべてのコピー実行クラスで共有し、cancel() で実行中のコピーを中断する
+        self.cancel_token = CancelToken()
+        self.copy_handler = self._create_handler(progress_callback, error_callback)
+        # バックエンドの名前ごとのコピー実行クラス (必要になったときに作る)
+        self._handlers = {self.default_backend: self.copy_handler}
+        # コピー元・コピー先の組ごとに選んだバックエンドの名前
+        self._backends = {}
+
+    def _create_handler(
+        self, progress_callback: Callable, error_callback: Callable, backend=None
+    ):
+        """
+        バックエンドのコピー実行クラスをインスタンス化する
+
+        Parameters:
+        progress_callback (Callable): 進行状況を報告するコールバック関数
+        error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        backend (str): バックエンドの名前 (省略時は既定のバックエンド)
+        """
+        factory = get_backend(backend or self.default_backend).factory
+        return factory(
+            progress_callback,
+            error_callback,
+            self.checksum,
+            cancel_token=self.cancel_token,
+        )
+
+    def _handler(self, backend: str):
+        """バックエンドの共有のコピー実行クラスを返す (初回は作成して設定を適用する)"""
+        handler = self._handlers.get(backend)
+        if handler is None:
+            handler = self._create_handler(
+                self.progress_callback, self.error_callback, backend
+            )
+            self._configure(handler)
+            self._handlers[backend] = handler
+        return handler
+
+    def _configure(self, handler):
+        """native のコピー実行クラスに、設定済みのジャーナルやコールバックを適用する"""
+        if not isinstance(handler, NativeCopy):
+            return
+        handler.set_journal(self.journal)
+        handler.set_file_callback(self.file_callback)
+        handler.set_stat_cache(self.stat_cache)
+        handler.set_dedup(self.dedup)
+        handler.set_digest_callback(self.digest_callback)
+
+    def _configure_all(self):
+        for handler in self._handlers.values():
+            self._configure(handler)
+
+    def backend_for(self, src: str, dest: str) -> str:
+        """
+        コピー元・コピー先の組に使うバックエンドの名前を返す
+
+        engine が "auto" の場合は choose_backend で選ぶ。set_size_index で
+        コピー元のサイズを設定していれば、ファイルサイズの構成も考慮する。
+        コピー先が既にある場合 (同期・中断からの再開) とメタデータキャッシュの
+        使用時は、ジャーナルとキャッシュに従わない reflink/tar を選ばない。
+        """
+        if self.engine != "auto":
+            return self.engine
+        backend = self._backends.get((src, dest))
+        if backend is None:
+            tree = self.size_index[src] if self.size_index is not None else None
+            # 既存のコピー先 (同期・中断からの再開) やメタデータキャッシュの使用時は、
+            # 変更分だけをコピーするバックエンドから選ぶ
+            incremental = self.stat_cache is not None or os.path.exists(dest)
+            backend = choose_backend(src, dest, tree, incremental=incremental)
+            # コピー後にコピー先ができても同じバックエンドを返すよう記録する
+            self._backends[(src, dest)] = backend
+        return backend
 
     def copy(self, src: str, dest: str):
         """
@@ -36,11 +138,204 @@ class CopyManager:
         Parameters:
         src (str): コピー元のパス
         dest (str): コピー先のパス
+
+        Returns:
+        bool: コピーに成功した場合は True
         """
         if not os.path.exists(src):
             raise FileNotFoundError(f"コピー元のパスが見つかりません: {src}")
 
-        self.copy_handler.copy(src, dest)
+        return self._handler(self.backend_for(src, dest)).copy(src, dest)
+
+    def copy_fanout(self, src: str, dests: list) -> list:
+        """
+        1つのコピー元を複数のコピー先へ、データを1回だけ読んでコピーする
+
+        エンジンの設定に関係なく FanoutCopy を使用する (外部コマンドでは
+        読み込みを共有できないため)。コピー先ごとに成否を判定し、失敗した
+        コピー先だけをリトライする。
+
+        Parameters:
+        src (str): コピー元のパス
+        dests (list): コピー先のパスのリスト
+
+        Returns:
+        list: コピー先ごとの、コピーに成功したかどうかのリスト
+        """
+        if not os.path.exists(src):
+            raise FileNotFoundError(f"コピー元のパスが見つかりません: {src}")
+
+        handler = FanoutCopy(
+            self.progress_callback,
+            self.error_callback,
+            self.checksum,
+            cancel_token=self.cancel_token,
+        )
+        handler.set_file_callback(self.file_callback)
+        handler.set_digest_callback(self.digest_callback)
+        return handler.copy_fanout(src, dests)
+
+    def copy_many(
+        self,
+        jobs: list,
+        max_workers: int = None,
+        job_progress_callback: Callable = None,
+        concurrency: ConcurrencyController = None,
+    ):
+        """
+        複数のコピーを並列に実行する
+
+        ジョブはコピー元・コピー先の組ごとに選んだバックエンド (backend_for)
+        ごとにまとめて実行する。native ではすべてのツリーをファイル単位の
+        タスクに分割し、共有のワーカープールでコピーする。その他のバックエンドでは
+        コピー元ごとに外部コマンドを並列実行する。いずれもジョブはコピー元・コピー先の
+        デバイスの組ごとのキューに分けられ、同時コピー数はデバイスの組ごとに
+        concurrency で制限される。rsync は1つのイベントループ上で子プロセスとして
+        実行し (AsyncRsyncRunner)、コピーごとにスレッドを使わない。
+
+        Parameters:
+        jobs (list): (コピー元, コピー先) の組のリスト
+        max_workers (int): 並列実行数の上限 (concurrency 省略時のみ使用。
+            省略時は DEFAULT_MAX_WORKERS)
+        job_progress_callback (Callable): 外部コマンドによるコピーの進行状況を
+            コピー元ごとに受け取るコールバック関数。先頭の引数にコピー元のパスが
+            渡され、以降は progress_callback と同じ引数が渡される
+        concurrency (ConcurrencyController): 同時コピー数の制御。省略時は
+            max_workers を上限として自動調整する
+
+        Returns:
+        list: ジョブごとの、コピーに成功したかどうかのリスト
+        """
+        for src, _ in jobs:
+            if not os.path.exists(src):
+                raise FileNotFoundError(f"コピー元のパスが見つかりません: {src}")
+        if concurrency is None:
+            concurrency = ConcurrencyController(max_workers)
+
+        # バックエンドごとにまとめ、順に実行する
+        groups = {}
+        for index, (src, dest) in enumerate(jobs):
+            groups.setdefault(self.backend_for(src, dest), []).append(index)
+        results = [False] * len(jobs)
+        for backend, indexes in groups.items():
+            if self.cancel_token.cancelled:
+                break
+            group_results = self._copy_group(
+                backend,
+                [jobs[i] for i in indexes],
+                concurrency,
+                job_progress_callback,
+            )
+            for index, result in zip(indexes, group_results):
+                results[index] = result
+        return results
+
+    def _copy_group(
+        self,
+        backend: str,
+        jobs: list,
+        concurrency: ConcurrencyController,
+        job_progress_callback: Callable,
+    ) -> list:
+        """同じバックエンドでコピーするジョブを並列に実行する"""
+        handler = self._handler(backend)
+        if isinstance(handler, NativeCopy):
+            scheduler = CopyScheduler(
+                handler,
+                concurrency.max_workers,
+                progress_callback=self.progress_callback,
+                error_callback=self.error_callback,
+                concurrency=concurrency,
+            )
+            return [not errors for errors in scheduler.run(jobs)]
+
+        if backend == "rsync":
+            # asyncio の読み込みは遅いため、rsync を並列実行する場合だけ読み込む
+            from .async_rsync import AsyncRsyncRunner
+
+            runner = AsyncRsyncRunner(
+                self.error_callback,
+                self.checksum,
+                self.timeout,
+                cancel_token=self.cancel_token,
+            )
+            return runner.run(
+                jobs,
+                concurrency,
+                lambda src, limit: self._job_progress(
+                    src, limit, job_progress_callback
+                ),
+            )
+
+        groups = group_by_device(jobs)
+        futures = [None] * len(jobs)
+
+        def feed(limit, entries):
+            for index, src, dest in entries:
+                if self.cancel_token.cancelled:
+                    return
+                # 進捗をコピー元ごとに区別し、転送量を測定できるよう
+                # ジョブごとに実行クラスを作る
+                handler = self._create_handler(
+                    self._job_progress(src, limit, job_progress_callback),
+                    self.error_callback,
+                    backend,
+                )
+                limit.acquire()
+                future = executor.submit(handler.copy, src, dest)
+                future.add_done_callback(lambda f: limit.release())
+                futures[index] = future
+
+        # デバイスの組ごとのキューから、それぞれの上限までジョブを同時に実行する
+        workers = concurrency.max_workers * max(len(groups), 1)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            try:
+                feed_per_device(groups, concurrency, feed)
+            except BaseException:
+                # Ctrl+C などで待機が中断された場合も、実行中のコピーを中断して
+                # 終わるまで待ってから戻る
+                self.cancel_token.cancel()
+                executor.shutdown(cancel_futures=True)
+                raise
+            if self.cancel_token.cancelled:
+                # 実行待ちのジョブは破棄する (実行中の外部コマンドは終了させ済み)
+                executor.shutdown(cancel_futures=True)
+        return [
+            future is not None and not future.cancelled() and future.result()
+            for future in futures
+        ]
+
+    def _job_progress(self, src: str, limit, job_progress_callback: Callable):
+        """
+        外部コマンド1つ分の進捗を受け取り、転送量を記録して転送するコールバックを作る
+        """
+        last = [0]
+
+        def callback(
+            current, total, current_percent, total_percent, rate=None, eta=None
+        ):
+            if rate is not None:
+                # rsync の progress2 はバイト単位の累計を報告する
+                limit.record(max(current - last[0], 0))
+                last[0] = current
+            if job_progress_callback is not None:
+                job_progress_callback(
+                    src, current, total, current_percent, total_percent, rate, eta
+                )
+            elif self.progress_callback:
+                self.progress_callback(current, total, current_percent, total_percent)
+
+        return callback
+
+    def cancel(self):
+        """
+        実行中のコピーを中断する
+
+        外部コマンド (rsync/robocopy) は終了させ、native エンジンのコピーは
+        チャンクの区切りで中断する。実行待ちのジョブは実行されず、
+        中断されたコピーは失敗として返される。
+        """
+        self.cancel_token.cancel()
 
     def set_progress_callback(self, callback: Callable):
         """
@@ -50,7 +345,102 @@ class CopyManager:
         callback (Callable): 進行状況を報告するためのコールバック関数
         """
         self.progress_callback = callback
-        self.copy_handler.set_progress_callback(callback)
+        for handler in self._handlers.values():
+            handler.set_progress_callback(callback)
+
+    def set_journal(self, journal):
+        """
+        コピーの完了状況を記録するジャーナルを設定する
+
+        native エンジンではコピーしたファイルを記録し、再開時に飛ばす。
+        rsync/robocopy は再実行時に変更のないファイルを自身で飛ばすため、
+        ファイル単位の記録は行わない。
+
+        Parameters:
+        journal (CopyJournal): ジャーナル (None で無効化)
+        """
+        self.journal = journal
+        self._configure_all()
+
+    def set_file_callback(self, callback: Callable):
+        """
+        native エンジンでファイル1つの処理が終わるごとに呼び出されるコールバックを設定する
+
+        copy_fanout ではコピー先ごとに、コピー元ではなくコピー先のファイルの
+        パスが渡される。
+
+        Parameters:
+        callback (Callable): (コピー元ファイルのパス, ファイルサイズ) を受け取る関数
+        """
+        self.file_callback = callback
+        self._configure_all()
+
+    def set_dedup(self, dedup) -> bool:
+        """
+        native エンジンで同じ内容のファイルをリンクで作成するための索引を設定する
+
+        Parameters:
+        dedup (DedupIndex): 重複ファイルの索引
+
+        Returns:
+        bool: 既定のバックエンドが重複ファイルのリンクに対応している場合は True
+        """
+        self.dedup = dedup
+        self._configure_all()
+        return isinstance(self.copy_handler, NativeCopy)
+
+    def set_stat_cache(self, stat_cache) -> bool:
+        """
+        native エンジンで前回コピーしたファイルの比較を省略するためのキャッシュを設定する
+
+        Parameters:
+        stat_cache (StatCache): メタデータキャッシュ
+
+        Returns:
+        bool: 既定のバックエンドがメタデータキャッシュに対応している場合は True
+        """
+        self.stat_cache = stat_cache
+        self._configure_all()
+        return isinstance(self.copy_handler, NativeCopy)
+
+    def set_digest_callback(self, callback: Callable) -> bool:
+        """
+        native エンジンでコピーしながら計算したハッシュ値を受け取るコールバックを設定する
+
+        Parameters:
+        callback (Callable): (コピー元のパス, コピー先のパス, lstat 結果, ハッシュ値)
+            を受け取る関数
+
+        Returns:
+        bool: 既定のバックエンドがコピー中のハッシュ計算に対応している場合は True。
+            engine が "auto" の場合、コピー元・コピー先の組ごとの対応は
+            streams_digests で確認する
+        """
+        self.digest_callback = callback
+        self._configure_all()
+        return isinstance(self.copy_handler, NativeCopy)
+
+    def streams_digests(self, src: str, dest: str) -> bool:
+        """
+        コピー元・コピー先の組のコピー中にハッシュ値が digest_callback に渡されるか
+
+        Parameters:
+        src (str): コピー元のパス
+        dest (str): コピー先のパス
+        """
+        return self.digest_callback is not None and isinstance(
+            self._handler(self.backend_for(src, dest)), NativeCopy
+        )
+
+    def set_size_index(self, size_index):
+        """
+        engine が "auto" のとき、バックエンドの選択に使うコピー元のサイズを設定する
+
+        Parameters:
+        size_index (SizeIndex): コピー元ごとのファイル数と合計サイズ
+        """
+        self.size_index = size_index
+        self._backends.clear()
 
     def set_error_callback(self, callback: Callable):
         """
@@ -60,4 +450,5 @@ class CopyManager:
         callback (Callable): エラーを報告するためのコールバック関数
         """
         self.error_callback = callback
-        self.copy_handler.set_error_callback(callback)
+        for handler in self._handlers.values():
+            handler.set_error_callback(callback)
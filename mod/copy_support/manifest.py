@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import stat
+import threading
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+from .walk import walk
+
+# xxhash がインストールされていれば高速な XXH3 を、なければ標準の BLAKE2b を使う
+DEFAULT_ALGORITHM = "xxh3_128" if xxhash is not None else "blake2b"
+
+_READ_SIZE = 8 * 1024 * 1024
+
+
+def new_hasher(algorithm: str = DEFAULT_ALGORITHM):
+    """
+    ハッシュ計算用のオブジェクトを作成する
+
+    Raises:
+    ValueError: 指定されたアルゴリズムがこの環境で使えない場合
+    """
+    if algorithm == "xxh3_128" and xxhash is not None:
+        return xxhash.xxh3_128()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    raise ValueError(f"使用できないハッシュアルゴリズムです: {algorithm}")
+
+
+def file_hexdigest(path: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    """ファイル内容のハッシュ値を16進文字列で返す"""
+    hasher = new_hasher(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_READ_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def manifest_path(dest: str) -> str:
+    """コピー先の隣に置くマニフェストファイルのパス"""
+    dest = os.path.abspath(dest)
+    return os.path.join(
+        os.path.dirname(dest), f".{os.path.basename(dest)}.copyman-manifest.jsonl"
+    )
+
+
+class Manifest:
+    def __init__(self, path: str, algorithm: str = DEFAULT_ALGORITHM):
+        """
+        コピー先のファイルごとのサイズ・更新日時・ハッシュ値の一覧
+
+        1行目にアルゴリズム、2行目以降に1ファイル1行の JSON Lines 形式で保存する。
+        既存のマニフェストがあれば読み込み、そのアルゴリズムを引き継ぐ。
+
+        Parameters:
+        path (str): マニフェストファイルのパス
+        algorithm (str): 新規作成時のハッシュアルゴリズム
+        """
+        self.path = path
+        self.algorithm = algorithm
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "algorithm" in record:
+                    self.algorithm = record["algorithm"]
+                else:
+                    self.entries[record["path"]] = (
+                        record["size"],
+                        record["mtime_ns"],
+                        record["digest"],
+                    )
+
+    def add(self, rel: str, size: int, mtime_ns: int, digest: str):
+        """コピーしたファイルのハッシュ値を記録する (任意のスレッドから呼べる)"""
+        with self._lock:
+            self.entries[rel] = (size, mtime_ns, digest)
+
+    def save(self):
+        """マニフェストを一時ファイルに書き出してから置き換える"""
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"algorithm": self.algorithm}) + "\n")
+                for rel, (size, mtime_ns, digest) in sorted(self.entries.items()):
+                    record = {
+                        "path": rel,
+                        "size": size,
+                        "mtime_ns": mtime_ns,
+                        "digest": digest,
+                    }
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def verify(self, dest: str) -> list:
+        """
+        コピー先のファイルをマニフェストと照合する
+
+        コピー元は読まず、コピー先だけを読んでハッシュ値を比較する。
+
+        Parameters:
+        dest (str): コピー先のパス
+
+        Returns:
+        list: 一致しなかったファイルの (相対パス, 理由) のリスト。理由は
+            "missing" / "size" / "checksum" のいずれか
+        """
+        failures = []
+        for rel, (size, _, digest) in sorted(self.entries.items()):
+            path = os.path.join(dest, rel) if rel else dest
+            try:
+                if os.path.getsize(path) != size:
+                    failures.append((rel, "size"))
+                elif file_hexdigest(path, self.algorithm) != digest:
+                    failures.append((rel, "checksum"))
+            except OSError:
+                failures.append((rel, "missing"))
+        return failures
+
+    def add_tree(self, dest: str):
+        """
+        コピー先のファイルを読んでハッシュ値を記録する
+
+        データの流れに割り込めない外部コマンド (rsync/robocopy) でコピーした
+        場合に、コピー直後のコピー先から作成するために使う。
+        """
+        for entry in walk(dest):
+            if entry.is_dir or not stat.S_ISREG(entry.stat.st_mode):
+                continue
+            self.add(
+                entry.rel,
+                entry.stat.st_size,
+                entry.stat.st_mtime_ns,
+                file_hexdigest(entry.path, self.algorithm),
+            )
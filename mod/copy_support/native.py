@@ -0,0 +1,1094 @@
+import errno
+import hashlib
+import os
+import stat
+import sys
+from typing import Callable
+
+from .cancel import CancelToken, CopyCancelled
+from .manifest import new_hasher
+from .walk import walk
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 1回のシステムコールで転送する最大バイト数
+_CHUNK_SIZE = 8 * 1024 * 1024
+
+# この大きさ以上のファイルは範囲に分割して並列にコピーする
+LARGE_FILE_THRESHOLD = 256 * 1024 * 1024
+
+# 並列コピーで1つのワーカーが受け持つ範囲の大きさ
+_RANGE_SIZE = 64 * 1024 * 1024
+
+# この大きさ未満のファイルはディレクトリ単位でまとめてコピーする
+SMALL_FILE_THRESHOLD = 128 * 1024
+
+# まとめてコピーする最小・最大のファイル数
+_MIN_BATCH_FILES = 4
+_BATCH_FILES = 64
+
+# ディレクトリのファイルディスクリプタを基準にした open/chmod/utime が使えるか
+_HAVE_DIR_FD = (
+    hasattr(os, "O_DIRECTORY")
+    and {os.open, os.chmod, os.utime, os.unlink} <= os.supports_dir_fd
+)
+
+# lseek の SEEK_DATA/SEEK_HOLE でファイルの穴を調べられるか (Linux、macOS など)
+_HAVE_SEEK_HOLE = hasattr(os, "SEEK_DATA") and hasattr(os, "SEEK_HOLE")
+
+# Linux の FICLONE ioctl (_IOW(0x94, 9, int))。btrfs/XFS などで reflink を作成する
+_FICLONE = 0x40049409
+
+# カーネル内コピーが使えない場合に返されるエラー番号 (次の方法にフォールバックする)
+_FALLBACK_ERRNOS = {
+    getattr(errno, name)
+    for name in ("EXDEV", "ENOSYS", "EINVAL", "EOPNOTSUPP", "ENOTSUP", "ENOTSOCK")
+    if hasattr(errno, name)
+}
+
+
+def _copy_file_data(
+    src_fd: int, dst_fd: int, hasher=None, cancel: CancelToken = None
+) -> int:
+    """
+    ファイルディスクリプタ間でデータをコピーする
+
+    copy_file_range → sendfile → read/write の順に利用可能な方法を試す。
+    いずれもファイル位置を進めながら転送するため、途中で方法が切り替わっても
+    続きからコピーされる。hasher を指定した場合は、データを1回読むだけで
+    ハッシュ値も計算できるよう read/write でコピーする。
+
+    Parameters:
+    src_fd (int): コピー元のファイルディスクリプタ
+    dst_fd (int): コピー先のファイルディスクリプタ
+    hasher: コピーしたデータで update するハッシュオブジェクト
+    cancel (CancelToken): チャンクごとに確認するキャンセルのトークン
+
+    Returns:
+    int: コピーしたバイト数
+
+    Raises:
+    CopyCancelled: コピー中にキャンセルされた場合
+    """
+    copied = 0
+
+    if hasattr(os, "copy_file_range") and hasher is None:
+        try:
+            while True:
+                if cancel is not None:
+                    cancel.check()
+                n = os.copy_file_range(src_fd, dst_fd, _CHUNK_SIZE)
+                if n == 0:
+                    return copied
+                copied += n
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+
+    # macOS の sendfile は出力先がソケットに限られるため Linux のみで使用する
+    linux = sys.platform.startswith("linux")
+    if hasattr(os, "sendfile") and linux and hasher is None:
+        try:
+            while True:
+                if cancel is not None:
+                    cancel.check()
+                n = os.sendfile(dst_fd, src_fd, None, _CHUNK_SIZE)
+                if n == 0:
+                    return copied
+                copied += n
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+
+    while True:
+        if cancel is not None:
+            cancel.check()
+        data = os.read(src_fd, _CHUNK_SIZE)
+        if not data:
+            return copied
+        if hasher is not None:
+            hasher.update(data)
+        view = memoryview(data)
+        while view:
+            written = os.write(dst_fd, view)
+            view = view[written:]
+        copied += len(data)
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    """
+    FICLONE でコピー先をコピー元の reflink にする (データブロックを共有する)
+
+    Returns:
+    bool: reflink を作成できた場合は True。ファイルシステムが対応していない場合や
+        別のボリュームの場合は False
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in _FALLBACK_ERRNOS or e.errno in (errno.ENOTTY, errno.EBADF):
+            return False
+        raise
+    return True
+
+
+def _clone_file(src: str, dest: str) -> bool:
+    """
+    dest を src の reflink として新規に作成する
+
+    Returns:
+    bool: 作成できた場合は True (できなかった場合は dest を残さない)
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        src_fd = os.open(src, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        dst_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            cloned = _reflink(src_fd, dst_fd)
+        finally:
+            os.close(dst_fd)
+    except OSError:
+        cloned = False
+    finally:
+        os.close(src_fd)
+    if not cloned:
+        try:
+            os.unlink(dest)
+        except OSError:
+            pass
+    return cloned
+
+
+def _same_metadata(a: os.stat_result, b: os.stat_result) -> bool:
+    """ハードリンクで共有しても問題ない属性 (パーミッション・所有者・更新日時) か"""
+    return (
+        a.st_mode == b.st_mode
+        and a.st_uid == b.st_uid
+        and a.st_gid == b.st_gid
+        and a.st_mtime_ns == b.st_mtime_ns
+    )
+
+
+def _dest_matches(dest: str, src_stat: os.stat_result) -> bool:
+    """
+    記録済みのコピー先が残っていて、コピー元と同じサイズ・更新日時かを lstat 1回で確認する
+
+    コピー先のファイルが削除・切り詰められた場合に、記録を信用して飛ばさないようにする。
+    """
+    try:
+        dest_stat = os.lstat(dest)
+    except OSError:
+        return False
+    if stat.S_IFMT(dest_stat.st_mode) != stat.S_IFMT(src_stat.st_mode):
+        return False
+    if not stat.S_ISREG(src_stat.st_mode):
+        return True
+    return dest_stat.st_size == src_stat.st_size and int(dest_stat.st_mtime) == int(
+        src_stat.st_mtime
+    )
+
+
+def _copy_range(
+    src_fd: int,
+    dst_fd: int,
+    offset: int,
+    length: int,
+    cancel: CancelToken = None,
+    hasher=None,
+) -> int:
+    """
+    ファイルの指定範囲を同じ位置にコピーする
+
+    ファイル位置を使わない copy_file_range (オフセット指定) または pread/pwrite を
+    使うため、複数のスレッドから同じファイルディスクリプタに対して同時に呼び出せる。
+    hasher を指定した場合は pread/pwrite でコピーし、読んだデータで update する。
+
+    Returns:
+    int: コピーしたバイト数
+    """
+    end = offset + length
+    position = offset
+
+    if hasattr(os, "copy_file_range") and hasher is None:
+        try:
+            while position < end:
+                if cancel is not None:
+                    cancel.check()
+                n = os.copy_file_range(
+                    src_fd, dst_fd, min(_CHUNK_SIZE, end - position), position, position
+                )
+                if n == 0:
+                    return position - offset
+                position += n
+            return length
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+
+    while position < end:
+        if cancel is not None:
+            cancel.check()
+        data = os.pread(src_fd, min(_CHUNK_SIZE, end - position), position)
+        if not data:
+            break
+        if hasher is not None:
+            hasher.update(data)
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(dst_fd, view, position)
+            view = view[written:]
+            position += written
+    return position - offset
+
+
+def _copy_file_ranges(
+    src_fd: int, dst_fd: int, size: int, workers: int, cancel: CancelToken = None
+) -> int:
+    """
+    大きなファイルを範囲に分割し、複数のスレッドで並列にコピーする
+
+    Parameters:
+    src_fd (int): コピー元のファイルディスクリプタ
+    dst_fd (int): コピー先のファイルディスクリプタ
+    size (int): コピー元のファイルサイズ
+    workers (int): 並列数
+    cancel (CancelToken): 各範囲のチャンクごとに確認するキャンセルのトークン
+
+    Returns:
+    int: コピーしたバイト数
+    """
+    # 先にファイルサイズを確定させ、各範囲の書き込みでファイルが伸びないようにする
+    os.ftruncate(dst_fd, size)
+    ranges = [
+        (offset, min(_RANGE_SIZE, size - offset))
+        for offset in range(0, size, _RANGE_SIZE)
+    ]
+    # CLI の起動を遅くしないよう、大きなファイルを並列コピーするときだけ読み込む
+    import concurrent.futures
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        copied = sum(
+            executor.map(lambda r: _copy_range(src_fd, dst_fd, *r, cancel), ranges)
+        )
+    if copied < size:
+        # コピー中にコピー元が縮んだ場合は実際にコピーした長さに揃える
+        os.ftruncate(dst_fd, copied)
+    return copied
+
+
+def _is_sparse(src_stat: os.stat_result) -> bool:
+    """割り当てられたブロックがファイルサイズより少ない (穴がある) ファイルか"""
+    blocks = getattr(src_stat, "st_blocks", None)
+    return _HAVE_SEEK_HOLE and blocks is not None and blocks * 512 < src_stat.st_size
+
+
+def _data_extents(fd: int, size: int):
+    """
+    SEEK_DATA/SEEK_HOLE でファイルのデータのある範囲を順に返すジェネレータ
+
+    Yields:
+    tuple: (オフセット, 長さ)
+    """
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # offset 以降にデータがない (末尾まで穴)
+                return
+            raise
+        if start >= size:
+            return
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        yield start, end - start
+        offset = end
+
+
+def _hash_zeros(hasher, length: int):
+    """穴の範囲をゼロとしてハッシュ値に含める"""
+    zeros = memoryview(bytes(min(length, _CHUNK_SIZE)))
+    while length > 0:
+        n = min(length, len(zeros))
+        hasher.update(zeros[:n])
+        length -= n
+
+
+def _copy_sparse(
+    src_fd: int, dst_fd: int, size: int, hasher=None, cancel: CancelToken = None
+) -> int:
+    """
+    穴のあるファイルを、データのある範囲だけコピーする
+
+    コピー先を先に size まで伸ばし、データのある範囲だけを書き込むため、
+    コピー元の穴はコピー先でも穴 (ブロックを割り当てない) のまま残る。
+    hasher を指定した場合は、穴をゼロとして先頭から順にハッシュ値を計算する。
+
+    Parameters:
+    src_fd (int): コピー元のファイルディスクリプタ
+    dst_fd (int): コピー先のファイルディスクリプタ
+    size (int): コピー元のファイルサイズ
+    hasher: コピーしたデータで update するハッシュオブジェクト
+    cancel (CancelToken): チャンクごとに確認するキャンセルのトークン
+
+    Returns:
+    int: コピーしたバイト数 (穴を含む)
+
+    Raises:
+    OSError: ファイルシステムが SEEK_DATA に対応していない場合 (EINVAL など)
+    """
+    os.ftruncate(dst_fd, size)
+    position = 0
+    for offset, length in _data_extents(src_fd, size):
+        if hasher is not None:
+            _hash_zeros(hasher, offset - position)
+        _copy_range(src_fd, dst_fd, offset, length, cancel, hasher)
+        position = offset + length
+    if hasher is not None:
+        _hash_zeros(hasher, size - position)
+
+    current = os.fstat(src_fd).st_size
+    if current < size:
+        # コピー中にコピー元が縮んだ場合は長さを揃える
+        os.ftruncate(dst_fd, current)
+        return current
+    return size
+
+
+def _copy_small_at(src_dir_fd: int, dest_dir_fd: int, name: str, hasher=None):
+    """
+    ディレクトリのファイルディスクリプタを基準に小さなファイルを直接コピーする
+
+    コピー先は O_EXCL で新規に作成する (既に存在する場合は FileExistsError)。
+    コピー先を先に開くため、既存のファイルではコピー元を開かずに済む。
+    """
+    binary = getattr(os, "O_BINARY", 0)
+    dst_fd = os.open(
+        name,
+        os.O_WRONLY | os.O_CREAT | os.O_EXCL | binary,
+        0o600,
+        dir_fd=dest_dir_fd,
+    )
+    try:
+        src_fd = os.open(name, os.O_RDONLY | binary, dir_fd=src_dir_fd)
+        try:
+            _copy_file_data(src_fd, dst_fd, hasher)
+        finally:
+            os.close(src_fd)
+    except BaseException:
+        os.close(dst_fd)
+        # 書きかけのファイルを残さない
+        try:
+            os.unlink(name, dir_fd=dest_dir_fd)
+        except OSError:
+            pass
+        raise
+    os.close(dst_fd)
+
+
+def _file_digest(path: str) -> bytes:
+    """ファイル内容の BLAKE2b ハッシュ値を計算する"""
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _copy_xattrs(src: str, dest: str):
+    """拡張属性をコピーする (Linux のみ)"""
+    if not hasattr(os, "listxattr"):
+        return
+    try:
+        for name in os.listxattr(src, follow_symlinks=False):
+            try:
+                value = os.getxattr(src, name, follow_symlinks=False)
+                os.setxattr(dest, name, value, follow_symlinks=False)
+            except OSError as e:
+                if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.ENODATA):
+                    raise
+    except OSError as e:
+        if e.errno not in (errno.ENOTSUP, errno.ENODATA):
+            raise
+
+
+def _copy_metadata_at(
+    src_stat: os.stat_result, src: str, dest: str, dir_fd: int, name: str
+):
+    """
+    コピー先ディレクトリのファイルディスクリプタを基準に通常ファイルの属性をコピーする
+
+    パスの解決を省くため、_copy_metadata よりシステムコールのコストが小さい。
+
+    Parameters:
+    src_stat (os.stat_result): コピー元の lstat 結果
+    src (str): コピー元のパス (拡張属性の読み出しに使用)
+    dest (str): コピー先のパス (拡張属性の書き込みに使用)
+    dir_fd (int): コピー先ディレクトリのファイルディスクリプタ
+    name (str): コピー先ディレクトリ内のファイル名
+    """
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        try:
+            os.chown(name, src_stat.st_uid, src_stat.st_gid, dir_fd=dir_fd)
+        except (OSError, NotImplementedError):
+            pass
+    _copy_xattrs(src, dest)
+    os.chmod(name, stat.S_IMODE(src_stat.st_mode), dir_fd=dir_fd)
+    os.utime(name, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns), dir_fd=dir_fd)
+
+
+def _copy_metadata(src_stat: os.stat_result, src: str, dest: str):
+    """
+    rsync -a と同様にパーミッション、所有者、タイムスタンプ、拡張属性をコピーする
+
+    Parameters:
+    src_stat (os.stat_result): コピー元の lstat 結果
+    src (str): コピー元のパス (拡張属性の読み出しに使用)
+    dest (str): コピー先のパス
+    """
+    is_link = stat.S_ISLNK(src_stat.st_mode)
+
+    # 所有者の変更は root でのみ可能 (rsync -a も同様)
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        try:
+            os.chown(
+                dest, src_stat.st_uid, src_stat.st_gid, follow_symlinks=not is_link
+            )
+        except (OSError, NotImplementedError):
+            pass
+
+    _copy_xattrs(src, dest)
+
+    if is_link:
+        # シンボリックリンク自体の属性は変更できるプラットフォームでのみ設定
+        if os.chmod in os.supports_follow_symlinks:
+            try:
+                os.chmod(dest, stat.S_IMODE(src_stat.st_mode), follow_symlinks=False)
+            except (OSError, NotImplementedError):
+                pass
+        if os.utime in os.supports_follow_symlinks:
+            os.utime(
+                dest,
+                ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns),
+                follow_symlinks=False,
+            )
+        return
+
+    os.chmod(dest, stat.S_IMODE(src_stat.st_mode))
+    os.utime(dest, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+
+class NativeCopy:
+    def __init__(
+        self,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+        checksum: bool = False,
+        large_file_threshold: int = LARGE_FILE_THRESHOLD,
+        large_file_workers: int = 4,
+        small_file_threshold: int = SMALL_FILE_THRESHOLD,
+        cancel_token: CancelToken = None,
+    ):
+        """
+        外部コマンドを使わずに Python 内でコピーを行うクラス
+
+        os.scandir でディレクトリを走査し、copy_file_range / sendfile で
+        カーネル内コピーを行う。rsync -a と同様にシンボリックリンク、
+        パーミッション、タイムスタンプ、所有者 (root 実行時) を保持し、
+        コピー先に同じサイズ・更新日時のファイルがあればコピーしない。
+
+        large_file_threshold 以上のファイルは、まず FICLONE による reflink を
+        試し (btrfs/XFS の同一ボリューム内ならほぼ一瞬で終わる)、できなければ
+        範囲に分割して large_file_workers 個のスレッドで並列にコピーする。
+        穴のあるファイル (VM イメージなど) は SEEK_DATA/SEEK_HOLE でデータのある
+        範囲だけをコピーし、コピー先でも穴のまま残す。
+        small_file_threshold 未満のファイルはディレクトリ単位でまとめ、
+        ディレクトリのファイルディスクリプタを基準に開いてコピーし、
+        パーミッションと更新日時は最後にまとめて設定する (copy_batch)。
+        set_dedup で索引を設定すると、コピー済みのファイルと同じ内容の
+        ファイルはデータをコピーせず reflink またはハードリンクで作成する。
+
+        Parameters:
+        progress_callback (Callable): 進行状況を報告するためのコールバック関数
+        error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        checksum (bool): サイズと更新日時ではなくチェックサムで変更を判定する
+        large_file_threshold (int): 並列コピーするファイルの最小サイズ (バイト)
+        large_file_workers (int): 1つの大きなファイルをコピーする並列数
+        small_file_threshold (int): まとめてコピーするファイルの最大サイズ
+            (バイト、この値未満)。0 でまとめない
+        cancel_token (CancelToken): キャンセルを受け取るトークン (省略時は専用に作る)。
+            データのコピーはチャンク (最大 8 MiB) ごとにキャンセルを確認する
+        """
+        self.progress_callback = progress_callback
+        self.error_callback = error_callback
+        self.checksum = checksum
+        self.large_file_threshold = large_file_threshold
+        self.large_file_workers = large_file_workers
+        self.small_file_threshold = small_file_threshold
+        self.journal = None
+        self.file_callback = None
+        self.digest_callback = None
+        self.dedup = None
+        self.stat_cache = None
+        self.cancel_token = cancel_token or CancelToken()
+
+    def copy_entry(self, src: str, dest: str, src_stat: os.stat_result) -> int:
+        """
+        ジャーナルを参照しながら1つのエントリをコピーする
+
+        ジャーナルまたはメタデータキャッシュにコピー済みとして記録されている
+        ファイルと、コピー先に変更のないファイルが既にあるものは飛ばし、
+        コピーしたファイルはジャーナルとメタデータキャッシュに記録する。
+
+        Parameters:
+        src (str): コピー元のパス
+        dest (str): コピー先のパス
+        src_stat (os.stat_result): コピー元の lstat 結果
+
+        Returns:
+        int: コピーしたバイト数
+
+        Raises:
+        CopyCancelled: キャンセルされた場合
+        """
+        self.cancel_token.check()
+        if self._is_recorded(dest, src_stat):
+            # 記録済みのファイルは比較 (checksum 有効時はハッシュ値の計算) を飛ばす
+            copied = 0
+        elif self._is_unchanged(src, dest, src_stat):
+            copied = 0
+            if self.stat_cache is not None:
+                self.stat_cache.record(dest, src_stat)
+        else:
+            copied = self.copy_file(src, dest, src_stat)
+            if self.journal is not None:
+                self.journal.record(dest, src_stat)
+            if self.stat_cache is not None:
+                self.stat_cache.record(dest, src_stat)
+
+        if stat.S_ISREG(src_stat.st_mode):
+            # コピーを省略したファイルも処理済みのバイト数として報告する
+            self._report_file(src, src_stat)
+        return copied
+
+    def is_small_file(self, src_stat: os.stat_result) -> bool:
+        """copy_batch でまとめてコピーする小さな通常ファイルかを判定する"""
+        return (
+            stat.S_ISREG(src_stat.st_mode)
+            and src_stat.st_size < self.small_file_threshold
+        )
+
+    def copy_batch(self, src_dir: str, dest_dir: str, entries: list) -> list:
+        """
+        同じディレクトリにある小さなファイルをまとめてコピーする
+
+        コピー元・コピー先のディレクトリを1回ずつ開き、各ファイルはその
+        ファイルディスクリプタを基準に openat で開くため、ファイルごとの
+        パスの解決が不要になる。コピー先のファイルは O_EXCL で直接作成し
+        (ディレクトリの一覧は読まない)、パーミッションと更新日時はデータを
+        すべて書き込んだ後にまとめて設定する。既に存在していた (EEXIST) ファイルは
+        copy_entry で比較し、必要なら一時ファイル経由で置き換える。
+
+        新しく作成したファイルは更新日時が設定されるまでコピー元と一致しないため、
+        途中で中断された場合も次回の実行で再びコピーされる。そのため一時ファイルを
+        経由しない。
+
+        Parameters:
+        src_dir (str): コピー元ディレクトリ
+        dest_dir (str): コピー先ディレクトリ (作成済みであること)
+        entries (list): (ファイル名, lstat 結果) のリスト
+
+        Returns:
+        list: コピーできなかったファイルと例外の組のリスト
+        """
+        if not _HAVE_DIR_FD or len(entries) < _MIN_BATCH_FILES:
+            # ディレクトリを開くコストに見合わない少数のファイルは1つずつコピーする
+            return self._copy_entries(src_dir, dest_dir, entries)
+
+        errors = []
+        src_fd = os.open(src_dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            dir_fd = os.open(dest_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                written = []
+                for name, src_stat in entries:
+                    self.cancel_token.check()
+                    src = os.path.join(src_dir, name)
+                    dest = os.path.join(dest_dir, name)
+                    if self._is_recorded(dest, src_stat):
+                        self._report_file(src, src_stat)
+                        continue
+                    hasher = self._new_hasher()
+                    try:
+                        _copy_small_at(src_fd, dir_fd, name, hasher)
+                    except FileExistsError:
+                        # 既存のファイルは比較と一時ファイル経由の置き換えが必要
+                        errors.extend(
+                            self._copy_entries(src_dir, dest_dir, [(name, src_stat)])
+                        )
+                        continue
+                    except OSError as e:
+                        errors.append((src, e))
+                        continue
+                    written.append((name, src, dest, src_stat, hasher))
+
+                # データの書き込みが終わってから属性をまとめて設定する
+                for name, src, dest, src_stat, hasher in written:
+                    try:
+                        _copy_metadata_at(src_stat, src, dest, dir_fd, name)
+                    except OSError as e:
+                        errors.append((src, e))
+                        continue
+                    self._report_digest(src, dest, src_stat, hasher)
+                    if self.journal is not None:
+                        self.journal.record(dest, src_stat)
+                    if self.stat_cache is not None:
+                        self.stat_cache.record(dest, src_stat)
+                    self._report_file(src, src_stat)
+            finally:
+                os.close(dir_fd)
+        finally:
+            os.close(src_fd)
+        return errors
+
+    def _is_recorded(self, dest: str, src_stat: os.stat_result) -> bool:
+        """
+        ジャーナルまたはメタデータキャッシュにコピー済みとして記録され、
+        コピー先にそのファイルが残っているか
+        """
+        recorded = (
+            self.journal is not None and self.journal.is_recorded(dest, src_stat)
+        ) or (
+            self.stat_cache is not None and self.stat_cache.is_recorded(dest, src_stat)
+        )
+        # コピー先を直接削除・変更された場合に備え、コピー先の lstat だけは行う
+        return recorded and _dest_matches(dest, src_stat)
+
+    def _copy_entries(self, src_dir: str, dest_dir: str, entries: list) -> list:
+        """copy_batch のエントリを1つずつ copy_entry でコピーする"""
+        errors = []
+        for name, src_stat in entries:
+            src = os.path.join(src_dir, name)
+            try:
+                self.copy_entry(src, os.path.join(dest_dir, name), src_stat)
+            except OSError as e:
+                errors.append((src, e))
+        return errors
+
+    def _new_hasher(self):
+        """digest_callback が設定されていればコピー中に使うハッシュオブジェクトを作る"""
+        return new_hasher() if self.digest_callback is not None else None
+
+    def _report_digest(self, src: str, dest: str, src_stat: os.stat_result, hasher):
+        """コピー中に計算したハッシュ値を digest_callback に報告する"""
+        if hasher is not None:
+            self.digest_callback(src, dest, src_stat, hasher.hexdigest())
+
+    def _report_file(self, src: str, src_stat: os.stat_result):
+        """処理したファイルを file_callback に報告する"""
+        if self.file_callback is not None:
+            self.file_callback(src, src_stat.st_size)
+
+    def _is_unchanged(
+        self,
+        src: str,
+        dest: str,
+        src_stat: os.stat_result,
+        dest_stat: os.stat_result = None,
+    ) -> bool:
+        """
+        コピー先に変更のないファイルが既にあるかを判定する (rsync の quick check 相当)
+
+        通常はコピー先の lstat 1回だけで、サイズと更新日時 (秒単位) を比較する。
+        checksum が有効な場合はサイズが一致したファイルの内容を比較する。
+
+        Parameters:
+        src (str): コピー元のパス
+        dest (str): コピー先のパス
+        src_stat (os.stat_result): コピー元の lstat 結果
+        dest_stat (os.stat_result): コピー先の lstat 結果 (省略時は取得する)
+
+        Returns:
+        bool: コピーを省略できる場合は True
+        """
+        if dest_stat is None:
+            try:
+                dest_stat = os.lstat(dest)
+            except OSError:
+                return False
+
+        if stat.S_IFMT(dest_stat.st_mode) != stat.S_IFMT(src_stat.st_mode):
+            return False
+        if stat.S_ISLNK(src_stat.st_mode):
+            return os.readlink(src) == os.readlink(dest)
+        if not stat.S_ISREG(src_stat.st_mode):
+            return False
+        if dest_stat.st_size != src_stat.st_size:
+            return False
+        if self.checksum:
+            return _file_digest(src) == _file_digest(dest)
+        return int(dest_stat.st_mtime) == int(src_stat.st_mtime)
+
+    def copy_file(self, src: str, dest: str, src_stat: os.stat_result = None) -> int:
+        """
+        1つのファイルをコピーする
+
+        コピー中のファイルは一時ファイルに書き込み、完了後にリネームする。
+        そのため中断された場合でも不完全なファイルがコピー先に残らない。
+
+        Parameters:
+        src (str): コピー元ファイルのパス
+        dest (str): コピー先ファイルのパス
+        src_stat (os.stat_result): コピー元の lstat 結果 (省略時は取得する)
+
+        Returns:
+        int: コピーしたバイト数
+        """
+        if src_stat is None:
+            src_stat = os.lstat(src)
+
+        if stat.S_ISLNK(src_stat.st_mode):
+            self._copy_symlink(src, dest, src_stat)
+            return 0
+
+        if not stat.S_ISREG(src_stat.st_mode):
+            self._copy_special(src, dest, src_stat)
+            return 0
+
+        dest_dir, name = os.path.split(dest)
+        tmp_path = os.path.join(dest_dir, f".{name}.copyman-tmp")
+        if self.dedup is not None and self._link_duplicate(
+            src, dest, src_stat, tmp_path
+        ):
+            return 0
+
+        flags = os.O_RDONLY | getattr(os, "O_BINARY", 0)
+        copied = 0
+        hasher = self._new_hasher()
+        src_fd = os.open(src, flags)
+        try:
+            dst_fd = os.open(
+                tmp_path,
+                os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+                0o600,
+            )
+            try:
+                copied = self._copy_data(
+                    src_fd, dst_fd, src_stat.st_size, hasher, _is_sparse(src_stat)
+                )
+            finally:
+                os.close(dst_fd)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            os.close(src_fd)
+
+        _copy_metadata(src_stat, src, tmp_path)
+        os.replace(tmp_path, dest)
+        self._report_digest(src, dest, src_stat, hasher)
+        if self.dedup is not None:
+            self.dedup.register(
+                src, src_stat, dest, hasher.hexdigest() if hasher else None
+            )
+        return copied
+
+    def _link_duplicate(
+        self, src: str, dest: str, src_stat: os.stat_result, tmp_path: str
+    ) -> bool:
+        """
+        同じ内容のファイルがコピー済みなら、データをコピーせずにリンクで作成する
+
+        まず reflink (データブロックを共有する独立したファイル) を試し、
+        できなければパーミッション・所有者・更新日時がすべて同じ場合に限り
+        ハードリンクにする (ハードリンクは属性も共有するため)。
+
+        Returns:
+        bool: リンクで作成できた場合は True
+        """
+        try:
+            match = self.dedup.find(src, src_stat)
+        except OSError:
+            return False
+        if match is None:
+            return False
+        original, original_stat, digest = match
+
+        if _clone_file(original, tmp_path):
+            _copy_metadata(src_stat, src, tmp_path)
+        elif _same_metadata(src_stat, original_stat):
+            try:
+                os.link(original, tmp_path)
+            except OSError:
+                return False
+        else:
+            return False
+        os.replace(tmp_path, dest)
+        self.dedup.record_link(src_stat.st_size)
+        if self.digest_callback is not None:
+            self.digest_callback(src, dest, src_stat, digest)
+        return True
+
+    def _copy_data(
+        self, src_fd: int, dst_fd: int, size: int, hasher=None, sparse: bool = False
+    ) -> int:
+        """
+        ファイルの中身をコピーする (大きなファイルは reflink または範囲の並列コピー)
+
+        hasher を指定した場合は、データを先頭から順に読む必要があるため
+        大きなファイルも1つのストリームでコピーする。穴のあるファイル (sparse) は
+        データのある範囲だけをコピーし、穴を書き込まない。
+
+        Returns:
+        int: コピーしたバイト数
+        """
+        cancel = self.cancel_token
+        large = size >= self.large_file_threshold and hasher is None
+        if large and _reflink(src_fd, dst_fd):
+            return size
+        if sparse:
+            try:
+                return _copy_sparse(src_fd, dst_fd, size, hasher, cancel)
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+                # SEEK_DATA に対応していないファイルシステムでは通常どおりコピーする
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.ftruncate(dst_fd, 0)
+        if not large:
+            return _copy_file_data(src_fd, dst_fd, hasher, cancel)
+        if self.large_file_workers > 1 and hasattr(os, "pwrite"):
+            return _copy_file_ranges(
+                src_fd, dst_fd, size, self.large_file_workers, cancel
+            )
+        return _copy_file_data(src_fd, dst_fd, cancel=cancel)
+
+    def _copy_symlink(self, src: str, dest: str, src_stat: os.stat_result):
+        """シンボリックリンクをリンクのままコピーする (rsync -l 相当)"""
+        target = os.readlink(src)
+        if os.path.lexists(dest):
+            os.unlink(dest)
+        os.symlink(target, dest)
+        _copy_metadata(src_stat, src, dest)
+
+    def _copy_special(self, src: str, dest: str, src_stat: os.stat_result):
+        """FIFO やデバイスファイルを作成する (権限がない場合はスキップ)"""
+        if os.path.lexists(dest):
+            os.unlink(dest)
+        try:
+            if stat.S_ISFIFO(src_stat.st_mode):
+                os.mkfifo(dest, stat.S_IMODE(src_stat.st_mode))
+            elif stat.S_ISCHR(src_stat.st_mode) or stat.S_ISBLK(src_stat.st_mode):
+                os.mknod(dest, src_stat.st_mode, src_stat.st_rdev)
+            else:
+                # ソケット等はコピーしない
+                return
+        except (PermissionError, AttributeError):
+            return
+        _copy_metadata(src_stat, src, dest)
+
+    def _copy_tree(self, src: str, dest: str) -> list:
+        """
+        ディレクトリツリーをコピーする
+
+        walk でツリーを逐次走査するため、ツリー全体や大きなディレクトリの一覧を
+        メモリに展開しない。小さなファイルはディレクトリごとに copy_batch で
+        まとめてコピーし、ディレクトリの属性 (特に更新日時) は中身のコピー後に
+        深い階層から設定する。
+
+        Parameters:
+        src (str): コピー元ディレクトリ
+        dest (str): コピー先ディレクトリ
+
+        Returns:
+        list: コピーできなかったファイルと例外の組のリスト
+        """
+        errors = []
+        dir_entries = []
+        small_files = []
+        batch_dirs = None
+
+        def flush():
+            if small_files:
+                try:
+                    errors.extend(self.copy_batch(*batch_dirs, small_files))
+                except OSError as e:
+                    errors.append((batch_dirs[0], e))
+                small_files.clear()
+
+        for entry in walk(
+            src, lambda path, e: errors.append((path, e)), listings=self.stat_cache
+        ):
+            self.cancel_token.check()
+            dest_path = os.path.join(dest, entry.rel) if entry.rel else dest
+            if entry.is_dir:
+                flush()
+                batch_dirs = (entry.path, dest_path)
+                try:
+                    os.makedirs(dest_path, exist_ok=True)
+                except OSError as e:
+                    errors.append((entry.path, e))
+                    continue
+                dir_entries.append((entry, dest_path))
+            elif self.is_small_file(entry.stat):
+                small_files.append((entry.name, entry.stat))
+                if len(small_files) == _BATCH_FILES:
+                    flush()
+            else:
+                try:
+                    self.copy_entry(entry.path, dest_path, entry.stat)
+                except OSError as e:
+                    errors.append((entry.path, e))
+        flush()
+
+        for entry, dest_path in reversed(dir_entries):
+            try:
+                _copy_metadata(entry.stat, entry.path, dest_path)
+            except OSError as e:
+                errors.append((entry.path, e))
+        return errors
+
+    def _run_copy(self, src: str, dest: str) -> list:
+        """
+        rsync と同じ規則でコピーを実行する
+
+        srcがディレクトリの場合は中身を dest に、ファイルの場合は dest
+        (dest が既存ディレクトリならその中) にコピーする。
+
+        Returns:
+        list: コピーできなかったファイルと例外の組のリスト
+        """
+        if os.path.isdir(src):
+            return self._copy_tree(src, dest)
+
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(src))
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        try:
+            self.copy_entry(src, dest, os.lstat(src))
+        except OSError as e:
+            return [(src, e)]
+        return []
+
+    def copy(self, src: str, dest: str, retries: int = 3):
+        """
+        ファイルまたはディレクトリをコピーする
+
+        Parameters:
+        src (str): コピー元のパス
+        dest (str): コピー先のパス
+        retries (int): コピー失敗時の最大リトライ回数
+
+        Returns:
+        bool: コピーに成功した場合は True
+        """
+        attempt = 0
+        while attempt < retries:
+            attempt += 1
+            try:
+                errors = self._run_copy(src, dest)
+            except OSError as e:
+                errors = [(src, e)]
+            except CopyCancelled:
+                # 書きかけの一時ファイルは削除済み。リトライもエラー報告もしない
+                return False
+
+            if not errors:
+                if self.progress_callback:
+                    # 成功を通知
+                    self.progress_callback(1, 1, 100, 100)
+                return True
+
+            if self.error_callback:
+                message = "\n".join(f"{path}: {e}" for path, e in errors)
+                self.error_callback(src, attempt, retries, message)
+
+            # エラー発生時、再試行を行うかどうかを決定
+            if attempt < retries:
+                if self.error_callback:
+                    self.error_callback(src, attempt, retries, "リトライ中...")
+            else:
+                if self.error_callback:
+                    self.error_callback(src, attempt, retries, "コピーに失敗しました。")
+        return False
+
+    def cancel(self):
+        """実行中のコピーをチャンクの区切りで中断させ、以降のコピーを行わない"""
+        self.cancel_token.cancel()
+
+    def set_progress_callback(self, callback: Callable):
+        """
+        進行状況コールバックを設定する
+
+        Parameters:
+        callback (Callable): 進行状況を報告するためのコールバック関数
+        """
+        self.progress_callback = callback
+
+    def set_journal(self, journal):
+        """
+        コピーの完了状況を記録するジャーナルを設定する
+
+        Parameters:
+        journal (CopyJournal): ジャーナル (None で無効化)
+        """
+        self.journal = journal
+
+    def set_file_callback(self, callback: Callable):
+        """
+        ファイル1つの処理が終わるごとに呼び出されるコールバックを設定する
+
+        Parameters:
+        callback (Callable): (コピー元ファイルのパス, ファイルサイズ) を受け取る関数
+        """
+        self.file_callback = callback
+
+    def set_dedup(self, dedup):
+        """
+        同じ内容のファイルをリンクで作成するための索引を設定する
+
+        Parameters:
+        dedup (DedupIndex): 重複ファイルの索引 (None で無効化)
+        """
+        self.dedup = dedup
+
+    def set_stat_cache(self, stat_cache):
+        """
+        前回までにコピーしたファイルとディレクトリの一覧のキャッシュを設定する
+
+        Parameters:
+        stat_cache (StatCache): メタデータキャッシュ (None で無効化)
+        """
+        self.stat_cache = stat_cache
+
+    def set_digest_callback(self, callback: Callable):
+        """
+        コピーしながらハッシュ値を計算し、ファイルごとに報告するコールバックを設定する
+
+        Parameters:
+        callback (Callable): (コピー元のパス, コピー先のパス, コピー元の lstat 結果,
+            16進のハッシュ値) を受け取る関数 (None で無効化)
+        """
+        self.digest_callback = callback
+
+    def set_error_callback(self, callback: Callable):
+        """
+        エラー発生時のコールバックを設定する
+
+        Parameters:
+        callback (Callable): エラーを報告するためのコールバック関数
+        """
+        self.error_callback = callback
@@ -0,0 +1,188 @@
+import threading
+import time
+from typing import Callable
+
+# 転送速度の指数移動平均の平滑化係数 (大きいほど直近の速度を重視する)
+_RATE_SMOOTHING = 0.3
+
+
+class SourceProgress:
+    __slots__ = ("done", "total", "rate", "eta")
+
+    def __init__(self, done: int = 0, total: int = 0, rate: float = 0.0, eta=None):
+        """
+        1つのコピー元の進行状況
+
+        Parameters:
+        done (int): コピー済みのバイト数
+        total (int): 全体のバイト数
+        rate (float): 転送速度 (バイト/秒)
+        eta (float): 残り秒数 (推定できない場合は None)
+        """
+        self.done = done
+        self.total = total
+        self.rate = rate
+        self.eta = eta
+
+    @property
+    def percent(self) -> float:
+        """進捗率 (0〜100)"""
+        if self.total <= 0:
+            return 100.0 if self.done else 0.0
+        return min(self.done / self.total * 100, 100.0)
+
+    def __repr__(self):
+        return (
+            f"SourceProgress(done={self.done}, total={self.total}, "
+            f"rate={self.rate:.0f}, eta={self.eta})"
+        )
+
+
+class ProgressSnapshot:
+    __slots__ = ("sources", "overall", "elapsed")
+
+    def __init__(self, sources: dict, overall: SourceProgress, elapsed: float):
+        """
+        ある時点のバッチ全体の進行状況
+
+        Parameters:
+        sources (dict): コピー元のパスから SourceProgress への辞書
+        overall (SourceProgress): バッチ全体の進行状況
+        elapsed (float): コピー開始からの経過秒数
+        """
+        self.sources = sources
+        self.overall = overall
+        self.elapsed = elapsed
+
+
+class ProgressAggregator:
+    def __init__(self, interval: float = 0.1, sink: Callable = None):
+        """
+        複数のワーカーからの進捗を1つのスナップショットにまとめ、一定間隔で通知するクラス
+
+        update/add/complete は任意のスレッドから高頻度で呼び出してよい。
+        通知はコピーの速さに関係なく interval ごとに最大1回、専用のスレッドから
+        sink(ProgressSnapshot) として行われる。
+
+        Parameters:
+        interval (float): 通知間隔 (秒)。0.1 で 10 Hz
+        sink (Callable): スナップショットを受け取るコールバック関数
+        """
+        self.interval = interval
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._last_done = {}
+        self._rates = {}
+        self._dirty = False
+        self._started = None
+        self._last_tick = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set_totals(self, totals: dict):
+        """
+        コピー元ごとの全体のバイト数を設定する
+
+        Parameters:
+        totals (dict): コピー元のパスから全体のバイト数への辞書
+        """
+        with self._lock:
+            for src, total in totals.items():
+                self._sources.setdefault(src, [0, 0])[1] = total
+            self._dirty = True
+
+    def update(self, src: str, done: int, total: int = None):
+        """コピー元のコピー済みバイト数を絶対値で更新する"""
+        with self._lock:
+            state = self._sources.setdefault(src, [0, 0])
+            state[0] = done
+            if total is not None:
+                state[1] = total
+            self._dirty = True
+
+    def add(self, src: str, nbytes: int):
+        """コピー元のコピー済みバイト数を加算する"""
+        with self._lock:
+            self._sources.setdefault(src, [0, 0])[0] += nbytes
+            self._dirty = True
+
+    def complete(self, src: str):
+        """コピー元のコピー完了を記録する (コピー済みバイト数を全体に揃える)"""
+        with self._lock:
+            state = self._sources.setdefault(src, [0, 0])
+            state[0] = max(state[0], state[1])
+            state[1] = state[0]
+            self._dirty = True
+
+    def snapshot(self) -> ProgressSnapshot:
+        """現在の進行状況のスナップショットを作成する"""
+        now = time.monotonic()
+        with self._lock:
+            started = self._started if self._started is not None else now
+            last_tick = self._last_tick if self._last_tick is not None else started
+            dt = now - last_tick
+            self._last_tick = now
+
+            sources = {}
+            for src, (done, total) in self._sources.items():
+                rate = self._smoothed_rate(src, done, dt)
+                sources[src] = SourceProgress(
+                    done, max(total, done), rate, _eta(done, total, rate)
+                )
+
+            done = sum(progress.done for progress in sources.values())
+            total = sum(progress.total for progress in sources.values())
+            rate = self._smoothed_rate(None, done, dt)
+            overall = SourceProgress(done, total, rate, _eta(done, total, rate))
+            self._dirty = False
+        return ProgressSnapshot(sources, overall, now - started)
+
+    def _smoothed_rate(self, key, done: int, dt: float) -> float:
+        """転送速度の指数移動平均を更新して返す (ロック取得済みで呼ぶこと)"""
+        previous = self._last_done.get(key, 0)
+        self._last_done[key] = done
+        rate = self._rates.get(key, 0.0)
+        if dt > 0:
+            instant = max(done - previous, 0) / dt
+            if key in self._rates:
+                rate = _RATE_SMOOTHING * instant + (1 - _RATE_SMOOTHING) * rate
+            else:
+                rate = instant
+            self._rates[key] = rate
+        return rate
+
+    def start(self):
+        """一定間隔での通知を開始する"""
+        self._started = time.monotonic()
+        self._last_tick = self._started
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """通知を停止し、最後のスナップショットを通知する"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._emit()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._dirty:
+                self._emit()
+
+    def _emit(self):
+        if self.sink:
+            self.sink(self.snapshot())
+
+
+def _eta(done: int, total: int, rate: float):
+    """残りバイト数と転送速度から残り秒数を推定する"""
+    if total <= done:
+        return 0.0
+    if rate <= 0:
+        return None
+    return (total - done) / rate
@@ -0,0 +1,166 @@
+import functools
+import os
+import shutil
+import subprocess
+import sys
+from typing import Callable
+
+from .cancel import CancelToken
+
+
+@functools.lru_cache(maxsize=None)
+def cp_supports_reflink() -> bool:
+    """インストールされている cp が --reflink に対応しているか (GNU coreutils 7.5 以降)"""
+    if not sys.platform.startswith("linux") or shutil.which("cp") is None:
+        return False
+    try:
+        result = subprocess.run(
+            ["cp", "--help"], capture_output=True, text=True, check=False
+        )
+    except OSError:
+        return False
+    return "--reflink" in result.stdout
+
+
+def cp_command(src: str, dest: str) -> list:
+    """
+    cp --reflink のコマンドラインを組み立てる (rsync と同じ規則でコピーする)
+
+    srcがディレクトリの場合は中身を dest に、ファイルの場合は dest
+    (dest が既存ディレクトリならその中) にコピーする。
+
+    Parameters:
+    src (str): コピー元ディレクトリまたはファイル
+    dest (str): コピー先のパス
+
+    Returns:
+    list: コマンドのリスト
+    """
+    # -a: パーミッション、シンボリックリンク、タイムスタンプ、拡張属性を保持
+    # --reflink=auto: 同じファイルシステム内ならデータブロックを共有し、
+    #   できない場合は通常のコピーを行う
+    command = ["cp", "-a", "--reflink=auto"]
+    if os.path.isdir(src):
+        # "src/." で src 自身ではなく中身を dest にコピーする
+        return command + [os.path.join(src, "."), os.path.join(dest, "")]
+    return command + [src, dest]
+
+
+class ReflinkCopy:
+    def __init__(
+        self,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+        checksum: bool = False,
+        cancel_token: CancelToken = None,
+    ):
+        """
+        cp --reflink でコピーするクラス (Linux の btrfs/XFS など向け)
+
+        同じファイルシステム内ではファイルのデータをコピーせず reflink を作るため、
+        ツリーの大きさに関係なくメタデータの作成だけで終わる。cp は変更の有無を
+        判定しないため、既存のファイルも常に作り直す (reflink なので安価)。
+
+        Parameters:
+        progress_callback (Callable): 進行状況を報告するためのコールバック関数
+        error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        checksum (bool): cp は変更を判定しないため無視される
+        cancel_token (CancelToken): キャンセルを受け取るトークン (省略時は専用に作る)
+        """
+        self.progress_callback = progress_callback
+        self.error_callback = error_callback
+        self.checksum = checksum
+        self.cancel_token = cancel_token or CancelToken()
+
+    def _run_cp(self, src: str, dest: str) -> int:
+        """
+        cp コマンドを実行してファイルをコピーする
+
+        Returns:
+        int: cp の終了コード
+        """
+        try:
+            if os.path.isdir(src):
+                os.makedirs(dest, exist_ok=True)
+            elif not os.path.isdir(dest):
+                os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        except OSError as e:
+            if self.error_callback:
+                self.error_callback(src, 1, 3, str(e))
+            return 1
+
+        process = subprocess.Popen(
+            cp_command(src, dest),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+        )
+        # キャンセル時に cp を終了させられるよう登録する
+        self.cancel_token.register(process)
+        try:
+            _, stderr = process.communicate()
+        finally:
+            self.cancel_token.unregister(process)
+        if self.cancel_token.cancelled:
+            return process.returncode or 1
+        if process.returncode != 0 and self.error_callback:
+            self.error_callback(src, 1, 3, stderr)
+        return process.returncode
+
+    def copy(self, src: str, dest: str, retries: int = 3):
+        """
+        ファイルまたはディレクトリをコピーする
+
+        Parameters:
+        src (str): コピー元のパス
+        dest (str): コピー先のパス
+        retries (int): コピー失敗時の最大リトライ回数
+
+        Returns:
+        bool: コピーに成功した場合は True
+        """
+        attempt = 0
+        while attempt < retries:
+            if self.cancel_token.cancelled:
+                return False
+            attempt += 1
+            result_code = self._run_cp(src, dest)
+            if self.cancel_token.cancelled:
+                return False
+
+            if result_code == 0:
+                if self.progress_callback:
+                    # cp は進捗を出力しないため完了だけを通知する
+                    self.progress_callback(1, 1, 100, 100)
+                return True
+
+            if attempt < retries:
+                if self.error_callback:
+                    self.error_callback(src, attempt, retries, "リトライ中...")
+            else:
+                if self.error_callback:
+                    self.error_callback(src, attempt, retries, "コピーに失敗しました。")
+        return False
+
+    def cancel(self):
+        """実行中の cp を終了させ、以降のコピーとリトライを行わない"""
+        self.cancel_token.cancel()
+
+    def set_progress_callback(self, callback: Callable):
+        """
+        進行状況コールバックを設定する
+
+        Parameters:
+        callback (Callable): 進行状況を報告するためのコールバック関数
+        """
+        self.progress_callback = callback
+
+    def set_error_callback(self, callback: Callable):
+        """
+        エラー発生時のコールバックを設定する
+
+        Parameters:
+        callback (Callable): エラーを報告するためのコールバック関数
+        """
+        self.error_callback = callback
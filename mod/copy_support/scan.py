@@ -0,0 +1,173 @@
+import concurrent.futures
+import os
+import stat
+
+from .walk import iter_dir
+
+
+class TreeSize:
+    __slots__ = ("files", "size")
+
+    def __init__(self, files: int = 0, size: int = 0):
+        """
+        1つのコピー元ツリーのファイル数と合計サイズ
+
+        Parameters:
+        files (int): ファイル数 (ディレクトリを除く)
+        size (int): 通常ファイルの合計バイト数
+        """
+        self.files = files
+        self.size = size
+
+    def __repr__(self):
+        return f"TreeSize(files={self.files}, size={self.size})"
+
+
+class SizeIndex:
+    def __init__(self, trees: dict = None):
+        """
+        コピー元ツリーごとのサイズの索引
+
+        Parameters:
+        trees (dict): コピー元のパスから TreeSize への辞書
+        """
+        self.trees = trees or {}
+
+    def __getitem__(self, src: str) -> TreeSize:
+        return self.trees.get(src, TreeSize())
+
+    @property
+    def total_files(self) -> int:
+        """全コピー元のファイル数の合計"""
+        return sum(tree.files for tree in self.trees.values())
+
+    @property
+    def total_bytes(self) -> int:
+        """全コピー元の合計バイト数"""
+        return sum(tree.size for tree in self.trees.values())
+
+    def percent(self, done_bytes: int) -> float:
+        """
+        コピー済みバイト数からバッチ全体の進捗率を計算する
+
+        Parameters:
+        done_bytes (int): コピー済みのバイト数
+
+        Returns:
+        float: 進捗率 (0〜100)
+        """
+        total = self.total_bytes
+        if total == 0:
+            return 100.0
+        return min(done_bytes / total * 100, 100.0)
+
+    def eta(self, done_bytes: int, elapsed: float):
+        """
+        経過時間から残り時間を推定する
+
+        Parameters:
+        done_bytes (int): コピー済みのバイト数
+        elapsed (float): コピー開始からの経過秒数
+
+        Returns:
+        float: 残り秒数。推定できない場合は None
+        """
+        if done_bytes <= 0 or elapsed <= 0:
+            return None
+        return max(self.total_bytes - done_bytes, 0) * elapsed / done_bytes
+
+
+def _scan_dir(path: str, listings=None):
+    """
+    1つのディレクトリ直下を走査する
+
+    listings (StatCache) に前回から変わっていないディレクトリの一覧があれば、
+    readdir も各ファイルの stat も行わずに記録されたサイズで集計する
+    (中身だけが変わったファイルのサイズは古いままだが、集計は進捗の表示にしか
+    使わない)。
+
+    Returns:
+    tuple: (ファイル数, 合計バイト数, サブディレクトリのリスト)
+    """
+    files = 0
+    size = 0
+    subdirs = []
+    try:
+        dir_stat = os.stat(path) if listings is not None else None
+        cached = listings.listing(path, dir_stat) if listings is not None else None
+        if cached is not None:
+            for name, is_dir, entry_size in cached:
+                if is_dir:
+                    subdirs.append(os.path.join(path, name))
+                else:
+                    files += 1
+                    size += entry_size
+            return files, size, subdirs
+
+        # 一覧はキャッシュに記録する場合だけ作る (巨大なディレクトリでもメモリを使わない)
+        listing = [] if listings is not None else None
+        for entry in iter_dir(path):
+            if entry.is_dir:
+                subdirs.append(entry.path)
+                if listing is not None:
+                    listing.append((entry.name, True, 0))
+                continue
+            files += 1
+            entry_size = entry.stat.st_size if stat.S_ISREG(entry.stat.st_mode) else 0
+            if listing is not None:
+                listing.append((entry.name, False, entry_size))
+            size += entry_size
+        if listing is not None:
+            listings.put_listing(path, dir_stat, listing)
+    except OSError:
+        # 読み取れないディレクトリは数えない (コピー時にエラーとして報告される)
+        pass
+    return files, size, subdirs
+
+
+def scan_sources(
+    src_dirs: list, max_workers: int = None, listings=None
+) -> SizeIndex:
+    """
+    コピー元を並列に走査し、ファイル数と合計サイズの索引を作成する
+
+    ディレクトリ1つを1タスクとしてスレッドプールで走査するため、
+    1つの巨大なツリーでも複数のスレッドで並列に走査される。
+
+    Parameters:
+    src_dirs (list): コピー元のパスのリスト
+    max_workers (int): 走査に使うスレッド数 (省略時は CPU コア数 × 2)
+    listings (StatCache): ディレクトリの一覧のキャッシュ
+
+    Returns:
+    SizeIndex: コピー元ごとのサイズの索引
+    """
+    trees = {src: TreeSize() for src in src_dirs}
+    max_workers = max_workers or (os.cpu_count() or 1) * 2
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = {}
+        for src in trees:
+            try:
+                src_stat = os.stat(src)
+            except OSError:
+                continue
+            if stat.S_ISDIR(src_stat.st_mode):
+                pending[executor.submit(_scan_dir, src, listings)] = src
+            else:
+                trees[src].files = 1
+                trees[src].size = src_stat.st_size
+
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                src = pending.pop(future)
+                files, size, subdirs = future.result()
+                trees[src].files += files
+                trees[src].size += size
+                for subdir in subdirs:
+                    pending[executor.submit(_scan_dir, subdir, listings)] = src
+
+    return SizeIndex(trees)
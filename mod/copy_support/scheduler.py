@@ -0,0 +1,279 @@
+import concurrent.futures
+import os
+import stat
+import threading
+from typing import Callable
+
+from .cancel import CopyCancelled
+from .concurrency import ConcurrencyController, feed_per_device, group_by_device
+from .native import _BATCH_FILES, NativeCopy, _copy_metadata
+from .walk import DEFAULT_LOOKAHEAD, walk
+
+
+class CopyScheduler:
+    def __init__(
+        self,
+        copier: NativeCopy,
+        max_workers: int = None,
+        retries: int = 3,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+        concurrency: ConcurrencyController = None,
+    ):
+        """
+        複数のコピー元ツリーをファイル単位のタスクに分割して並列コピーするクラス
+
+        すべてのツリーのファイルを1つの共有キューに投入し、固定数のワーカーが
+        空き次第次のタスクを取り出す。巨大なディレクトリと小さなディレクトリが
+        混在していても、全ワーカーが最後まで稼働し続ける。
+
+        ジョブはコピー元・コピー先のデバイスの組ごとのキューに分けられ、
+        デバイスごとに専用のスレッドが走査と投入を行う。同時にコピーする
+        ファイル数はデバイスの組ごとに concurrency で制限されるため、異なる
+        ディスク上のコピー元は並行してコピーされ、1台の HDD に過剰な
+        ランダムアクセスが集中しない。
+
+        Parameters:
+        copier (NativeCopy): ファイル単位のコピーを行うクラス
+        max_workers (int): デバイスの組ごとのワーカー数 (省略時は concurrency の上限)
+        retries (int): ファイルごとの最大リトライ回数
+        progress_callback (Callable): 進行状況を報告するためのコールバック関数
+        error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        concurrency (ConcurrencyController): 同時コピー数の制御 (省略時は
+            max_workers を上限として自動調整する)
+        """
+        self.copier = copier
+        self.concurrency = concurrency or ConcurrencyController(max_workers)
+        self.max_workers = max_workers or self.concurrency.max_workers
+        self.retries = retries
+        self.progress_callback = progress_callback
+        self.error_callback = error_callback
+        self._lock = threading.Lock()
+
+    def run(self, jobs: list) -> list:
+        """
+        コピーを実行する
+
+        Parameters:
+        jobs (list): (コピー元, コピー先) の組のリスト
+
+        Returns:
+        list: ジョブごとの、コピーできなかったファイルと例外の組のリスト
+        """
+        self._jobs = jobs
+        self._errors = [[] for _ in jobs]
+        self._remaining = [0] * len(jobs)
+        self._walked = [False] * len(jobs)
+        self._done = 0
+        dir_entries = []
+        groups = group_by_device(jobs)
+
+        # デバイスの組ごとに最大 max_workers のファイルを同時にコピーできるようにする
+        workers = self.max_workers * max(len(groups), 1)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            try:
+                feed_per_device(
+                    groups,
+                    self.concurrency,
+                    lambda limit, entries: self._feed(
+                        executor, limit, entries, dir_entries
+                    ),
+                )
+            except BaseException:
+                # Ctrl+C などで待機が中断された場合も、実行中のコピーを中断して
+                # 終わるまで待ってから戻る (呼び出し元がジャーナルを閉じられるように)
+                self.copier.cancel_token.cancel()
+                executor.shutdown(cancel_futures=True)
+                raise
+            if self.copier.cancel_token.cancelled:
+                # 実行待ちのタスクは破棄し、実行中のコピーの中断だけを待つ
+                executor.shutdown(cancel_futures=True)
+        if self.copier.cancel_token.cancelled:
+            return self._errors
+
+        # ディレクトリの属性は中身のコピー後に深い階層から設定する
+        for index, src_stat, src_dir, dest_dir in reversed(dir_entries):
+            try:
+                _copy_metadata(src_stat, src_dir, dest_dir)
+            except OSError as e:
+                self._add_error(index, src_dir, e)
+
+        for (src, _), failed in zip(jobs, self._errors):
+            if failed and self.error_callback:
+                message = "\n".join(f"{path}: {e}" for path, e in failed)
+                self.error_callback(src, self.retries, self.retries, message)
+                self.error_callback(
+                    src, self.retries, self.retries, "コピーに失敗しました。"
+                )
+        return self._errors
+
+    def _feed(
+        self,
+        executor: concurrent.futures.Executor,
+        limit,
+        entries: list,
+        dir_entries: list,
+    ):
+        """
+        1組のデバイス上のジョブを順に走査し、枠を確保しながらファイルタスクを投入する
+
+        同時にコピー中のファイル数は limit で制限されるため、ツリー全体を
+        メモリに展開することはない。キャンセルされると走査と投入をやめ、
+        投入しきれなかったジョブを失敗として記録する。
+        """
+        cancel_token = self.copier.cancel_token
+        for index, src, dest in entries:
+            on_error = lambda path, e, index=index: self._add_error(index, path, e)
+            tasks = () if cancel_token.cancelled else self._walk(
+                src, dest, dir_entries, index, on_error
+            )
+            for task in tasks:
+                if cancel_token.cancelled:
+                    break
+                limit.acquire()
+                with self._lock:
+                    self._remaining[index] += 1
+                future = executor.submit(self._copy_task, *task)
+                future.add_done_callback(
+                    lambda f, index=index, task=task: self._task_done(
+                        f, index, task, limit
+                    )
+                )
+            if cancel_token.cancelled:
+                self._add_error(index, src, CopyCancelled())
+                continue
+            with self._lock:
+                self._walked[index] = True
+                if self._remaining[index] == 0:
+                    self._job_done()
+
+    def _walk(
+        self, src: str, dest: str, dir_entries: list, index: int, on_error: Callable
+    ):
+        """
+        コピー元を走査し、コピー先ディレクトリを作成しながらファイルタスクを生成する
+
+        ディレクトリの読み取りは walk の先読みスレッドで行われるため、
+        同時コピー数の枠を待つ間も走査が進む。先読みの量は DEFAULT_LOOKAHEAD で
+        制限され、ツリー全体をメモリに展開しない。
+
+        Parameters:
+        src (str): コピー元のパス
+        dest (str): コピー先のパス
+        dir_entries (list): 属性を後で設定するディレクトリを追加するリスト
+        index (int): ジョブ番号
+        on_error (Callable): 走査中のエラーを報告する関数
+
+        Yields:
+        tuple: (コピー元ファイル, コピー先ファイル, lstat 結果)。小さなファイルは
+            ディレクトリごとにまとめた (コピー元ディレクトリ, コピー先ディレクトリ,
+            (ファイル名, lstat 結果) のリスト)
+        """
+        if not os.path.isdir(src):
+            try:
+                if os.path.isdir(dest):
+                    dest = os.path.join(dest, os.path.basename(src))
+                else:
+                    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+                src_stat = os.lstat(src)
+            except OSError as e:
+                on_error(src, e)
+                return
+            yield src, dest, src_stat
+            return
+
+        small_files = []
+        batch_dirs = None
+        for entry in walk(
+            src,
+            on_error,
+            lookahead=DEFAULT_LOOKAHEAD,
+            listings=self.copier.stat_cache,
+        ):
+            dest_path = os.path.join(dest, entry.rel) if entry.rel else dest
+            if entry.is_dir:
+                if small_files:
+                    yield (*batch_dirs, small_files)
+                    small_files = []
+                batch_dirs = (entry.path, dest_path)
+                try:
+                    os.makedirs(dest_path, exist_ok=True)
+                except OSError as e:
+                    on_error(entry.path, e)
+                    continue
+                dir_entries.append((index, entry.stat, entry.path, dest_path))
+            elif self.copier.is_small_file(entry.stat):
+                small_files.append((entry.name, entry.stat))
+                if len(small_files) == _BATCH_FILES:
+                    yield (*batch_dirs, small_files)
+                    small_files = []
+            else:
+                yield entry.path, dest_path, entry.stat
+        if small_files:
+            yield (*batch_dirs, small_files)
+
+    def _copy_task(self, src: str, dest: str, item) -> list:
+        """
+        1つのファイル、または小さなファイルのまとまりをリトライ付きでコピーする
+
+        Returns:
+        list: まとまりのうちコピーできなかったファイルと例外の組のリスト
+        """
+        if isinstance(item, list):
+            stats = dict(item)
+            errors = []
+            for path, error in self.copier.copy_batch(src, dest, item):
+                # 失敗したファイルだけを1つずつリトライする
+                name = os.path.basename(path)
+                if name not in stats:
+                    errors.append((path, error))
+                    continue
+                try:
+                    self._copy_task(path, os.path.join(dest, name), stats[name])
+                except OSError as e:
+                    errors.append((path, e))
+            return errors
+
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.copier.copy_entry(src, dest, item)
+                return []
+            except OSError:
+                if attempt == self.retries:
+                    raise
+
+    def _add_error(self, index: int, path: str, error: Exception):
+        """ジョブのエラーを記録する"""
+        with self._lock:
+            self._errors[index].append((path, error))
+
+    def _task_done(
+        self, future: concurrent.futures.Future, index: int, task: tuple, limit
+    ):
+        """ファイルタスクの完了時に呼ばれ、ジョブ単位の完了を判定する"""
+        path, _, item = task
+        limit.release()
+        if future.cancelled():
+            error = CopyCancelled()
+        else:
+            error = future.exception()
+        if error is None:
+            if isinstance(item, list):
+                limit.record(sum(src_stat.st_size for _, src_stat in item))
+            elif stat.S_ISREG(item.st_mode):
+                limit.record(item.st_size)
+        with self._lock:
+            if error is not None:
+                self._errors[index].append((path, error))
+            else:
+                self._errors[index].extend(future.result())
+            self._remaining[index] -= 1
+            if self._remaining[index] == 0 and self._walked[index]:
+                self._job_done()
+
+    def _job_done(self):
+        """コピー元1つ分のコピー完了を報告する (ロック取得済みで呼ぶこと)"""
+        self._done += 1
+        if self.progress_callback:
+            total = len(self._jobs)
+            self.progress_callback(self._done, total, 100, self._done / total * 100)
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+
+# コピー先ディレクトリに作成するメタデータキャッシュの名前
+STAT_CACHE_NAME = ".copyman_statcache.jsonl"
+
+# 更新日時がこの秒数以内のディレクトリは一覧をキャッシュしない。一覧の読み取りと
+# 同じ時刻の刻みの間にエントリが追加されると、更新日時が変わらず見逃すため
+_RACY_SECONDS = 2.0
+
+
+def _dir_key(st: os.stat_result) -> tuple:
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def _file_key(st: os.stat_result) -> tuple:
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class StatCache:
+    def __init__(self, path: str):
+        """
+        前回までに正常にコピーしたファイルとコピー元ディレクトリの一覧を記録するキャッシュ
+
+        ファイルはコピー先のパスをキーにコピー元の (inode, サイズ, 更新日時) を
+        記録し、一致すればコピー先の lstat 1回でサイズと更新日時が残っていることだけを
+        確認して変更なしと判定する (checksum 有効時もハッシュ値を計算しない)。
+        ディレクトリはコピー元のパスをキーに (inode, 更新日時) とエントリの
+        一覧を記録する。ディレクトリの更新日時はエントリの追加・削除・
+        名前の変更で必ず変わるため、一致すれば readdir せずに一覧を再利用できる
+        (ファイルの中身の変更はディレクトリの更新日時に現れないため、
+        ファイル自体の lstat は省略しない)。
+
+        Parameters:
+        path (str): キャッシュファイルのパス
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = {}
+        self._dirs = {}
+        self._load()
+
+    def _load(self):
+        """既存のキャッシュを読み込む"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("kind") == "file":
+                    self._files[record["path"]] = tuple(record["key"])
+                elif record.get("kind") == "dir":
+                    self._dirs[record["path"]] = (
+                        tuple(record["key"]),
+                        [tuple(entry) for entry in record["entries"]],
+                    )
+
+    def listing(self, path: str, dir_stat: os.stat_result) -> list:
+        """
+        ディレクトリが前回から変わっていなければキャッシュした一覧を返す
+
+        Parameters:
+        path (str): コピー元ディレクトリのパス
+        dir_stat (os.stat_result): ディレクトリの stat 結果
+
+        Returns:
+        list: (名前, ディレクトリかどうか, サイズ) のリスト。変わっている場合や
+            記録がない場合は None
+        """
+        with self._lock:
+            cached = self._dirs.get(path)
+        if cached is None or cached[0] != _dir_key(dir_stat):
+            return None
+        return cached[1]
+
+    def put_listing(self, path: str, dir_stat: os.stat_result, entries: list):
+        """
+        読み取ったディレクトリの一覧を記録する
+
+        Parameters:
+        path (str): コピー元ディレクトリのパス
+        dir_stat (os.stat_result): 一覧を読み取る前に取得したディレクトリの stat 結果
+        entries (list): (名前, ディレクトリかどうか, サイズ) のリスト
+        """
+        if time.time() - dir_stat.st_mtime < _RACY_SECONDS:
+            return
+        with self._lock:
+            self._dirs[path] = (_dir_key(dir_stat), entries)
+
+    def is_recorded(self, dest: str, src_stat: os.stat_result) -> bool:
+        """コピー元が前回コピーしたときから変わっていないかを判定する"""
+        with self._lock:
+            return self._files.get(dest) == _file_key(src_stat)
+
+    def record(self, dest: str, src_stat: os.stat_result):
+        """コピー先が src_stat のコピー元と一致していることを記録する"""
+        with self._lock:
+            self._files[dest] = _file_key(src_stat)
+
+    def forget(self, dest: str):
+        """
+        コピー先以下の記録を削除する
+
+        コピー先が削除・破損した場合に、次のコピーで比較を省略しないようにする。
+        """
+        prefix = os.path.join(dest, "")
+        with self._lock:
+            self._files.pop(dest, None)
+            for path in [path for path in self._files if path.startswith(prefix)]:
+                del self._files[path]
+
+    def save(self):
+        """キャッシュを一時ファイルに書き出してから置き換える"""
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for path, (key, entries) in self._dirs.items():
+                    record = {
+                        "kind": "dir",
+                        "path": path,
+                        "key": list(key),
+                        "entries": [list(entry) for entry in entries],
+                    }
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                for path, key in self._files.items():
+                    record = {"kind": "file", "path": path, "key": list(key)}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
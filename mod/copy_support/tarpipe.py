@@ -0,0 +1,473 @@
+import functools
+import os
+import posixpath
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+from .cancel import CancelToken, CopyCancelled
+from .mac_linux import _accepts_transfer_stats
+from .native import NativeCopy, _file_digest
+from .walk import walk
+
+# tar のブロックサイズ (ヘッダーとデータはこの単位で並ぶ)
+_TAR_BLOCK = 512
+
+# パイプから一度に中継する最大バイト数
+_RELAY_SIZE = 1024 * 1024
+
+# パイプのバッファサイズ (Linux のみ変更できる。書き出し側が先行できる量の上限)
+_PIPE_SIZE = 1024 * 1024
+
+# 進行状況を報告する最小間隔 (秒)
+_PROGRESS_INTERVAL = 0.2
+
+# データを持つ通常ファイルのエントリの種類 (ustar/GNU の typeflag)
+_REGULAR_TYPES = frozenset({b"0", b"\0", b"7", b"S"})
+
+# tar パイプに必要なオプション (名前の一覧の受け取り、ID での所有者の保持)
+_REQUIRED_OPTIONS = ("--null", "--no-recursion", "--numeric-owner")
+
+
+@functools.lru_cache(maxsize=None)
+def tar_available() -> bool:
+    """
+    tar パイプに使える tar がインストールされているか
+
+    POSIX 環境で、tar のヘルプに _REQUIRED_OPTIONS がすべて載っている場合
+    (GNU tar) に限る。Windows の tar.exe や、ヘルプにオプションを載せない
+    bsdtar (macOS) では動作を確認していないため使わない。
+    """
+    if os.name != "posix" or shutil.which("tar") is None:
+        return False
+    help_text = _tar_help()
+    return all(option in help_text for option in _REQUIRED_OPTIONS)
+
+
+@functools.lru_cache(maxsize=None)
+def _tar_help() -> str:
+    """インストールされている tar のヘルプ (対応するオプションの判定に使う)"""
+    try:
+        result = subprocess.run(
+            ["tar", "--help"], capture_output=True, text=True, check=False
+        )
+    except OSError:
+        return ""
+    return result.stdout
+
+
+def tar_commands(src: str, dest: str) -> tuple:
+    """
+    tar パイプの書き出し側と展開側のコマンドラインを組み立てる
+
+    書き出し側は標準入力から NUL 区切りで渡された名前だけをアーカイブに入れる
+    (ディレクトリの中身は名前として渡されたものだけ)。
+
+    Parameters:
+    src (str): コピー元ディレクトリ
+    dest (str): コピー先ディレクトリ
+
+    Returns:
+    tuple: (書き出し側のコマンドのリスト, 展開側のコマンドのリスト)
+    """
+    # --numeric-owner: root 実行時に名前ではなく ID で所有者を保持する (rsync -a 同様)
+    options = ["--numeric-owner"]
+    if "--xattrs" in _tar_help():
+        options.append("--xattrs")
+    create = ["tar", "-C", src, "--null", "--no-recursion", "-T", "-", "-cf", "-"]
+    if "--sparse" in _tar_help():
+        # GNU tar: 穴のあるファイルはデータのある範囲だけをアーカイブに入れる
+        # (展開側は自動的に穴を作る)
+        create.append("--sparse")
+    # -p: パーミッションを umask に関係なく保持する
+    extract = ["tar", "-C", dest, "-xpf", "-"]
+    return create + options, extract + options
+
+
+def _grow_pipe(fd: int):
+    """パイプのバッファを _PIPE_SIZE に広げる (Linux のみ)"""
+    if not sys.platform.startswith("linux"):
+        return
+    import fcntl
+
+    try:
+        fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, _PIPE_SIZE)
+    except (OSError, AttributeError):
+        # 上限 (/proc/sys/fs/pipe-max-size) を超える場合は既定のサイズのまま
+        pass
+
+
+def _header_size(field: bytes) -> int:
+    """ヘッダーのサイズ欄を読む (8 進数、または GNU の base-256 形式)"""
+    if field[0] & 0x80:
+        return int.from_bytes(field[1:], "big")
+    digits = field.strip(b"\0 ")
+    return int(digits, 8) if digits else 0
+
+
+class _StreamCounter:
+    __slots__ = ("_header", "_skip", "_data", "_pax", "_pax_size", "_pending")
+
+    def __init__(self):
+        """
+        中継する tar ストリームのヘッダーを追い、通常ファイルのデータ量を数える
+
+        データそのものは解釈せず、各エントリのヘッダーのサイズ欄から
+        データブロックを読み飛ばす。PAX 拡張ヘッダーの size は次のエントリに適用する。
+        GNU 形式の穴のあるファイル (typeflag "S") では、ヘッダーに続く
+        穴の一覧の拡張ブロックも読み飛ばす (データ量は穴を除いたもの)。
+        """
+        self._header = b""
+        self._skip = 0
+        self._data = 0
+        self._pax = None
+        self._pax_size = None
+        # 穴の一覧の拡張ブロックの後に続くデータの (ブロック数込みの長さ, データ量)
+        self._pending = None
+
+    def feed(self, chunk: bytes) -> int:
+        """
+        ストリームの続きを読み、含まれる通常ファイルのデータのバイト数を返す
+        """
+        counted = 0
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if self._skip:
+                n = min(self._skip, end - pos)
+                if self._pax is not None:
+                    self._pax += chunk[pos : pos + n]
+                data = min(self._data, n)
+                counted += data
+                self._data -= data
+                self._skip -= n
+                pos += n
+                if not self._skip and self._pax is not None:
+                    self._parse_pax()
+                continue
+
+            needed = _TAR_BLOCK - len(self._header)
+            self._header += chunk[pos : pos + needed]
+            pos += needed
+            if len(self._header) < _TAR_BLOCK:
+                break
+            header, self._header = self._header, b""
+            if self._pending is not None:
+                # 穴の一覧の拡張ブロック (504 バイト目が続きの有無)
+                if not header[504]:
+                    (self._skip, self._data), self._pending = self._pending, None
+                continue
+            if not header.strip(b"\0"):
+                # アーカイブ末尾のゼロブロック
+                continue
+            size = _header_size(header[124:136])
+            kind = header[156:157]
+            if kind in (b"x", b"X"):
+                self._pax = b""
+            elif self._pax_size is not None:
+                size, self._pax_size = self._pax_size, None
+            skip = -(-size // _TAR_BLOCK) * _TAR_BLOCK
+            data = size if kind in _REGULAR_TYPES else 0
+            if kind == b"S" and header[482]:
+                self._pending = (skip, data)
+                continue
+            self._skip, self._data = skip, data
+            if not self._skip and self._pax is not None:
+                self._parse_pax()
+        return counted
+
+    def _parse_pax(self):
+        """PAX 拡張ヘッダーのレコード ("長さ キー=値\\n") から size を取り出す"""
+        records, self._pax = self._pax, None
+        for record in records.split(b"\n"):
+            _, _, field = record.partition(b" ")
+            if field.startswith(b"size="):
+                try:
+                    self._pax_size = int(field[5:])
+                except ValueError:
+                    pass
+
+
+class _PipeProgress:
+    __slots__ = ("queued", "done", "started", "reported")
+
+    def __init__(self):
+        """
+        tar パイプ1回分の進行状況
+
+        queued は走査を終えた通常ファイルの合計バイト数 (変更がなく省略したものを
+        含む)、done はパイプを通過した (または省略した) データのバイト数。
+        """
+        self.queued = 0
+        self.done = 0
+        self.started = time.monotonic()
+        self.reported = 0.0
+
+
+class TarPipeCopy:
+    def __init__(
+        self,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+        checksum: bool = False,
+        cancel_token: CancelToken = None,
+    ):
+        """
+        tar ストリームをパイプで展開してコピーするクラス (小さなファイルが多いツリー向け)
+
+        書き出し側の tar がコピー元を読んでストリームを作り、展開側の tar が
+        パイプから読みながらコピー先に書き込む。2つのプロセスはそれぞれ
+        ツリーを順に処理するだけで、読み込みと書き込みは並行して進む。
+        間のパイプは容量が限られる (最大 1 MiB ずつ) ため、書き出し側は展開側より
+        その分しか先行しない。
+
+        アーカイブに入れるファイルは Python 側で走査して書き出し側に渡し、
+        サイズと更新日時が一致する既存のファイル (rsync の quick check 相当) は
+        送らない。ストリームはこのクラスが中継し、ヘッダーから進捗を数える。
+        パーミッション、タイムスタンプ、シンボリックリンク、ハードリンク、
+        所有者 (root 実行時)、拡張属性と穴のあるファイルの穴 (tar が対応している
+        場合) を保持する。
+        コピー元がファイル単体の場合は NativeCopy でコピーする。
+
+        Parameters:
+        progress_callback (Callable): 進行状況を報告するためのコールバック関数
+        error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        checksum (bool): サイズと更新日時ではなくチェックサムで変更を判定する
+        cancel_token (CancelToken): キャンセルを受け取るトークン (省略時は専用に作る)
+        """
+        self.progress_callback = progress_callback
+        self.error_callback = error_callback
+        self.checksum = checksum
+        self.cancel_token = cancel_token or CancelToken()
+        self._with_stats = _accepts_transfer_stats(progress_callback)
+
+    def _report_progress(self, progress: _PipeProgress, force: bool = False):
+        """
+        進行状況コールバックを呼び出す
+
+        合計は走査を終えたところまでのバイト数 (rsync の逐次的な走査と同様に、
+        コピー中は増えていく)。
+        """
+        if not self.progress_callback:
+            return
+        now = time.monotonic()
+        if not force and now - progress.reported < _PROGRESS_INTERVAL:
+            return
+        progress.reported = now
+        total = max(progress.queued, progress.done)
+        done = progress.done
+        percent = done * 100 // total if total else 100
+        if self._with_stats:
+            elapsed = now - progress.started
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = (total - done) / rate if rate else None
+            self.progress_callback(done, total, percent, percent, rate=rate, eta=eta)
+        else:
+            self.progress_callback(done, total, percent, percent)
+
+    def _is_unchanged(self, src: str, dest: str, src_stat: os.stat_result) -> bool:
+        """コピー先に変更のない通常ファイルが既にあるかを判定する"""
+        try:
+            dest_stat = os.lstat(dest)
+        except OSError:
+            return False
+        if not stat.S_ISREG(dest_stat.st_mode):
+            return False
+        if dest_stat.st_size != src_stat.st_size:
+            return False
+        if self.checksum:
+            return _file_digest(src) == _file_digest(dest)
+        return int(dest_stat.st_mtime) == int(src_stat.st_mtime)
+
+    def _list_names(
+        self, src: str, dest: str, check: bool, listing, progress, errors: list
+    ):
+        """
+        アーカイブに入れる名前を NUL 区切りで一時ファイルに書き出す
+
+        tar を起動する前に走査を終えるため、コピー中の合計が最初から分かる
+        (走査をコピーと並行させると、中継するスレッドが GIL を待たされる)。
+
+        Parameters:
+        check (bool): コピー先の既存ファイルと比較して、変更のないものを省く
+        listing: 名前を書き込むバイナリファイル
+        """
+        for entry in walk(src, lambda path, e: errors.append((path, e))):
+            self.cancel_token.check()
+            if not entry.is_dir and stat.S_ISREG(entry.stat.st_mode):
+                size = entry.stat.st_size
+                progress.queued += size
+                if check and self._is_unchanged(
+                    entry.path, os.path.join(dest, entry.rel), entry.stat
+                ):
+                    progress.done += size
+                    continue
+            # "./" を付けて、"-" で始まる名前がオプションとみなされないようにする
+            # (区切りはプラットフォームに関係なく "/" にする)
+            name = posixpath.join(".", *entry.rel.split(os.sep))
+            listing.write(os.fsencode(name) + b"\0")
+
+    def _relay(self, reader, writer, progress: _PipeProgress):
+        """
+        書き出し側の出力を展開側の入力に中継し、通過したデータ量を数える
+
+        Returns:
+        bool: 書き出し側の出力を最後まで中継した場合は True
+        """
+        counter = _StreamCounter()
+        while True:
+            if self.cancel_token.cancelled:
+                return False
+            chunk = reader.stdout.read1(_RELAY_SIZE)
+            if not chunk:
+                return True
+            try:
+                writer.stdin.write(chunk)
+            except BrokenPipeError:
+                # 展開側が終了した (エラーは終了コードで報告される)
+                return False
+            progress.done += counter.feed(chunk)
+            self._report_progress(progress)
+
+    def _run_pipe(self, src: str, dest: str) -> list:
+        """
+        1回分のコピーを実行する
+
+        Returns:
+        list: コピーできなかったファイルと例外 (またはエラー出力) の組のリスト
+
+        Raises:
+        CopyCancelled: コピー中にキャンセルされた場合
+        """
+        # 新しいコピー先は既存ファイルとの比較を省く
+        check = os.path.isdir(dest)
+        os.makedirs(dest, exist_ok=True)
+        create, extract = tar_commands(src, dest)
+        errors = []
+        progress = _PipeProgress()
+
+        with tempfile.TemporaryFile() as listing, tempfile.TemporaryFile() as (
+            create_err
+        ), tempfile.TemporaryFile() as extract_err:
+            self._list_names(src, dest, check, listing, progress, errors)
+            listing.seek(0)
+            reader = subprocess.Popen(
+                create, stdin=listing, stdout=subprocess.PIPE, stderr=create_err
+            )
+            try:
+                writer = subprocess.Popen(
+                    extract, stdin=subprocess.PIPE, stderr=extract_err
+                )
+            except OSError:
+                reader.kill()
+                reader.wait()
+                raise
+            # キャンセル時に両方の tar を終了させられるよう登録する
+            for process in (reader, writer):
+                self.cancel_token.register(process)
+            _grow_pipe(reader.stdout.fileno())
+            _grow_pipe(writer.stdin.fileno())
+
+            try:
+                self._relay(reader, writer, progress)
+            finally:
+                try:
+                    writer.stdin.close()
+                except OSError:
+                    pass
+                # 中継をやめた場合、書き出し側はパイプが閉じられて終了する
+                reader.stdout.close()
+                reader.wait()
+                writer.wait()
+                for process in (reader, writer):
+                    self.cancel_token.unregister(process)
+
+            if self.cancel_token.cancelled:
+                raise CopyCancelled()
+            for process, output in ((reader, create_err), (writer, extract_err)):
+                if process.returncode != 0:
+                    output.seek(0)
+                    message = output.read().decode(errors="replace").strip()
+                    if not message:
+                        message = f"tar の終了コード {process.returncode}"
+                    errors.append((src, message))
+        if not errors:
+            # 穴のあるファイルはストリーム上のデータ量がファイルサイズより小さい
+            progress.done = progress.queued
+            self._report_progress(progress, force=True)
+        return errors
+
+    def copy(self, src: str, dest: str, retries: int = 3):
+        """
+        ファイルまたはディレクトリをコピーする
+
+        srcがディレクトリの場合は中身を dest にコピーする (rsync と同じ規則)。
+
+        Parameters:
+        src (str): コピー元のパス
+        dest (str): コピー先のパス
+        retries (int): コピー失敗時の最大リトライ回数
+
+        Returns:
+        bool: コピーに成功した場合は True
+        """
+        if not os.path.isdir(src):
+            # ファイル単体ではパイプの利点がない
+            return NativeCopy(
+                self.progress_callback,
+                self.error_callback,
+                self.checksum,
+                cancel_token=self.cancel_token,
+            ).copy(src, dest, retries)
+
+        attempt = 0
+        while attempt < retries:
+            attempt += 1
+            try:
+                errors = self._run_pipe(src, dest)
+            except OSError as e:
+                errors = [(src, e)]
+            except CopyCancelled:
+                return False
+
+            if not errors:
+                return True
+
+            if self.error_callback:
+                message = "\n".join(f"{path}: {e}" for path, e in errors)
+                self.error_callback(src, attempt, retries, message)
+
+            if attempt < retries:
+                if self.error_callback:
+                    self.error_callback(src, attempt, retries, "リトライ中...")
+            else:
+                if self.error_callback:
+                    self.error_callback(src, attempt, retries, "コピーに失敗しました。")
+        return False
+
+    def cancel(self):
+        """実行中の tar を終了させ、以降のコピーとリトライを行わない"""
+        self.cancel_token.cancel()
+
+    def set_progress_callback(self, callback: Callable):
+        """
+        進行状況コールバックを設定する
+
+        Parameters:
+        callback (Callable): 進行状況を報告するためのコールバック関数
+        """
+        self.progress_callback = callback
+        self._with_stats = _accepts_transfer_stats(callback)
+
+    def set_error_callback(self, callback: Callable):
+        """
+        エラー発生時のコールバックを設定する
+
+        Parameters:
+        callback (Callable): エラーを報告するためのコールバック関数
+        """
+        self.error_callback = callback
@@ -0,0 +1,224 @@
+import os
+import queue
+import stat
+import threading
+from typing import Callable, Iterator
+
+# walk の先読みで保持するエントリ数の既定値
+DEFAULT_LOOKAHEAD = 4096
+
+
+class WalkEntry:
+    __slots__ = ("path", "rel", "name", "stat", "is_dir")
+
+    def __init__(
+        self, path: str, rel: str, name: str, stat: os.stat_result, is_dir: bool
+    ):
+        """
+        走査で見つかった1つのエントリ
+
+        大きなツリーでも多数のエントリを保持できるよう __slots__ で定義する。
+
+        Parameters:
+        path (str): エントリのパス
+        rel (str): 走査の起点からの相対パス (起点自身は "")
+        name (str): エントリの名前
+        stat (os.stat_result): stat 結果 (iter_dir のディレクトリは None)
+        is_dir (bool): ディレクトリかどうか (シンボリックリンクはたどらない)
+        """
+        self.path = path
+        self.rel = rel
+        self.name = name
+        self.stat = stat
+        self.is_dir = is_dir
+
+    def __repr__(self):
+        return f"WalkEntry({self.path!r}, is_dir={self.is_dir})"
+
+
+def iter_dir(path: str, rel: str = "", on_error: Callable = None) -> Iterator:
+    """
+    1つのディレクトリ直下のエントリを読みながら順に返す
+
+    ディレクトリの一覧をリストに展開しないため、巨大なディレクトリでも
+    メモリ使用量は一定になる。ディレクトリのエントリは stat を取得しない
+    (stat は None)。ディレクトリ自体を開けない場合は OSError を送出する。
+
+    Parameters:
+    path (str): ディレクトリのパス
+    rel (str): path の走査の起点からの相対パス
+    on_error (Callable): エントリの stat に失敗したときに (パス, 例外) で呼ばれる関数
+
+    Yields:
+    WalkEntry: ディレクトリ直下のエントリ
+    """
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    entry_stat = None
+                    is_dir = True
+                else:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                    is_dir = False
+            except OSError as e:
+                if on_error:
+                    on_error(entry.path, e)
+                continue
+            child_rel = os.path.join(rel, entry.name) if rel else entry.name
+            yield WalkEntry(entry.path, child_rel, entry.name, entry_stat, is_dir)
+
+
+def walk(
+    root: str, on_error: Callable = None, lookahead: int = 0, listings=None
+) -> Iterator:
+    """
+    ディレクトリツリーを深さ優先で走査し、エントリを順に返すジェネレータ
+
+    各ディレクトリはその中身より先に (stat 付きで) 返され、ディレクトリ以外の
+    中身はそのディレクトリのエントリの直後にまとめて返される。保持するのは
+    未走査のサブディレクトリのパスだけで、ツリー全体や大きなディレクトリの
+    一覧をメモリに展開しない。
+
+    lookahead を指定すると別のスレッドで最大 lookahead 個のエントリを先読みし、
+    利用側の処理 (コピー) とディレクトリの読み取りを重ねる。
+
+    listings (StatCache) を指定すると、前回から更新日時の変わっていない
+    ディレクトリは readdir せずにキャッシュした一覧を使い、読み取った一覧は
+    キャッシュに記録する。
+
+    Parameters:
+    root (str): 走査の起点 (ファイルの場合はそのファイルだけを返す)
+    on_error (Callable): 読み取れないエントリを (パス, 例外) で受け取る関数
+    lookahead (int): 先読みするエントリ数 (0 で先読みしない)
+    listings (StatCache): ディレクトリの一覧のキャッシュ
+
+    Yields:
+    WalkEntry: 見つかったエントリ
+    """
+    entries = _walk(root, on_error, listings)
+    if lookahead > 0:
+        return _prefetch(entries, lookahead)
+    return entries
+
+
+def iter_listing(path: str, rel: str, names: list, on_error: Callable = None):
+    """
+    キャッシュしたディレクトリの一覧からエントリを返す (iter_dir と同じ形式)
+
+    ディレクトリ以外のエントリは中身の変更を検出できるよう lstat する。
+    """
+    for name, is_dir, _ in names:
+        entry_path = os.path.join(path, name)
+        child_rel = os.path.join(rel, name) if rel else name
+        if is_dir:
+            yield WalkEntry(entry_path, child_rel, name, None, True)
+            continue
+        try:
+            entry_stat = os.lstat(entry_path)
+        except OSError as e:
+            if on_error:
+                on_error(entry_path, e)
+            continue
+        yield WalkEntry(entry_path, child_rel, name, entry_stat, False)
+
+
+def _walk(root: str, on_error: Callable, listings=None) -> Iterator:
+    stack = [(root, "")]
+    while stack:
+        path, rel = stack.pop()
+        try:
+            # 起点がディレクトリへのシンボリックリンクの場合はたどる
+            path_stat = os.stat(path)
+            is_dir = stat.S_ISDIR(path_stat.st_mode)
+            if not is_dir:
+                path_stat = os.lstat(path)
+        except OSError as e:
+            if on_error:
+                on_error(path, e)
+            continue
+        yield WalkEntry(path, rel, os.path.basename(path), path_stat, is_dir)
+        if not is_dir:
+            continue
+
+        subdirs = []
+        cached = listings.listing(path, path_stat) if listings is not None else None
+        if cached is not None:
+            entries = iter_listing(path, rel, cached, on_error)
+            listing = None
+        else:
+            failed = []
+
+            def on_entry_error(entry_path, e):
+                failed.append(entry_path)
+                if on_error:
+                    on_error(entry_path, e)
+
+            entries = iter_dir(path, rel, on_entry_error)
+            listing = [] if listings is not None else None
+        try:
+            for entry in entries:
+                if listing is not None:
+                    regular = not entry.is_dir and stat.S_ISREG(entry.stat.st_mode)
+                    size = entry.stat.st_size if regular else 0
+                    listing.append((entry.name, entry.is_dir, size))
+                if entry.is_dir:
+                    subdirs.append((entry.path, entry.rel))
+                else:
+                    yield entry
+        except OSError as e:
+            listing = None
+            if on_error:
+                on_error(path, e)
+        if listing is not None and not failed:
+            listings.put_listing(path, path_stat, listing)
+        # 一覧の順にたどれるよう逆順に積む
+        stack.extend(reversed(subdirs))
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+def _prefetch(iterable, lookahead: int) -> Iterator:
+    """iterable を別のスレッドで最大 lookahead 個まで先読みしながら返す"""
+    items = queue.Queue(lookahead)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+            return
+        put(_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        # 途中で利用をやめた場合は先読みのスレッドを止める
+        stop.set()
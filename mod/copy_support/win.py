@@ -1,10 +1,16 @@
 import subprocess
 from typing import Callable
 
+from .cancel import CancelToken
+
 
 class WindowsCopy:
     def __init__(
-        self, progress_callback: Callable = None, error_callback: Callable = None
+        self,
+        progress_callback: Callable = None,
+        error_callback: Callable = None,
+        checksum: bool = False,
+        cancel_token: CancelToken = None,
     ):
         """
         Windows用のファイルコピークラス
@@ -12,9 +18,14 @@ class WindowsCopy:
         Parameters:
         progress_callback (Callable): 進行状況を報告するためのコールバック関数
         error_callback (Callable): エラー発生時に呼び出されるコールバック関数
+        checksum (bool): robocopy にはチェックサム比較がないため無視される
+            (常にサイズと更新日時で変更を判定する)
+        cancel_token (CancelToken): キャンセルを受け取るトークン (省略時は専用に作る)
         """
         self.progress_callback = progress_callback
         self.error_callback = error_callback
+        self.checksum = checksum
+        self.cancel_token = cancel_token or CancelToken()
 
     def _run_robocopy(self, src: str, dest: str) -> int:
         """
@@ -28,25 +39,31 @@ class WindowsCopy:
         int: robocopyの終了コード
         """
         command = ["robocopy", src, dest, "/MIR"]
+        # キャンセル時に robocopy を終了させられるよう Popen で起動して登録する
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        self.cancel_token.register(process)
         try:
-            result = subprocess.run(command, check=True, capture_output=True, text=True)
-
-            # robocopyの終了コードをログに出力
-            print(f"robocopy 終了コード: {result.returncode}")
-
-            # 終了コード 0 (成功) や 1 (警告) は正常動作として扱う
-            if result.returncode == 0:
-                return 0  # 完全成功
-            elif result.returncode == 1:
-                print("警告: コピーが正常に行われたが、robocopyは警告を出しています。")
-                return 0  # 警告も成功扱いとする
-            return result.returncode
-        except subprocess.CalledProcessError as e:
-            # 終了コード 1 をエラーとして扱わない
-            if e.returncode > 1:  # 重大なエラーのみをエラーとして扱う
-                if self.error_callback:
-                    self.error_callback(src, 1, 3, e.stderr)
-            return e.returncode
+            _, stderr = process.communicate()
+        finally:
+            self.cancel_token.unregister(process)
+        if self.cancel_token.cancelled:
+            return process.returncode or 1
+
+        # robocopyの終了コードをログに出力
+        print(f"robocopy 終了コード: {process.returncode}")
+
+        # 終了コード 0 (成功) や 1 (警告) は正常動作として扱う
+        if process.returncode == 0:
+            return 0  # 完全成功
+        elif process.returncode == 1:
+            print("警告: コピーが正常に行われたが、robocopyは警告を出しています。")
+            return 0  # 警告も成功扱いとする
+        # 重大なエラーのみをエラーとして扱う
+        if self.error_callback:
+            self.error_callback(src, 1, 3, stderr)
+        return process.returncode
 
     def copy(self, src: str, dest: str, retries: int = 3):
         """
@@ -56,11 +73,18 @@ class WindowsCopy:
         src (str): コピー元のパス
         dest (str): コピー先のパス
         retries (int): コピー失敗時の最大リトライ回数
+
+        Returns:
+        bool: コピーに成功した場合は True
         """
         attempt = 0
         while attempt < retries:
+            if self.cancel_token.cancelled:
+                return False
             attempt += 1
             result_code = self._run_robocopy(src, dest)
+            if self.cancel_token.cancelled:
+                return False
 
             # robocopy の終了コード 0 は成功
             if result_code == 0:
@@ -69,7 +93,7 @@ class WindowsCopy:
                     self.progress_callback(
                         1, 1, 100, 100
                     )  # 1つのファイルコピーとして報告
-                return
+                return True
 
             # エラー発生時、再試行を行うかどうかを決定
             if attempt < retries:
@@ -78,6 +102,11 @@ class WindowsCopy:
             else:
                 if self.error_callback:
                     self.error_callback(src, attempt, retries, "コピーに失敗しました。")
+        return False
+
+    def cancel(self):
+        """実行中の robocopy を終了させ、以降のコピーとリトライを行わない"""
+        self.cancel_token.cancel()
 
     def set_progress_callback(self, callback: Callable):
         """
@@ -1,9 +1,151 @@
+import atexit
 import logging
 import os
 import json
-import xml.etree.ElementTree as ET
-import xml.dom.minidom
-from logging.handlers import TimedRotatingFileHandler
+import queue
+import re
+from xml.sax.saxutils import escape
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+
+class _DeferredFlushMixin:
+    """まとめて書き出す間は flush を遅らせるハンドラ用の Mixin"""
+
+    deferred = False
+
+    def flush(self):
+        if not self.deferred:
+            super().flush()
+
+
+class _FileHandler(_DeferredFlushMixin, TimedRotatingFileHandler):
+    pass
+
+
+class _ConsoleHandler(_DeferredFlushMixin, logging.StreamHandler):
+    pass
+
+
+# XML 1.0 で使用できない制御文字
+_XML_ILLEGAL_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# XML ログファイルの先頭と末尾
+_XML_HEADER = '<?xml version="1.0" encoding="utf-8"?>\n<log>\n'
+_XML_FOOTER = "</log>\n"
+
+
+def _xml_text(value):
+    """XML の要素内に書き出せるよう文字列をエスケープする"""
+    return escape(_XML_ILLEGAL_CHARS.sub("", str(value)))
+
+
+class _XmlFileHandler(_FileHandler):
+    """
+    ログエントリを <log> 要素で囲み、ファイル単位で整形式の XML を書き出すハンドラ
+
+    ファイルを開くときに XML 宣言と開始タグを、閉じるとき (ローテーション時を
+    含む) に終了タグを書き出す。既存のファイルに追記する場合は末尾の終了タグを
+    取り除いてから追記する。
+    """
+
+    def _open(self):
+        path = self.baseFilename
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            footer = _XML_FOOTER.encode("utf-8")
+            with open(path, "rb+") as f:
+                f.seek(max(os.path.getsize(path) - len(footer), 0))
+                if f.read() == footer:
+                    f.seek(-len(footer), os.SEEK_END)
+                    f.truncate()
+            return super()._open()
+
+        stream = super()._open()
+        stream.write(_XML_HEADER)
+        return stream
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.stream and not self.stream.closed:
+                self.stream.write(_XML_FOOTER)
+        finally:
+            self.release()
+        super().close()
+
+    def doRollover(self):
+        if self.stream and not self.stream.closed:
+            self.stream.write(_XML_FOOTER)
+        super().doRollover()
+
+
+class _BoundedQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue, overflow: str = "drop"):
+        """
+        キューが満杯のときの動作を選べる QueueHandler
+
+        Parameters:
+        log_queue (queue.Queue): 上限付きのキュー
+        overflow (str): キューが満杯のときの動作。"drop" は WARNING 未満の
+            ログを破棄し (WARNING 以上は空くまで待つ)、"block" はすべてのログで
+            空くまで待つ
+        """
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.overflow == "drop" and record.levelno < logging.WARNING:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+            return
+        self.queue.put(record)
+
+
+class _BatchingQueueListener(QueueListener):
+    def __init__(self, log_queue: queue.Queue, *handlers, batch_size: int = 256):
+        """
+        キューに溜まったログをまとめて書き出し、バッチごとに1回だけ flush する
+        QueueListener
+
+        Parameters:
+        log_queue (queue.Queue): ログレコードのキュー
+        handlers: 書き出し先のハンドラ (_DeferredFlushMixin を継承したもの)
+        batch_size (int): 1回の書き出しでまとめる最大レコード数
+        """
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        # キューが満杯でも停止要求を失わないよう、空くまで待って追加する
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+
+            for handler in self.handlers:
+                handler.deferred = True
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                    continue
+                self.handle(record)
+            for handler in self.handlers:
+                handler.deferred = False
+                handler.flush()
+
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
 
 
 class TomaLogger:
@@ -13,7 +155,22 @@ class TomaLogger:
         log_dir="logs",
         level=logging.INFO,
         log_format="text",
+        async_mode=False,
+        queue_size=10000,
+        overflow="drop",
+        batch_size=256,
     ):
+        """
+        Parameters:
+        log_name (str): ログファイル名
+        log_dir (str): ログディレクトリ
+        level (int): ログレベル
+        log_format (str): ログ形式 ("text", "json", "xml")
+        async_mode (bool): True の場合、ログをキューに入れて別スレッドで書き出す
+        queue_size (int): 非同期モードのキューの上限
+        overflow (str): キューが満杯のときの動作 ("drop" または "block")
+        batch_size (int): 非同期モードで1回にまとめて書き出す最大レコード数
+        """
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(level)
         self.log_file = log_name  # テスト用に追加
@@ -33,7 +190,9 @@ class TomaLogger:
             )
 
         # ログファイルを日ごとにローテーション (エンコーディング指定)
-        file_handler = TimedRotatingFileHandler(
+        # XML 形式ではファイルごとに <log> 要素で囲む
+        handler_class = _XmlFileHandler if log_format == "xml" else _FileHandler
+        file_handler = handler_class(
             os.path.join(log_dir, log_name),
             when="D",
             interval=1,
@@ -44,13 +203,28 @@ class TomaLogger:
         file_handler.setLevel(level)
 
         # コンソールへの出力
-        console_handler = logging.StreamHandler()
+        console_handler = _ConsoleHandler()
         console_handler.setFormatter(formatter)
         console_handler.setLevel(level)
 
-        # ハンドラをロガーに追加
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        self.queue_handler = None
+        self.listener = None
+        if async_mode:
+            # 呼び出し元のスレッドではキューに入れるだけにし、
+            # ファイルとコンソールへの書き出しはリスナースレッドで行う
+            log_queue = queue.Queue(maxsize=queue_size)
+            self.queue_handler = _BoundedQueueHandler(log_queue, overflow)
+            self.queue_handler.setLevel(level)
+            self.listener = _BatchingQueueListener(
+                log_queue, file_handler, console_handler, batch_size=batch_size
+            )
+            self.listener.start()
+            self.logger.addHandler(self.queue_handler)
+            atexit.register(self.close)
+        else:
+            # ハンドラをロガーに追加
+            self.logger.addHandler(file_handler)
+            self.logger.addHandler(console_handler)
 
     def _get_json_formatter(self):
         """JSON形式でログをフォーマットする"""
@@ -72,27 +246,16 @@ class TomaLogger:
 
         class XmlFormatter(logging.Formatter):
             def format(self, record):
-                # ログエントリを作成
-                log_entry = ET.Element("entry")
-
-                timestamp = ET.SubElement(log_entry, "timestamp")
-                timestamp.text = self.formatTime(record, self.datefmt)
-
-                name = ET.SubElement(log_entry, "name")
-                name.text = record.name
-
-                level = ET.SubElement(log_entry, "level")
-                level.text = record.levelname
-
-                message = ET.SubElement(log_entry, "message")
-                message.text = record.getMessage()
-
-                # ElementTreeのXMLを文字列に変換し、minidomで整形
-                rough_string = ET.tostring(log_entry, encoding="unicode")
-                reparsed = xml.dom.minidom.parseString(rough_string)
-
-                # 整形されたXMLを返す（インデント付き）
-                return reparsed.toprettyxml(indent="  ")
+                # DOM を組み立てずに、エスケープした値を直接文字列に埋め込む
+                timestamp = _xml_text(self.formatTime(record, self.datefmt))
+                return (
+                    "  <entry>\n"
+                    f"    <timestamp>{timestamp}</timestamp>\n"
+                    f"    <name>{_xml_text(record.name)}</name>\n"
+                    f"    <level>{_xml_text(record.levelname)}</level>\n"
+                    f"    <message>{_xml_text(record.getMessage())}</message>\n"
+                    "  </entry>"
+                )
 
         return XmlFormatter()
 
@@ -111,3 +274,15 @@ class TomaLogger:
     def exception(self, message):
         """例外をキャッチしてログに記録"""
         self.logger.exception(message)
+
+    @property
+    def dropped(self):
+        """非同期モードでキューが満杯のため破棄したログの数"""
+        return self.queue_handler.dropped if self.queue_handler else 0
+
+    def close(self):
+        """非同期モードのキューに残っているログを書き出してリスナーを停止する"""
+        if self.listener is not None:
+            self.logger.removeHandler(self.queue_handler)
+            self.listener.stop()
+            self.listener = None
@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 
@@ -10,3 +12,44 @@ def pytest_addoption(parser):
 @pytest.fixture
 def skip_gui(request):
     return request.config.getoption("--skip-gui")
+
+
+@pytest.fixture
+def make_tree(tmp_path):
+    """
+    テスト用のディレクトリツリーを tmp_path の下に作成する関数を返す
+
+    関数には、ツリー内の相対パス (区切りは "/") から内容への辞書を渡す。
+    str はテキスト、bytes はバイナリのファイルとして書き込み、None は空の
+    ディレクトリを作成する。作成したツリーのルートを返す。
+    """
+
+    def make(spec: dict, name: str = "source"):
+        root = tmp_path / name
+        root.mkdir(parents=True, exist_ok=True)
+        for rel, content in spec.items():
+            path = root / rel
+            if content is None:
+                path.mkdir(parents=True, exist_ok=True)
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, bytes):
+                path.write_bytes(content)
+            else:
+                path.write_text(content)
+        return root
+
+    return make
+
+
+@pytest.fixture
+def source_tree(make_tree):
+    """テスト用のディレクトリツリーを作成"""
+    return make_tree(
+        {
+            "a.txt": "alpha",
+            "sub/b.bin": os.urandom(3 * 1024 * 1024 + 7),
+            "sub/deep/c.txt": "gamma",
+            "empty": None,
+        }
+    )
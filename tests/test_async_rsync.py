@@ -0,0 +1,163 @@
+import os
+import platform
+import time
+
+import pytest
+from mod.copy_support import mac_linux
+from mod.copy_support.async_rsync import AsyncRsyncRunner
+from mod.copy_support.concurrency import ConcurrencyController
+
+# --info=progress2 を出力し、同時に実行中の数を記録する rsync の代替スクリプト
+FAKE_RSYNC = """#!/bin/sh
+if [ "$1" = "--version" ]; then
+    echo "rsync  version 3.2.7  protocol version 31"
+    exit 0
+fi
+touch "$RSYNC_RUNNING/$$"
+ls "$RSYNC_RUNNING" | wc -l >> "$RSYNC_LOG"
+printf '        524,288  25%%    1.00MB/s    0:00:03 (xfr#1, to-chk=3/4)\\r'
+sleep "${RSYNC_SLEEP:-0.2}"
+printf '      2,097,152 100%%    2.00MB/s    0:00:00 (xfr#4, to-chk=0/4)\\n'
+rm "$RSYNC_RUNNING/$$"
+echo "failure output" >&2
+exit "${RSYNC_EXIT:-0}"
+"""
+
+
+@pytest.fixture
+def fake_rsync(tmp_path, monkeypatch):
+    """代替の rsync を PATH の先頭に置き、同時実行数のログのパスを返す"""
+    if platform.system() == "Windows":
+        pytest.skip("Mac/Linux環境でのみ実行可能なテスト")
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "rsync"
+    script.write_text(FAKE_RSYNC)
+    script.chmod(0o755)
+    running = tmp_path / "running"
+    running.mkdir()
+    log = tmp_path / "rsync.log"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("RSYNC_RUNNING", str(running))
+    monkeypatch.setenv("RSYNC_LOG", str(log))
+    monkeypatch.setattr(mac_linux, "_PROGRESS_INTERVAL", 0)
+    mac_linux._supports_progress2.cache_clear()
+    yield log
+    mac_linux._supports_progress2.cache_clear()
+
+
+def _jobs(tmp_path, count):
+    return [(str(tmp_path), str(tmp_path / f"dest{i}")) for i in range(count)]
+
+
+class TestAsyncRsyncRunner:
+    def test_progress_is_streamed_per_job(self, fake_rsync, tmp_path):
+        """子プロセスの進捗行が届いた順にジョブごとに報告されることをテスト"""
+        updates = {}
+
+        def progress_factory(src, limit):
+            index = len(updates)
+            updates[index] = []
+            return lambda *args, **kwargs: updates[index].append((args, kwargs))
+
+        results = AsyncRsyncRunner().run(
+            _jobs(tmp_path, 2), progress_factory=progress_factory
+        )
+
+        assert results == [True, True]
+        for job_updates in updates.values():
+            first_args, first_kwargs = job_updates[0]
+            assert first_args == (524288, 2097152, 25, 25)
+            assert first_kwargs == {"rate": 1024 * 1024, "eta": 3}
+            assert job_updates[-1][0][:3] == (2097152, 2097152, 100)
+
+    def test_concurrency_is_limited_per_device(self, fake_rsync, tmp_path):
+        """同じデバイスへの同時実行数が上限を超えないことをテスト"""
+        concurrency = ConcurrencyController(max_workers=2, autotune=False)
+
+        results = AsyncRsyncRunner().run(_jobs(tmp_path, 6), concurrency)
+
+        assert results == [True] * 6
+        counts = [int(line) for line in fake_rsync.read_text().split()]
+        assert len(counts) == 6
+        assert max(counts) == 2
+
+    def test_many_children_run_concurrently(self, fake_rsync, tmp_path):
+        """多数の子プロセスが1つのイベントループで同時に実行されることをテスト"""
+        concurrency = ConcurrencyController(max_workers=64, autotune=False)
+
+        started = time.monotonic()
+        results = AsyncRsyncRunner().run(_jobs(tmp_path, 48), concurrency)
+
+        assert results == [True] * 48
+        # 1つずつ実行すると 48 × 0.2 秒以上かかる
+        assert time.monotonic() - started < 48 * 0.2 / 2
+
+    def test_timeout_terminates_child(self, fake_rsync, tmp_path, monkeypatch):
+        """制限時間を過ぎた子プロセスが終了され、失敗として報告されることをテスト"""
+        monkeypatch.setenv("RSYNC_SLEEP", "30")
+        errors = []
+        runner = AsyncRsyncRunner(
+            lambda *args: errors.append(args), timeout=0.3, retries=1
+        )
+
+        started = time.monotonic()
+        results = runner.run(_jobs(tmp_path, 1))
+
+        assert results == [False]
+        assert time.monotonic() - started < 3
+        assert "0.3 秒以内に終了しませんでした" in errors[0][3]
+        assert errors[-1][3] == "コピーに失敗しました。"
+
+    def test_timeout_reports_attempt(self, fake_rsync, tmp_path, monkeypatch):
+        """リトライ後の制限時間超過が実際の試行回数で報告されることをテスト"""
+        monkeypatch.setenv("RSYNC_SLEEP", "30")
+        errors = []
+        runner = AsyncRsyncRunner(
+            lambda *args: errors.append(args), timeout=0.2, retries=2
+        )
+
+        assert runner.run(_jobs(tmp_path, 1)) == [False]
+
+        timeouts = [error[1] for error in errors if "秒以内に" in error[3]]
+        assert timeouts == [1, 2]
+
+    def test_missing_rsync_is_reported(self, tmp_path, monkeypatch):
+        """rsync を起動できない場合にエラーとして報告されることをテスト"""
+        if platform.system() == "Windows":
+            pytest.skip("Mac/Linux環境でのみ実行可能なテスト")
+        monkeypatch.setenv("PATH", str(tmp_path / "empty"))
+        mac_linux._supports_progress2.cache_clear()
+        errors = []
+        runner = AsyncRsyncRunner(lambda *args: errors.append(args), retries=2)
+
+        try:
+            assert runner.run(_jobs(tmp_path, 1)) == [False]
+        finally:
+            mac_linux._supports_progress2.cache_clear()
+
+        assert [(error[1], error[2]) for error in errors] == [
+            (1, 2),
+            (1, 2),
+            (2, 2),
+            (2, 2),
+        ]
+        assert "rsync" in errors[0][3]
+        assert errors[-1][3] == "コピーに失敗しました。"
+
+    def test_failure_reports_stderr_and_retries(self, fake_rsync, tmp_path, monkeypatch):
+        """失敗した rsync の標準エラーが報告され、リトライされることをテスト"""
+        monkeypatch.setenv("RSYNC_EXIT", "23")
+        monkeypatch.setenv("RSYNC_SLEEP", "0")
+        errors = []
+        runner = AsyncRsyncRunner(lambda *args: errors.append(args), retries=2)
+
+        assert runner.run(_jobs(tmp_path, 1)) == [False]
+
+        messages = [error[3] for error in errors]
+        assert messages == [
+            "failure output\n",
+            "リトライ中...",
+            "failure output\n",
+            "コピーに失敗しました。",
+        ]
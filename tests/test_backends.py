@@ -0,0 +1,285 @@
+import os
+import pathlib
+import sys
+
+import pytest
+from mod.copy_support import backends
+from mod.copy_support.__main__ import main
+from mod.copy_support.batch import CopyBatch
+from mod.copy_support.backends import (
+    choose_backend,
+    default_backend,
+    filesystem_type,
+    get_backend,
+)
+from mod.copy_support.main import CopyManager
+from mod.copy_support.native import LARGE_FILE_THRESHOLD, NativeCopy
+from mod.copy_support.reflink import ReflinkCopy, cp_supports_reflink
+from mod.copy_support.scan import TreeSize
+
+
+@pytest.fixture
+def local_filesystems(monkeypatch):
+    """コピー元・コピー先を reflink に対応しないローカルのファイルシステムとみなす"""
+    monkeypatch.setattr(backends, "filesystem_type", lambda path: "ext4")
+
+
+class TestRegistry:
+    def test_unknown_engine_is_rejected(self):
+        """登録されていないエンジン名はエラーになることをテスト"""
+        with pytest.raises(ValueError, match="不明なコピーエンジンです"):
+            CopyManager(engine="unknown")
+        with pytest.raises(ValueError):
+            get_backend("unknown")
+
+    def test_default_falls_back_to_native(self):
+        """プラットフォーム標準のツールがない場合は native を使うことをテスト"""
+        assert default_backend(frozenset({"native"})) == "native"
+        assert default_backend(frozenset({"native", "rsync", "robocopy"})) in (
+            "rsync",
+            "robocopy",
+        )
+
+    def test_registered_backend_is_selectable(self, source_tree, tmp_path):
+        """登録したバックエンドを engine に指定できることをテスト"""
+        created = []
+
+        def factory(*args, **kwargs):
+            handler = NativeCopy(*args, **kwargs)
+            created.append(handler)
+            return handler
+
+        backends.register_backend("test", factory, lambda: True)
+        try:
+            assert "test" in backends.available_backends()
+            manager = CopyManager(engine="test")
+            assert manager.copy(str(source_tree), str(tmp_path / "dest"))
+        finally:
+            del backends._BACKENDS["test"]
+            backends.backend_available.cache_clear()
+            backends.available_backends.cache_clear()
+        assert created
+        assert (tmp_path / "dest" / "a.txt").read_text() == "alpha"
+
+    @pytest.mark.skipif(
+        not sys.platform.startswith("linux"), reason="/proc を使用するテスト"
+    )
+    def test_auto_probes_only_default_tool(self, monkeypatch):
+        """auto の初期化では標準のツールだけを調べることをテスト"""
+        probed = []
+        registry = {
+            name: backends.Backend(
+                name,
+                backend.factory,
+                lambda name=name: probed.append(name) or True,
+                backend.description,
+                backend.incremental,
+            )
+            for name, backend in backends._BACKENDS.items()
+        }
+        monkeypatch.setattr(backends, "_BACKENDS", registry)
+        backends.backend_available.cache_clear()
+        try:
+            manager = CopyManager()
+        finally:
+            backends.backend_available.cache_clear()
+        assert probed == [manager.default_backend]
+
+    def test_filesystem_type(self, tmp_path):
+        """存在しないパスも親ディレクトリのファイルシステムで判定することをテスト"""
+        assert filesystem_type(str(tmp_path))
+        assert filesystem_type(str(tmp_path / "missing" / "dest")) == (
+            filesystem_type(str(tmp_path))
+        )
+
+
+class TestChooseBackend:
+    available = frozenset({"native", "rsync", "robocopy", "reflink"})
+
+    def test_reflink_on_same_filesystem(self, tmp_path, monkeypatch):
+        """reflink に対応した同じファイルシステム内では reflink を選ぶことをテスト"""
+        monkeypatch.setattr(backends, "filesystem_type", lambda path: "btrfs")
+
+        assert (
+            choose_backend(str(tmp_path), str(tmp_path / "dest"), None, self.available)
+            == "reflink"
+        )
+        # cp が --reflink に対応していなければ選ばない
+        assert choose_backend(
+            str(tmp_path), str(tmp_path / "dest"), None, self.available - {"reflink"}
+        ) == default_backend(self.available)
+
+    def test_native_for_extreme_size_mixes(self, tmp_path, local_filesystems):
+        """大きなファイル中心、小さなファイル多数のツリーでは native を選ぶことをテスト"""
+        src, dest = str(tmp_path), str(tmp_path / "dest")
+        large = TreeSize(files=2, size=4 * LARGE_FILE_THRESHOLD)
+        small = TreeSize(files=5000, size=5000 * 1024)
+        mixed = TreeSize(files=100, size=100 * 1024 * 1024)
+
+        assert choose_backend(src, dest, large, self.available) == "native"
+        assert choose_backend(src, dest, small, self.available) == "native"
+        assert choose_backend(src, dest, mixed, self.available) == default_backend(
+            self.available
+        )
+        # サイズが分からなければプラットフォーム標準のツールを使う
+        assert choose_backend(src, dest, None, self.available) == default_backend(
+            self.available
+        )
+
+    def test_network_destination_uses_default(self, tmp_path, monkeypatch):
+        """ネットワーク越しのコピー先には外部ツールを使うことをテスト"""
+        monkeypatch.setattr(
+            backends,
+            "filesystem_type",
+            lambda path: "nfs4" if "nas" in path else "ext4",
+        )
+        large = TreeSize(files=2, size=4 * LARGE_FILE_THRESHOLD)
+
+        assert choose_backend(
+            str(tmp_path), str(tmp_path / "nas"), large, self.available
+        ) == default_backend(self.available)
+
+    def test_incremental_excludes_reflink_and_tar(self, tmp_path, monkeypatch):
+        """同期・再開やメタデータキャッシュの使用時は reflink/tar を選ばないことをテスト"""
+        monkeypatch.setattr(backends, "filesystem_type", lambda path: "btrfs")
+        src, dest = str(tmp_path), str(tmp_path / "dest")
+        small = TreeSize(files=5000, size=5000 * 1024)
+        available = self.available | {"tar"}
+
+        assert choose_backend(src, dest, None, available) == "reflink"
+        assert choose_backend(
+            src, dest, None, available, incremental=True
+        ) == default_backend(available)
+        monkeypatch.setattr(backends, "filesystem_type", lambda path: "ext4")
+        assert choose_backend(src, dest, small, available) == "tar"
+        assert choose_backend(src, dest, small, available, incremental=True) == (
+            "native"
+        )
+
+    def test_unknown_filesystem_uses_default(self, tmp_path, monkeypatch):
+        """ファイルシステムを判定できない場合 (Linux 以外) は標準のツールを使うことをテスト"""
+        monkeypatch.setattr(backends, "filesystem_type", lambda path: None)
+        src, dest = str(tmp_path), str(tmp_path / "dest")
+        large = TreeSize(files=2, size=4 * LARGE_FILE_THRESHOLD)
+        small = TreeSize(files=5000, size=5000 * 1024)
+        available = self.available | {"tar"}
+
+        assert choose_backend(src, dest, large, available) == default_backend(
+            available
+        )
+        assert choose_backend(src, dest, small, available) == default_backend(
+            available
+        )
+
+
+class TestCopyManagerSelection:
+    def test_copy_many_selects_backend_per_pair(
+        self, source_tree, tmp_path, monkeypatch
+    ):
+        """copy_many がコピー元・コピー先の組ごとにバックエンドを選ぶことをテスト"""
+        chosen = {}
+
+        def fake_choose(src, dest, tree=None, available=None, incremental=False):
+            backend = "reflink" if dest.endswith("fast") else "native"
+            chosen[dest] = backend
+            return backend
+
+        monkeypatch.setattr("mod.copy_support.main.choose_backend", fake_choose)
+        manager = CopyManager()
+        jobs = [
+            (str(source_tree), str(tmp_path / "fast")),
+            (str(source_tree), str(tmp_path / "slow")),
+        ]
+        if not cp_supports_reflink():
+            jobs = jobs[1:]
+
+        assert manager.copy_many(jobs, max_workers=2) == [True] * len(jobs)
+        for _, dest in jobs:
+            assert (pathlib.Path(dest) / "sub" / "b.bin").read_bytes() == (
+                source_tree / "sub" / "b.bin"
+            ).read_bytes()
+        assert set(chosen.values()) <= set(manager._handlers)
+
+    def test_existing_destination_is_copied_incrementally(
+        self, source_tree, tmp_path, monkeypatch
+    ):
+        """既存のコピー先やメタデータキャッシュの使用時は incremental で選ぶことをテスト"""
+        calls = []
+
+        def fake_choose(src, dest, tree=None, available=None, incremental=False):
+            calls.append((os.path.basename(dest), incremental))
+            return "native"
+
+        monkeypatch.setattr("mod.copy_support.main.choose_backend", fake_choose)
+        (tmp_path / "existing").mkdir()
+        manager = CopyManager()
+        manager.backend_for(str(source_tree), str(tmp_path / "existing"))
+        manager.backend_for(str(source_tree), str(tmp_path / "fresh"))
+        manager.set_stat_cache(object())
+        manager.backend_for(str(source_tree), str(tmp_path / "cached"))
+
+        assert calls == [("existing", True), ("fresh", False), ("cached", True)]
+
+    def test_explicit_non_incremental_engine_is_reported(self, tmp_path):
+        """同期に reflink/tar を指定した場合はジャーナルなどを使わないことを通知するテスト"""
+        messages = []
+
+        CopyBatch(
+            [str(tmp_path / "src")],
+            str(tmp_path / "dest"),
+            engine="tar",
+            sync=True,
+            message_callback=messages.append,
+        )
+
+        assert messages == [
+            "Engine 'tar' does not use the journal or stat cache: "
+            "existing destinations are not skipped file by file."
+        ]
+
+    def test_explicit_engine_is_not_chosen(self, source_tree, tmp_path, monkeypatch):
+        """engine を指定した場合は自動選択しないことをテスト"""
+        monkeypatch.setattr(
+            "mod.copy_support.main.choose_backend",
+            lambda *args, **kwargs: pytest.fail("choose_backend が呼ばれました"),
+        )
+        manager = CopyManager(engine="native")
+
+        assert manager.backend_for(str(source_tree), str(tmp_path)) == "native"
+        assert isinstance(manager.copy_handler, NativeCopy)
+
+    def test_command_line_engine(self, source_tree, tmp_path):
+        """--engine に登録されたバックエンドの名前を指定できることをテスト"""
+        exit_code = main(
+            [str(source_tree), "-d", str(tmp_path / "backup"), "--engine", "native"]
+        )
+
+        assert exit_code == 0
+        assert (tmp_path / "backup" / "source" / "a.txt").read_text() == "alpha"
+
+
+@pytest.mark.skipif(not cp_supports_reflink(), reason="cp --reflink がない")
+class TestReflinkCopy:
+    def test_copy_directory(self, source_tree, tmp_path):
+        """ディレクトリの中身がコピー先にコピーされることをテスト"""
+        progress = []
+        copier = ReflinkCopy(lambda *args: progress.append(args))
+
+        assert copier.copy(str(source_tree), str(tmp_path / "dest"))
+        assert (tmp_path / "dest" / "a.txt").read_text() == "alpha"
+        assert (tmp_path / "dest" / "sub" / "b.bin").read_bytes() == (
+            source_tree / "sub" / "b.bin"
+        ).read_bytes()
+        assert progress[-1] == (1, 1, 100, 100)
+
+    def test_failure_is_retried(self, tmp_path):
+        """コピーに失敗した場合にリトライしてエラーを報告することをテスト"""
+        blocker = tmp_path / "blocker"
+        blocker.write_text("not a directory")
+        src = tmp_path / "file.txt"
+        src.write_text("content")
+        errors = []
+        copier = ReflinkCopy(error_callback=lambda *args: errors.append(args))
+
+        assert not copier.copy(str(src), str(blocker / "dest"), retries=2)
+        assert errors[-1][3] == "コピーに失敗しました。"
@@ -0,0 +1,169 @@
+import os
+import platform
+import threading
+import time
+
+import pytest
+from mod.copy_support import mac_linux
+from mod.copy_support.cancel import CancelToken, CopyCancelled
+from mod.copy_support.main import CopyManager
+from mod.copy_support.native import NativeCopy, _copy_file_data
+
+# 終了されるまで待ち続ける rsync の代替スクリプト
+SLOW_RSYNC = """#!/bin/sh
+if [ "$1" = "--version" ]; then
+    echo "rsync  version 3.2.7  protocol version 31"
+    exit 0
+fi
+touch "$RSYNC_STARTED/$$"
+exec sleep 30
+"""
+
+
+@pytest.fixture
+def slow_rsync(tmp_path, monkeypatch):
+    """終了しない rsync を PATH の先頭に置く"""
+    if platform.system() == "Windows":
+        pytest.skip("Mac/Linux環境でのみ実行可能なテスト")
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_rsync = bin_dir / "rsync"
+    fake_rsync.write_text(SLOW_RSYNC)
+    fake_rsync.chmod(0o755)
+    started = tmp_path / "started"
+    started.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("RSYNC_STARTED", str(started))
+    mac_linux._supports_progress2.cache_clear()
+    yield started
+    mac_linux._supports_progress2.cache_clear()
+
+
+def _wait_for_rsync(started, count: int):
+    for _ in range(200):
+        if len(os.listdir(started)) >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError("rsync が起動しませんでした")
+
+
+@pytest.fixture
+def source_tree(make_tree):
+    """コピーの途中で中断できる程度のファイル数のツリーを作成"""
+    return make_tree({f"file{i:02d}.bin": os.urandom(200 * 1024) for i in range(20)})
+
+
+class TestCancel:
+    def test_copy_loop_stops_at_chunk_boundary(self, tmp_path):
+        """キャンセルされるとデータのコピーループが中断されることをテスト"""
+        src = tmp_path / "src.bin"
+        src.write_bytes(os.urandom(1024))
+        token = CancelToken()
+        token.cancel()
+
+        with open(src, "rb") as s, open(tmp_path / "dst.bin", "wb") as d:
+            with pytest.raises(CopyCancelled):
+                _copy_file_data(s.fileno(), d.fileno(), cancel=token)
+
+    def test_cancelled_native_copy_leaves_no_partial_files(self, source_tree, tmp_path):
+        """中断されたコピーが失敗として返され、一時ファイルを残さないことをテスト"""
+        errors = []
+        copier = NativeCopy(error_callback=lambda *args: errors.append(args))
+        copied = []
+
+        def on_file(path, size):
+            copied.append(path)
+            copier.cancel()
+
+        copier.set_file_callback(on_file)
+        dest = tmp_path / "dest"
+
+        assert copier.copy(str(source_tree), str(dest)) is False
+        assert len(copied) == 1
+        assert not [name for name in os.listdir(dest) if "copyman-tmp" in name]
+        # キャンセルはエラーとして報告せず、リトライもしない
+        assert errors == []
+
+    def test_parallel_native_copy_drops_pending_tasks(self, source_tree, tmp_path):
+        """並列コピーでキャンセル後のタスクが実行されないことをテスト"""
+        errors = []
+        manager = CopyManager(None, lambda *args: errors.append(args), engine="native")
+        copied = []
+
+        def on_file(path, size):
+            copied.append(path)
+            manager.cancel()
+
+        manager.set_file_callback(on_file)
+        other = tmp_path / "other"
+        other.mkdir()
+        (other / "x.txt").write_text("x")
+
+        jobs = [
+            (str(source_tree), str(tmp_path / "d1")),
+            (str(other), str(tmp_path / "d2")),
+        ]
+        results = manager.copy_many(jobs, max_workers=1)
+
+        assert results == [False, False]
+        assert len(copied) < 20
+        assert errors == []
+
+    @pytest.mark.parametrize("engine", ["native", "reflink"])
+    def test_interrupted_wait_cancels_running_copies(
+        self, source_tree, tmp_path, monkeypatch, engine
+    ):
+        """copy_many の待機が Ctrl+C で中断された場合に実行中のコピーを止めることをテスト"""
+
+        def interrupted(*args):
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr("mod.copy_support.scheduler.feed_per_device", interrupted)
+        monkeypatch.setattr("mod.copy_support.main.feed_per_device", interrupted)
+        manager = CopyManager(engine=engine)
+
+        with pytest.raises(KeyboardInterrupt):
+            manager.copy_many([(str(source_tree), str(tmp_path / "dest"))])
+        assert manager.cancel_token.cancelled
+
+    def test_rsync_is_terminated(self, slow_rsync, tmp_path):
+        """実行中の rsync がキャンセルで終了されることをテスト"""
+        errors = []
+        copier = mac_linux.MacLinuxCopy(
+            error_callback=lambda *args: errors.append(args)
+        )
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(
+                copier.copy(str(tmp_path), str(tmp_path / "dest"))
+            )
+        )
+        thread.start()
+        _wait_for_rsync(slow_rsync, 1)
+
+        started = time.monotonic()
+        copier.cancel()
+        thread.join(timeout=5)
+
+        assert not thread.is_alive()
+        assert time.monotonic() - started < 2
+        assert result == [False]
+        assert errors == []
+
+    def test_pending_rsync_jobs_are_not_started(self, slow_rsync, tmp_path):
+        """キャンセル後に実行待ちの rsync が起動されないことをテスト"""
+        manager = CopyManager(engine="rsync")
+        jobs = [(str(tmp_path), str(tmp_path / f"dest{i}")) for i in range(3)]
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(manager.copy_many(jobs, max_workers=1))
+        )
+        thread.start()
+        _wait_for_rsync(slow_rsync, 1)
+
+        manager.cancel()
+        thread.join(timeout=5)
+
+        assert not thread.is_alive()
+        assert result == [[False, False, False]]
+        assert len(os.listdir(slow_rsync)) == 1
@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+from mod.copy_support.__main__ import main
+
+
+class TestCommandLine:
+    def test_copy_from_history_with_json_output(self, tmp_path, capsys):
+        """履歴ファイルのコピー元がコピーされ、JSON Lines で進捗が出力されることをテスト"""
+        source = tmp_path / "source"
+        source.mkdir()
+        (source / "test.txt").write_text("test content")
+        history = tmp_path / "history.json"
+        history.write_text(json.dumps([str(source)]))
+        dest = tmp_path / "dest"
+
+        exit_code = main(
+            ["--history", str(history), "-d", str(dest), "--engine", "native", "--json"]
+        )
+
+        assert exit_code == 0
+        assert (dest / "source" / "test.txt").read_text() == "test content"
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert {"event": "finished", "succeeded": True} == records[-1]
+        assert any(record["event"] == "progress" for record in records)
+
+    def test_does_not_import_qt(self):
+        """コマンドラインのエントリポイントが PyQt6 を読み込まないことをテスト"""
+        code = "import sys, mod.copy_support.__main__; print('PyQt6' in sys.modules)"
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=repo_root,
+        )
+        assert result.stdout.strip() == "False"
+
+    def test_startup_does_not_load_copy_modules(self):
+        """--help の表示に必要ないモジュール (asyncio やコピーの実行部) を読み込まないことをテスト"""
+        code = (
+            "import sys, mod.copy_support.__main__; "
+            "print(sorted({'asyncio', 'mod.copy_support.batch', "
+            "'mod.copy_support.main'} & set(sys.modules)))"
+        )
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=repo_root,
+        )
+        assert result.stdout.strip() == "[]"
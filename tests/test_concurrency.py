@@ -0,0 +1,110 @@
+import threading
+import time
+
+from mod.copy_support.concurrency import (
+    ConcurrencyController,
+    DeviceLimit,
+    device_key,
+    feed_per_device,
+    group_by_device,
+)
+
+
+class TestDeviceLimit:
+    def test_additive_increase_multiplicative_decrease(self):
+        """スループットが上がれば上限を1増やし、下がれば半分にすることをテスト"""
+        limit = DeviceLimit(min_workers=1, max_workers=16)
+        assert limit.limit == 8
+
+        limit.observe(100.0)
+        assert limit.limit == 9
+        limit.observe(150.0)
+        assert limit.limit == 10
+        # 誤差の範囲の変化では上限を変えない
+        limit.observe(152.0)
+        assert limit.limit == 10
+        limit.observe(50.0)
+        assert limit.limit == 5
+
+    def test_limit_stays_within_bounds(self):
+        """上限が min_workers と max_workers の範囲に収まることをテスト"""
+        limit = DeviceLimit(min_workers=2, max_workers=3)
+        for throughput in (1.0, 2.0, 4.0, 8.0):
+            limit.observe(throughput)
+        assert limit.limit == 3
+        for throughput in (4.0, 2.0, 1.0, 0.5):
+            limit.observe(throughput)
+        assert limit.limit == 2
+
+    def test_fixed_limit_without_autotune(self):
+        """自動調整を無効にすると上限が max_workers で固定されることをテスト"""
+        limit = DeviceLimit(min_workers=1, max_workers=4, autotune=False, window=0)
+        limit.record(10**9)
+        assert limit.limit == 4
+
+    def test_acquire_blocks_at_limit(self):
+        """同時コピー数が上限に達すると枠の確保を待つことをテスト"""
+        limit = DeviceLimit(min_workers=1, max_workers=1, autotune=False)
+        limit.acquire()
+        acquired = threading.Event()
+
+        def worker():
+            limit.acquire()
+            acquired.set()
+            limit.release()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        time.sleep(0.05)
+        assert not acquired.is_set()
+        limit.release()
+        thread.join(timeout=1)
+        assert acquired.is_set()
+
+
+class TestConcurrencyController:
+    def test_limit_per_device_pair(self):
+        """デバイスの組ごとに別の上限が管理されることをテスト"""
+        controller = ConcurrencyController(max_workers=4)
+        first = controller.limit_for((1, 2))
+        assert controller.limit_for((1, 2)) is first
+        assert controller.limit_for((3, 2)) is not first
+        assert controller.limits() == {(1, 2): 2, (3, 2): 2}
+
+    def test_device_key_for_missing_dest(self, tmp_path):
+        """存在しないコピー先は親ディレクトリのデバイスを使うことをテスト"""
+        src = tmp_path / "src"
+        src.mkdir()
+        key = device_key(str(src), str(tmp_path / "missing" / "dest"))
+        assert key == (src.stat().st_dev, tmp_path.stat().st_dev)
+
+    def test_group_by_device_keeps_order(self, tmp_path):
+        """同じデバイス上のジョブが順序を保ってまとめられることをテスト"""
+        jobs = []
+        for name in ("a", "b", "c"):
+            (tmp_path / name).mkdir()
+            jobs.append((str(tmp_path / name), str(tmp_path / "dest" / name)))
+
+        groups = group_by_device(jobs)
+
+        assert list(groups.values()) == [
+            [(index, src, dest) for index, (src, dest) in enumerate(jobs)]
+        ]
+
+    def test_devices_are_fed_concurrently(self):
+        """あるデバイスのキューが詰まっていても別のデバイスが進むことをテスト"""
+        controller = ConcurrencyController(max_workers=1, autotune=False)
+        other_device_ran = threading.Event()
+
+        def feed(limit, entries):
+            for _, src, _ in entries:
+                if src == "slow":
+                    # 別デバイスのキューが同時に処理されなければタイムアウトする
+                    assert other_device_ran.wait(timeout=2)
+                else:
+                    other_device_ran.set()
+
+        feed_per_device(
+            {(1, 9): [(0, "slow", "x")], (2, 9): [(1, "fast", "y")]}, controller, feed
+        )
+        assert other_device_ran.is_set()
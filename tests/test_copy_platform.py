@@ -35,3 +35,58 @@ def test_mac_linux_copy(tmp_path):
 
     # テスト実装（同様の構造）
     pass
+
+
+# --info=progress2 を模倣する rsync の代替スクリプト
+FAKE_RSYNC = """#!/bin/sh
+if [ "$1" = "--version" ]; then
+    echo "rsync  version 3.2.7  protocol version 31"
+    exit 0
+fi
+printf '        524,288  25%%    1.00MB/s    0:00:03 (xfr#1, to-chk=3/4)\\r'
+printf '      2,097,152 100%%    2.00MB/s    0:00:00 (xfr#4, to-chk=0/4)\\n'
+"""
+
+
+def test_mac_linux_streaming_progress(tmp_path, monkeypatch):
+    """rsync の progress2 出力がバイト単位の進捗として報告されることをテスト"""
+    if platform.system() == "Windows":
+        pytest.skip("Mac/Linux環境でのみ実行可能なテスト")
+
+    from mod.copy_support import mac_linux
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_rsync = bin_dir / "rsync"
+    fake_rsync.write_text(FAKE_RSYNC)
+    fake_rsync.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(mac_linux, "_PROGRESS_INTERVAL", 0)
+    mac_linux._supports_progress2.cache_clear()
+
+    updates = []
+
+    def progress_callback(current, total, current_percent, total_percent, rate, eta):
+        updates.append((current, total, current_percent, rate, eta))
+
+    try:
+        MacLinuxCopy(progress_callback).copy(str(tmp_path), str(tmp_path / "dest"))
+    finally:
+        mac_linux._supports_progress2.cache_clear()
+
+    assert updates[0] == (524288, 2097152, 25, 1024 * 1024, 3)
+    assert updates[-1][:3] == (2097152, 2097152, 100)
+
+
+def test_parse_progress2():
+    """progress2 の出力行の解析をテスト"""
+    from mod.copy_support.mac_linux import _parse_progress2
+
+    assert _parse_progress2("  1,000  10%  1.50kB/s  1:02:03 (xfr#1)") == (
+        1000,
+        10000,
+        10,
+        1536.0,
+        3723,
+    )
+    assert _parse_progress2("sending incremental file list") is None
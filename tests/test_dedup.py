@@ -0,0 +1,207 @@
+import os
+
+import pytest
+from mod.copy_support.batch import CopyBatch
+from mod.copy_support.dedup import DedupIndex, HashCache
+from mod.copy_support.native import NativeCopy
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    """ハッシュキャッシュをテスト用のディレクトリに作成する"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("LOCALAPPDATA", str(tmp_path / "cache"))
+
+
+def _write(path, data, mtime_ns=1_600_000_000_000_000_000):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class TestDedup:
+    def test_duplicates_across_sources_are_linked(self, tmp_path):
+        """コピー元どうしで同じ内容のファイルがコピーされずリンクされることをテスト"""
+        data = os.urandom(512 * 1024)
+        _write(tmp_path / "snap1" / "big.bin", data)
+        _write(tmp_path / "snap2" / "sub" / "same.bin", data)
+        dest = tmp_path / "dest"
+
+        batch = CopyBatch(
+            [str(tmp_path / "snap1"), str(tmp_path / "snap2")],
+            str(dest),
+            engine="native",
+            dedup=True,
+        )
+
+        assert batch.run()
+        first = dest / "snap1" / "big.bin"
+        second = dest / "snap2" / "sub" / "same.bin"
+        assert second.read_bytes() == data
+        assert second.stat().st_mtime_ns == first.stat().st_mtime_ns
+        # reflink できないファイルシステムではハードリンクになる
+        assert first.stat().st_ino == second.stat().st_ino or (
+            first.stat().st_nlink == 1
+        )
+        assert batch.dedup.linked_files == 1
+        assert batch.dedup.linked_bytes == len(data)
+
+    def test_auto_engine_links_sources_copied_natively(self, tmp_path, monkeypatch):
+        """engine="auto" でも native が選ばれたコピー元ではリンクすることをテスト"""
+        monkeypatch.setattr(
+            "mod.copy_support.main.choose_backend",
+            lambda *args, **kwargs: "native",
+        )
+        data = os.urandom(512 * 1024)
+        _write(tmp_path / "snap1" / "big.bin", data)
+        _write(tmp_path / "snap2" / "same.bin", data)
+
+        batch = CopyBatch(
+            [str(tmp_path / "snap1"), str(tmp_path / "snap2")],
+            str(tmp_path / "dest"),
+            dedup=True,
+        )
+
+        assert batch.run()
+        assert batch.dedup.linked_files == 1
+
+    def test_other_backends_report_dedup_skipped(self, tmp_path, monkeypatch):
+        """リンクに対応しないバックエンドでコピーするコピー元を通知することをテスト"""
+        monkeypatch.setattr(
+            "mod.copy_support.main.choose_backend",
+            lambda src, *args, **kwargs: (
+                "reflink" if src.endswith("snap2") else "native"
+            ),
+        )
+        messages = []
+        jobs = [
+            (str(tmp_path / name), str(tmp_path / "dest" / name))
+            for name in ("snap1", "snap2")
+        ]
+
+        batch = CopyBatch(
+            [src for src, _ in jobs],
+            str(tmp_path / "dest"),
+            dedup=True,
+            message_callback=messages.append,
+        )
+        batch._report_dedup_skipped(jobs)
+
+        assert messages == [
+            f"Not linking duplicates in {tmp_path / 'snap2'}: copying with reflink."
+        ]
+
+    def test_unsupported_engine_reports_dedup_ignored(self, tmp_path):
+        """リンクに対応しないエンジンを指定した場合は無視したことを通知することをテスト"""
+        messages = []
+
+        batch = CopyBatch(
+            [str(tmp_path / "src")],
+            str(tmp_path / "dest"),
+            engine="rsync",
+            dedup=True,
+            message_callback=messages.append,
+        )
+
+        assert batch.dedup is None
+        assert messages == [
+            "Duplicate linking is ignored: engine 'rsync' does not support it."
+        ]
+
+    def test_same_size_different_content_is_copied(self, tmp_path):
+        """先頭が同じでも内容が異なるファイルはコピーされることをテスト"""
+        data = os.urandom(512 * 1024)
+        changed = data[:-1] + bytes([data[-1] ^ 0xFF])
+        _write(tmp_path / "src" / "a.bin", data)
+        _write(tmp_path / "src" / "b.bin", changed)
+
+        index = DedupIndex()
+        copier = NativeCopy()
+        copier.set_dedup(index)
+        copier.copy(str(tmp_path / "src"), str(tmp_path / "dest"))
+
+        assert (tmp_path / "dest" / "b.bin").read_bytes() == changed
+        assert index.linked_files == 0
+
+    def test_hardlink_requires_same_metadata(self, tmp_path):
+        """更新日時が異なる重複ファイルは属性を共有するハードリンクにしないことをテスト"""
+        data = os.urandom(256 * 1024)
+        _write(tmp_path / "src" / "a.bin", data, mtime_ns=1_000_000_000_000_000_000)
+        _write(tmp_path / "src" / "b.bin", data, mtime_ns=2_000_000_000_000_000_000)
+
+        copier = NativeCopy()
+        copier.set_dedup(DedupIndex())
+        copier.copy(str(tmp_path / "src"), str(tmp_path / "dest"))
+
+        a = (tmp_path / "dest" / "a.bin").stat()
+        b = (tmp_path / "dest" / "b.bin").stat()
+        assert a.st_ino != b.st_ino or a.st_nlink == 1
+        assert b.st_mtime_ns == 2_000_000_000_000_000_000
+        assert (tmp_path / "dest" / "b.bin").read_bytes() == data
+
+    def test_hash_cache_is_reused_across_runs(self, tmp_path):
+        """ハッシュ値が (inode, 更新日時, サイズ) をキーに保存・再利用されることをテスト"""
+        path = tmp_path / "file.bin"
+        _write(path, os.urandom(256 * 1024))
+        st = path.stat()
+        cache_path = tmp_path / "hashes.jsonl"
+
+        cache = HashCache(str(cache_path))
+        digest = DedupIndex(cache)._digest(str(path), st, "full")
+        cache.close()
+
+        reloaded = HashCache(str(cache_path))
+        assert reloaded.get(st, "full") == digest
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+        assert reloaded.get(path.stat(), "full") is None
+        reloaded.close()
+
+        # アルゴリズムが異なるキャッシュは破棄される
+        other = HashCache(str(cache_path), algorithm="other")
+        assert other.get(st, "full") is None
+        other.close()
+
+    def test_hash_cache_is_compacted_on_load(self, tmp_path):
+        """古い値と書き込み途中の行を読み込み時に書き直して捨てることをテスト"""
+        path = tmp_path / "file.bin"
+        _write(path, b"x" * 1024)
+        cache_path = tmp_path / "hashes.jsonl"
+
+        cache = HashCache(str(cache_path))
+        for n in range(5):
+            os.utime(path, ns=(n, n))
+            cache.put(path.stat(), "full", f"digest{n}")
+        cache.close()
+        with open(cache_path, "a", encoding="utf-8") as f:
+            f.write('{"key": [1, ')
+
+        reloaded = HashCache(str(cache_path))
+        reloaded.close()
+
+        lines = cache_path.read_text(encoding="utf-8").splitlines()
+        assert len(lines) == 2
+        assert reloaded.get(path.stat(), "full") == "digest4"
+
+    def test_hash_cache_is_capped(self, tmp_path):
+        """max_entries を超えたレコードは古いものから捨てることをテスト"""
+        cache_path = tmp_path / "hashes.jsonl"
+        paths = []
+        cache = HashCache(str(cache_path), max_entries=3)
+        for n in range(5):
+            path = tmp_path / f"f{n}.bin"
+            _write(path, b"x")
+            paths.append(path)
+            cache.put(path.stat(), "full", f"digest{n}")
+        cache.close()
+
+        reloaded = HashCache(str(cache_path), max_entries=3)
+        reloaded.close()
+
+        assert [reloaded.get(p.stat(), "full") for p in paths] == [
+            None,
+            None,
+            "digest2",
+            "digest3",
+            "digest4",
+        ]
+        assert len(cache_path.read_text(encoding="utf-8").splitlines()) == 4
@@ -0,0 +1,217 @@
+import errno
+import os
+import sys
+
+import pytest
+from mod.copy_support import fanout
+from mod.copy_support.__main__ import main
+from mod.copy_support.batch import CopyBatch
+from mod.copy_support.fanout import FanoutCopy
+from mod.copy_support.journal import JOURNAL_NAME
+from mod.copy_support.main import CopyManager
+
+
+@pytest.fixture
+def source_tree(make_tree):
+    """空のファイルとシンボリックリンクを含むテスト用のディレクトリツリーを作成"""
+    source_dir = make_tree(
+        {
+            "a.txt": "alpha",
+            "sub/big.bin": os.urandom(3 * 1024 * 1024),
+            "sub/empty": b"",
+        }
+    )
+    if sys.platform != "win32":
+        # Windows ではシンボリックリンクの作成に特権が必要
+        os.symlink("a.txt", source_dir / "link")
+    return source_dir
+
+
+@pytest.fixture
+def source_opens(monkeypatch, source_tree):
+    """コピー元のファイルが読み込みのために開かれた回数を数える"""
+    counts = {}
+    real_open = os.open
+
+    def counting_open(path, flags, *args, **kwargs):
+        path = os.fspath(path)
+        if path.startswith(str(source_tree)) and not flags & os.O_WRONLY:
+            counts[path] = counts.get(path, 0) + 1
+        return real_open(path, flags, *args, **kwargs)
+
+    monkeypatch.setattr(os, "open", counting_open)
+    return counts
+
+
+def _assert_same_tree(source_tree, dest):
+    assert (dest / "a.txt").read_text() == "alpha"
+    assert (dest / "sub" / "big.bin").read_bytes() == (
+        source_tree / "sub" / "big.bin"
+    ).read_bytes()
+    assert (dest / "sub" / "empty").read_bytes() == b""
+    if sys.platform != "win32":
+        assert os.readlink(dest / "link") == "a.txt"
+    assert (dest / "sub" / "big.bin").stat().st_mtime_ns == (
+        source_tree / "sub" / "big.bin"
+    ).stat().st_mtime_ns
+    assert not [
+        name for _, _, names in os.walk(dest) for name in names if "copyman-tmp" in name
+    ]
+
+
+class TestFanoutCopy:
+    def test_each_file_is_read_once(self, source_tree, tmp_path, source_opens):
+        """各ファイルを1回だけ読み、すべてのコピー先へ書き込むことをテスト"""
+        dests = [tmp_path / "dest1", tmp_path / "dest2", tmp_path / "dest3"]
+
+        results = FanoutCopy().copy_fanout(str(source_tree), [str(d) for d in dests])
+
+        assert results == [True, True, True]
+        for dest in dests:
+            _assert_same_tree(source_tree, dest)
+        assert source_opens[str(source_tree / "a.txt")] == 1
+        assert source_opens[str(source_tree / "sub" / "big.bin")] == 1
+
+    def test_unchanged_destinations_are_skipped(
+        self, source_tree, tmp_path, source_opens
+    ):
+        """変更のないコピー先には書き込まず、他のコピー先だけにコピーすることをテスト"""
+        existing = tmp_path / "existing"
+        FanoutCopy().copy_fanout(str(source_tree), [str(existing)])
+        big = existing / "sub" / "big.bin"
+        inode = big.stat().st_ino
+        source_opens.clear()
+
+        results = FanoutCopy().copy_fanout(
+            str(source_tree), [str(existing), str(tmp_path / "new")]
+        )
+
+        assert results == [True, True]
+        assert big.stat().st_ino == inode
+        _assert_same_tree(source_tree, tmp_path / "new")
+        assert source_opens[str(source_tree / "sub" / "big.bin")] == 1
+
+    def test_failed_destination_does_not_stop_others(self, source_tree, tmp_path):
+        """1つのコピー先が失敗しても、他のコピー先へのコピーは完了することをテスト"""
+        blocker = tmp_path / "blocker"
+        blocker.write_text("not a directory")
+        errors = []
+        copier = FanoutCopy(error_callback=lambda *args: errors.append(args))
+        files = []
+        copier.set_file_callback(lambda path, size: files.append(path))
+
+        results = copier.copy_fanout(
+            str(source_tree), [str(blocker / "dest"), str(tmp_path / "ok")], retries=2
+        )
+
+        assert results == [False, True]
+        _assert_same_tree(source_tree, tmp_path / "ok")
+        # 進行状況はコピー先のファイルのパスで報告される
+        assert str(tmp_path / "ok" / "sub" / "big.bin") in files
+        assert not [path for path in files if path.startswith(str(blocker))]
+        messages = [error[3] for error in errors]
+        assert str(blocker / "dest") in messages[0]
+        assert messages[-1] == "コピーに失敗しました。"
+
+    @pytest.mark.skipif(
+        not sys.platform.startswith("linux"), reason="/proc を使用するテスト"
+    )
+    def test_write_failure_is_isolated(self, source_tree, tmp_path, monkeypatch):
+        """書き込み中に失敗したコピー先だけが外され、一時ファイルが残らないことをテスト"""
+        full = tmp_path / "full"
+        write_all = fanout._write_all
+
+        def failing_write_all(fd, data):
+            if os.readlink(f"/proc/self/fd/{fd}").startswith(str(full)):
+                raise OSError(errno.ENOSPC, "No space left on device")
+            write_all(fd, data)
+
+        monkeypatch.setattr(fanout, "_write_all", failing_write_all)
+        errors = []
+        copier = FanoutCopy(error_callback=lambda *args: errors.append(args))
+
+        results = copier.copy_fanout(
+            str(source_tree), [str(full), str(tmp_path / "ok")], retries=1
+        )
+
+        assert results == [False, True]
+        _assert_same_tree(source_tree, tmp_path / "ok")
+        assert not (full / "sub" / "big.bin").exists()
+        assert not [
+            name for _, _, names in os.walk(full) for name in names if "tmp" in name
+        ]
+        assert "No space left on device" in errors[0][3]
+
+    def test_single_file_source(self, tmp_path):
+        """ファイルのコピー元が既存のディレクトリの中にコピーされることをテスト"""
+        src = tmp_path / "file.txt"
+        src.write_text("content")
+        dest_dir = tmp_path / "existing"
+        dest_dir.mkdir()
+
+        results = CopyManager().copy_fanout(
+            str(src), [str(dest_dir), str(tmp_path / "renamed.txt")]
+        )
+
+        assert results == [True, True]
+        assert (dest_dir / "file.txt").read_text() == "content"
+        assert (tmp_path / "renamed.txt").read_text() == "content"
+
+
+class TestMirrorBatch:
+    def test_batch_copies_to_every_destination(self, source_tree, tmp_path):
+        """追加のコピー先にも同じ内容がコピーされ、進行状況がコピー先ごとに集計されることをテスト"""
+        snapshots = []
+        primary, mirror = tmp_path / "backup", tmp_path / "nas"
+        batch = CopyBatch(
+            [str(source_tree)],
+            str(primary),
+            mirror_dirs=[str(mirror)],
+            verify=True,
+            progress_callback=snapshots.append,
+        )
+
+        assert batch.run()
+
+        for root in (primary, mirror):
+            _assert_same_tree(source_tree, root / "source")
+            assert not (root / JOURNAL_NAME).exists()
+            assert (root / ".source.copyman-manifest.jsonl").exists()
+        last = snapshots[-1]
+        assert set(last.sources) == {str(primary / "source"), str(mirror / "source")}
+        assert last.overall.done == last.overall.total
+
+    def test_existing_destination_is_skipped_per_root(self, source_tree, tmp_path):
+        """コピー先ディレクトリごとに既存のコピー先を判定することをテスト"""
+        primary, mirror = tmp_path / "backup", tmp_path / "nas"
+        CopyBatch([str(source_tree)], str(primary), engine="native").run()
+        messages = []
+
+        batch = CopyBatch(
+            [str(source_tree)],
+            str(primary),
+            mirror_dirs=[str(mirror)],
+            message_callback=messages.append,
+        )
+
+        assert batch.run()
+        _assert_same_tree(source_tree, mirror / "source")
+        assert f"Copying {source_tree} to {mirror / 'source'}" in messages
+
+    def test_command_line_mirror(self, source_tree, tmp_path):
+        """--mirror で追加のコピー先を指定できることをテスト"""
+        exit_code = main(
+            [
+                str(source_tree),
+                "-d",
+                str(tmp_path / "backup"),
+                "--mirror",
+                str(tmp_path / "nas1"),
+                "--mirror",
+                str(tmp_path / "nas2"),
+            ]
+        )
+
+        assert exit_code == 0
+        for root in ("backup", "nas1", "nas2"):
+            _assert_same_tree(source_tree, tmp_path / root / "source")
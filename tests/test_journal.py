@@ -0,0 +1,121 @@
+import os
+import pytest
+from mod.copy_support.batch import CopyBatch
+from mod.copy_support.journal import CopyJournal
+from mod.copy_support.native import NativeCopy
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.jsonl")
+
+
+class TestCopyJournal:
+    def test_interrupted_job_survives_restart(self, journal_path, tmp_path):
+        """開始だけ記録されたコピー元が再起動後に未完了と判定されることをテスト"""
+        src_file = tmp_path / "a.txt"
+        src_file.write_text("a")
+
+        journal = CopyJournal(journal_path)
+        journal.begin("/src/one", "/dest/one")
+        journal.begin("/src/two", "/dest/two")
+        journal.finish("/src/two", "/dest/two")
+        journal.record("/dest/one/a.txt", os.lstat(src_file))
+        journal.close()
+
+        # 書き込み途中で終了した行を模倣する
+        with open(journal_path, "a", encoding="utf-8") as f:
+            f.write('{"event": "fi')
+
+        reopened = CopyJournal(journal_path)
+        assert reopened.is_interrupted("/src/one", "/dest/one")
+        assert not reopened.is_interrupted("/src/two", "/dest/two")
+        assert reopened.is_recorded("/dest/one/a.txt", os.lstat(src_file))
+        assert reopened.has_unfinished()
+        reopened.discard()
+        assert not os.path.exists(journal_path)
+
+    def test_record_after_partial_line_is_readable(self, journal_path):
+        """書き込み途中の行の後に追記したレコードが次回の読み込みで有効なことをテスト"""
+        journal = CopyJournal(journal_path)
+        journal.begin("/src/one", "/dest/one")
+        journal.close()
+        with open(journal_path, "a", encoding="utf-8") as f:
+            f.write('{"event": "fin')
+
+        resumed = CopyJournal(journal_path)
+        assert resumed.is_interrupted("/src/one", "/dest/one")
+        resumed.finish("/src/one", "/dest/one")
+        resumed.close()
+
+        reopened = CopyJournal(journal_path)
+        assert not reopened.is_interrupted("/src/one", "/dest/one")
+        assert not reopened.has_unfinished()
+        reopened.close()
+
+    def test_native_copy_skips_recorded_files(self, journal_path, tmp_path):
+        """記録済みのファイルは再コピーされず、未記録のファイルだけがコピーされることをテスト"""
+        source = tmp_path / "source"
+        source.mkdir()
+        (source / "done.txt").write_text("done")
+        (source / "todo.txt").write_text("todo")
+        dest = tmp_path / "dest"
+
+        # 前回の実行でコピー済みのファイル (内容を変えて、再コピーされないことを確認する)
+        dest.mkdir()
+        (dest / "done.txt").write_text("DONE")
+        done_stat = os.lstat(source / "done.txt")
+        os.utime(dest / "done.txt", ns=(done_stat.st_atime_ns, done_stat.st_mtime_ns))
+        journal = CopyJournal(journal_path)
+        journal.record(str(dest / "done.txt"), done_stat)
+
+        copier = NativeCopy()
+        copier.set_journal(journal)
+        assert copier.copy(str(source), str(dest))
+        journal.close()
+
+        assert (dest / "done.txt").read_text() == "DONE"
+        assert (dest / "todo.txt").read_text() == "todo"
+        reopened = CopyJournal(journal_path)
+        assert reopened.is_recorded(str(dest / "todo.txt"), os.lstat(source / "todo.txt"))
+        reopened.close()
+
+    def test_recorded_file_missing_at_destination_is_copied(self, journal_path, tmp_path):
+        """記録済みでもコピー先から削除されたファイルは再開時にコピーされることをテスト"""
+        source = tmp_path / "source"
+        source.mkdir()
+        (source / "done.txt").write_text("done")
+        dest = tmp_path / "dest"
+
+        journal = CopyJournal(journal_path)
+        journal.record(str(dest / "done.txt"), os.lstat(source / "done.txt"))
+        copier = NativeCopy()
+        copier.set_journal(journal)
+        assert copier.copy(str(source), str(dest))
+        journal.close()
+
+        assert (dest / "done.txt").read_text() == "done"
+
+    def test_interrupt_cancels_before_journal_is_closed(self, tmp_path, monkeypatch):
+        """Ctrl+C で中断された場合、ジャーナルを閉じる前にコピーを止めることをテスト"""
+        (tmp_path / "source").mkdir()
+        batch = CopyBatch(
+            [str(tmp_path / "source")], str(tmp_path / "dest"), parallel_copy=True
+        )
+
+        def interrupted(*args, **kwargs):
+            raise KeyboardInterrupt
+
+        cancelled_at_close = []
+        close = CopyJournal.close
+        monkeypatch.setattr(batch.copy_manager, "copy_many", interrupted)
+        monkeypatch.setattr(
+            CopyJournal,
+            "close",
+            lambda self: cancelled_at_close.append(batch.cancelled) or close(self),
+        )
+
+        with pytest.raises(KeyboardInterrupt):
+            batch.run()
+        assert cancelled_at_close == [True]
+        assert batch.copy_manager.cancel_token.cancelled
@@ -38,3 +38,62 @@ def test_log_format_json(logger, tmp_path):
     assert log_file.exists()
     content = log_file.read_text()
     assert test_data["message"] in content
+
+
+def test_async_logging(tmp_path):
+    """非同期モードで記録したログが停止時にすべて書き出されることをテスト"""
+    log_dir = tmp_path / "async_logs"
+    async_logger = TomaLogger(
+        log_name="async.log", log_dir=str(log_dir), async_mode=True, batch_size=8
+    )
+    for i in range(100):
+        async_logger.info(f"Progress {i}")
+    async_logger.error("Copy failed")
+    async_logger.close()
+
+    content = (log_dir / "async.log").read_text(encoding="utf-8")
+    assert "Progress 0" in content
+    assert "Progress 99" in content
+    assert "Copy failed" in content
+    assert async_logger.dropped == 0
+
+
+def test_async_drop_policy():
+    """キューが満杯のとき WARNING 未満のログだけが破棄されることをテスト"""
+    import logging
+    import queue
+    import threading
+    from mod.toma_logger.logger import _BoundedQueueHandler
+
+    log_queue = queue.Queue(maxsize=1)
+    handler = _BoundedQueueHandler(log_queue, overflow="drop")
+    record = logging.LogRecord("test", logging.INFO, __file__, 0, "info", None, None)
+    for _ in range(3):
+        handler.emit(record)
+    assert handler.dropped == 2
+
+    # WARNING 以上はキューが空くまで待ってから追加される
+    warning = logging.LogRecord("test", logging.WARNING, __file__, 0, "warn", None, None)
+    threading.Timer(0.05, log_queue.get).start()
+    handler.emit(warning)
+    assert log_queue.get_nowait().levelno == logging.WARNING
+
+
+def test_log_format_xml_is_well_formed(tmp_path):
+    """XMLフォーマットのログファイルが整形式のXML文書になることをテスト"""
+    import xml.etree.ElementTree as ET
+
+    log_dir = tmp_path / "xml_logs"
+    for message in ("first <copy> & done", "second"):
+        xml_logger = TomaLogger(log_name="xml.log", log_dir=str(log_dir), log_format="xml")
+        xml_logger.info(message)
+        for handler in list(xml_logger.logger.handlers):
+            xml_logger.logger.removeHandler(handler)
+            handler.close()
+
+    root = ET.parse(log_dir / "xml.log").getroot()
+    assert root.tag == "log"
+    assert [entry.findtext("message") for entry in root] == [
+        "first <copy> & done",
+        "second",
+    ]
@@ -0,0 +1,307 @@
+import errno
+import os
+import platform
+import pytest
+from mod.copy_support.main import CopyManager
+from mod.copy_support import native
+from mod.copy_support.manifest import file_hexdigest
+from mod.copy_support.native import NativeCopy
+
+
+class TestNativeCopy:
+    def test_copy_tree(self, source_tree, tmp_path):
+        """ディレクトリツリーの中身がコピーされることをテスト"""
+        dest_dir = tmp_path / "dest"
+        progress = []
+
+        copy_manager = CopyManager(
+            lambda *args: progress.append(args), None, engine="native"
+        )
+        copy_manager.copy(str(source_tree), str(dest_dir))
+
+        assert (dest_dir / "a.txt").read_text() == "alpha"
+        assert (dest_dir / "sub" / "b.bin").read_bytes() == (
+            source_tree / "sub" / "b.bin"
+        ).read_bytes()
+        assert (dest_dir / "sub" / "deep" / "c.txt").read_text() == "gamma"
+        assert (dest_dir / "empty").is_dir()
+        assert progress == [(1, 1, 100, 100)]
+
+    def test_preserves_metadata(self, source_tree, tmp_path):
+        """更新日時とパーミッションが保持されることをテスト"""
+        src_file = source_tree / "a.txt"
+        os.utime(src_file, ns=(1_000_000_000_000_000_000, 1_000_000_000_000_000_000))
+        os.utime(source_tree / "sub", (1_500_000_000, 1_500_000_000))
+        if platform.system() != "Windows":
+            os.chmod(src_file, 0o640)
+
+        dest_dir = tmp_path / "dest"
+        NativeCopy().copy(str(source_tree), str(dest_dir))
+
+        dest_file = dest_dir / "a.txt"
+        assert dest_file.stat().st_mtime_ns == src_file.stat().st_mtime_ns
+        assert int((dest_dir / "sub").stat().st_mtime) == 1_500_000_000
+        if platform.system() != "Windows":
+            assert dest_file.stat().st_mode & 0o777 == 0o640
+
+    def test_copy_symlink(self, source_tree, tmp_path):
+        """シンボリックリンクがリンクのままコピーされることをテスト"""
+        if platform.system() == "Windows":
+            pytest.skip("Mac/Linux環境でのみ実行可能なテスト")
+
+        os.symlink("a.txt", source_tree / "link.txt")
+        dest_dir = tmp_path / "dest"
+        NativeCopy().copy(str(source_tree), str(dest_dir))
+
+        assert os.path.islink(dest_dir / "link.txt")
+        assert os.readlink(dest_dir / "link.txt") == "a.txt"
+
+    def test_missing_source_reports_error(self, tmp_path):
+        """コピー元が存在しない場合にエラーコールバックが呼ばれることをテスト"""
+        errors = []
+        copier = NativeCopy(None, lambda *args: errors.append(args))
+        copier.copy(str(tmp_path / "missing.txt"), str(tmp_path / "dest"), retries=2)
+
+        assert errors[-1][1:] == (2, 2, "コピーに失敗しました。")
+
+    def test_unknown_engine(self):
+        """不明なエンジン名で ValueError が送出されることをテスト"""
+        with pytest.raises(ValueError):
+            CopyManager(engine="unknown")
+
+
+class TestLargeFileCopy:
+    def test_ranges_are_copied_in_parallel(self, source_tree, tmp_path, monkeypatch):
+        """しきい値以上のファイルが範囲に分割されて正しくコピーされることをテスト"""
+        monkeypatch.setattr(native, "_RANGE_SIZE", 1024 * 1024)
+        monkeypatch.setattr(native, "_reflink", lambda src_fd, dst_fd: False)
+        ranges = []
+        copy_range = native._copy_range
+        monkeypatch.setattr(
+            native,
+            "_copy_range",
+            lambda *args: ranges.append(args[2:4]) or copy_range(*args),
+        )
+
+        dest_dir = tmp_path / "dest"
+        NativeCopy(large_file_threshold=1024 * 1024).copy(
+            str(source_tree), str(dest_dir)
+        )
+
+        assert (dest_dir / "sub" / "b.bin").read_bytes() == (
+            source_tree / "sub" / "b.bin"
+        ).read_bytes()
+        # 3 MiB + 7 バイトのファイルは 1 MiB ずつ 4 つの範囲に分割される
+        assert sorted(ranges) == [
+            (0, 1024 * 1024),
+            (1024 * 1024, 1024 * 1024),
+            (2 * 1024 * 1024, 1024 * 1024),
+            (3 * 1024 * 1024, 7),
+        ]
+
+    def test_reflink_falls_back(self, source_tree, tmp_path):
+        """reflink に対応していないファイルシステムでも通常のコピーになることをテスト"""
+        dest_dir = tmp_path / "dest"
+        NativeCopy(large_file_threshold=1).copy(str(source_tree), str(dest_dir))
+
+        assert (dest_dir / "sub" / "b.bin").read_bytes() == (
+            source_tree / "sub" / "b.bin"
+        ).read_bytes()
+        assert (dest_dir / "a.txt").read_text() == "alpha"
+
+
+class TestSmallFileBatch:
+    def test_batch_copies_with_metadata(self, tmp_path):
+        """まとめてコピーしたファイルに内容と属性が設定されることをテスト"""
+        source = tmp_path / "source"
+        source.mkdir()
+        for n in range(5):
+            path = source / f"f{n}.txt"
+            path.write_text(f"file {n}")
+            os.utime(path, (1_500_000_000 + n, 1_500_000_000 + n))
+        dest = tmp_path / "dest"
+        dest.mkdir()
+        (dest / "f0.txt").write_text("old")
+        reported = []
+
+        copier = NativeCopy()
+        copier.set_file_callback(lambda path, size: reported.append(path))
+        entries = [(p.name, os.lstat(p)) for p in sorted(source.iterdir())]
+        assert copier.copy_batch(str(source), str(dest), entries) == []
+
+        for n in range(5):
+            assert (dest / f"f{n}.txt").read_text() == f"file {n}"
+            assert int((dest / f"f{n}.txt").stat().st_mtime) == 1_500_000_000 + n
+        assert sorted(reported) == [str(source / f"f{n}.txt") for n in range(5)]
+        assert not [p for p in dest.iterdir() if p.name.startswith(".")]
+
+    def test_existing_files_are_detected_without_listing(self, tmp_path, monkeypatch):
+        """コピー先の既存ファイルを一覧を読まずに O_EXCL の失敗で検出することをテスト"""
+        source = tmp_path / "source"
+        source.mkdir()
+        dest = tmp_path / "dest"
+        dest.mkdir()
+        for n in range(5):
+            (source / f"f{n}.txt").write_text(f"file {n}")
+        (dest / "f0.txt").write_text("old")
+        entries = [(p.name, os.lstat(p)) for p in sorted(source.iterdir())]
+        monkeypatch.setattr(
+            os, "listdir", lambda *args: pytest.fail("listdir が呼ばれました")
+        )
+
+        assert NativeCopy().copy_batch(str(source), str(dest), entries) == []
+
+        for n in range(5):
+            assert (dest / f"f{n}.txt").read_text() == f"file {n}"
+
+    def test_small_files_are_batched_in_tree_copy(self, source_tree, tmp_path):
+        """ツリーのコピーで小さなファイルがまとめてコピーされることをテスト"""
+        batches = []
+        copier = NativeCopy()
+        copy_batch = copier.copy_batch
+        copier.copy_batch = lambda src, dest, entries: (
+            batches.append(sorted(name for name, _ in entries))
+            or copy_batch(src, dest, entries)
+        )
+
+        dest_dir = tmp_path / "dest"
+        assert copier.copy(str(source_tree), str(dest_dir))
+
+        assert sorted(batches) == [["a.txt"], ["c.txt"]]
+        assert (dest_dir / "sub" / "b.bin").read_bytes() == (
+            source_tree / "sub" / "b.bin"
+        ).read_bytes()
+
+
+class TestNativeSync:
+    def test_unchanged_files_are_skipped(self, source_tree, tmp_path):
+        """2回目のコピーでは変更のあるファイルだけがコピーされることをテスト"""
+        dest_dir = tmp_path / "dest"
+        copier = NativeCopy()
+        copier.copy(str(source_tree), str(dest_dir))
+
+        copied = []
+        original_copy_file = copier.copy_file
+
+        def tracking_copy_file(src, dest, src_stat=None):
+            copied.append(os.path.basename(src))
+            return original_copy_file(src, dest, src_stat)
+
+        copier.copy_file = tracking_copy_file
+        (source_tree / "a.txt").write_text("ALPHA!")
+        copier.copy(str(source_tree), str(dest_dir))
+
+        assert copied == ["a.txt"]
+        assert (dest_dir / "a.txt").read_text() == "ALPHA!"
+
+    def test_sync_large_directory_without_listing(self, tmp_path, monkeypatch):
+        """バッチに分かれる大きなディレクトリの同期でコピー先の一覧を読まないことをテスト"""
+        source = tmp_path / "source"
+        source.mkdir()
+        for n in range(3 * native._BATCH_FILES):
+            (source / f"f{n}.txt").write_text(f"file {n}")
+        dest = tmp_path / "dest"
+        NativeCopy().copy(str(source), str(dest))
+        (source / "f1.txt").write_text("changed")
+        os.utime(source / "f1.txt", (1, 1))
+        (source / "new.txt").write_text("new")
+
+        listed = []
+        real_listdir = os.listdir
+        monkeypatch.setattr(
+            os, "listdir", lambda *args: listed.append(args) or real_listdir(*args)
+        )
+        assert NativeCopy().copy(str(source), str(dest))
+
+        assert listed == []
+        assert (dest / "f1.txt").read_text() == "changed"
+        assert (dest / "new.txt").read_text() == "new"
+        assert (dest / "f2.txt").read_text() == "file 2"
+
+    def test_checksum_detects_same_size_change(self, source_tree, tmp_path):
+        """チェックサム比較ではサイズと更新日時が同じでも内容の違いを検出することをテスト"""
+        dest_dir = tmp_path / "dest"
+        NativeCopy().copy(str(source_tree), str(dest_dir))
+
+        src_stat = os.stat(source_tree / "a.txt")
+        (dest_dir / "a.txt").write_text("ALPHA")
+        os.utime(dest_dir / "a.txt", ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+        NativeCopy().copy(str(source_tree), str(dest_dir))
+        assert (dest_dir / "a.txt").read_text() == "ALPHA"
+
+        NativeCopy(checksum=True).copy(str(source_tree), str(dest_dir))
+        assert (dest_dir / "a.txt").read_text() == "alpha"
+
+
+@pytest.fixture
+def sparse_file(tmp_path):
+    """データの間に穴のある 64 MiB のファイルを作成"""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    path = source_dir / "disk.img"
+    with open(path, "wb") as f:
+        for offset in (0, 5 * 1024 * 1024, 40 * 1024 * 1024):
+            f.seek(offset)
+            f.write(os.urandom(64 * 1024))
+        f.truncate(64 * 1024 * 1024)
+    src_stat = os.stat(path)
+    if not hasattr(os, "SEEK_DATA") or src_stat.st_blocks * 512 >= src_stat.st_size:
+        pytest.skip("ファイルシステムが穴のあるファイルに対応していない")
+    return path
+
+
+class TestSparseCopy:
+    def _assert_sparse_copy(self, src, dest):
+        src_stat, dest_stat = os.stat(src), os.stat(dest)
+        assert dest_stat.st_size == src_stat.st_size
+        # 割り当てられたブロックがコピー元とほぼ同じ (穴が書き込まれていない)
+        assert dest_stat.st_blocks * 512 <= src_stat.st_blocks * 512 + 256 * 1024
+        with open(src, "rb") as a, open(dest, "rb") as b:
+            assert a.read() == b.read()
+
+    def test_holes_are_preserved(self, sparse_file, tmp_path):
+        """CopyManager で選ばれるエンジンでも穴が穴のままコピーされることをテスト"""
+        dest_dir = tmp_path / "dest"
+        CopyManager(engine="native").copy(str(sparse_file.parent), str(dest_dir))
+
+        self._assert_sparse_copy(sparse_file, dest_dir / "disk.img")
+
+    def test_large_sparse_file_is_not_copied_in_ranges(
+        self, sparse_file, tmp_path, monkeypatch
+    ):
+        """しきい値以上の穴のあるファイルも範囲の並列コピーで穴を埋めないことをテスト"""
+        monkeypatch.setattr(native, "_reflink", lambda src_fd, dst_fd: False)
+        dest = tmp_path / "disk.img"
+
+        NativeCopy(large_file_threshold=1024 * 1024).copy(str(sparse_file), str(dest))
+
+        self._assert_sparse_copy(sparse_file, dest)
+
+    def test_digest_includes_holes(self, sparse_file, tmp_path):
+        """コピー中に計算したハッシュ値が穴をゼロとして含むことをテスト"""
+        digests = []
+        copier = NativeCopy()
+        copier.set_digest_callback(lambda *args: digests.append(args[3]))
+        dest = tmp_path / "disk.img"
+
+        assert copier.copy(str(sparse_file), str(dest))
+
+        self._assert_sparse_copy(sparse_file, dest)
+        assert digests == [file_hexdigest(str(sparse_file))]
+
+    def test_filesystem_without_seek_data_falls_back(
+        self, sparse_file, tmp_path, monkeypatch
+    ):
+        """SEEK_DATA に対応していない場合は通常のコピーになることをテスト"""
+
+        def unsupported(fd, size):
+            raise OSError(errno.EINVAL, "Invalid argument")
+            yield
+
+        monkeypatch.setattr(native, "_data_extents", unsupported)
+        dest = tmp_path / "disk.img"
+
+        assert NativeCopy().copy(str(sparse_file), str(dest))
+        with open(sparse_file, "rb") as a, open(dest, "rb") as b:
+            assert a.read() == b.read()
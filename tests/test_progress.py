@@ -0,0 +1,82 @@
+import threading
+import time
+
+from mod.copy_support.batch import CopyBatch
+from mod.copy_support.progress import ProgressAggregator
+
+
+class TestProgressAggregator:
+    def test_snapshot_per_source_and_overall(self):
+        """コピー元ごとと全体の進捗がスナップショットにまとめられることをテスト"""
+        aggregator = ProgressAggregator()
+        aggregator.set_totals({"/a": 1000, "/b": 3000})
+        aggregator.add("/a", 400)
+        aggregator.add("/a", 100)
+        aggregator.update("/b", 1500)
+
+        snapshot = aggregator.snapshot()
+
+        assert snapshot.sources["/a"].done == 500
+        assert snapshot.sources["/a"].percent == 50.0
+        assert snapshot.sources["/b"].done == 1500
+        assert snapshot.overall.done == 2000
+        assert snapshot.overall.total == 4000
+        assert snapshot.overall.percent == 50.0
+
+    def test_complete_fills_source(self):
+        """完了したコピー元は 100% として扱われることをテスト"""
+        aggregator = ProgressAggregator()
+        aggregator.set_totals({"/a": 1000})
+        aggregator.add("/a", 10)
+        aggregator.complete("/a")
+
+        snapshot = aggregator.snapshot()
+
+        assert snapshot.sources["/a"].percent == 100.0
+        assert snapshot.overall.eta == 0.0
+
+    def test_emission_is_rate_limited(self):
+        """大量の更新があっても通知回数が間隔で制限されることをテスト"""
+        snapshots = []
+        aggregator = ProgressAggregator(interval=0.05, sink=snapshots.append)
+        aggregator.set_totals({"/a": 10**9})
+        aggregator.start()
+
+        def worker():
+            deadline = time.monotonic() + 0.3
+            while time.monotonic() < deadline:
+                aggregator.add("/a", 1)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        aggregator.stop()
+
+        # 0.3 秒間に 0.05 秒間隔 + 停止時の1回を大きく超えない
+        assert 1 <= len(snapshots) <= 10
+        assert snapshots[-1].overall.done > 0
+        assert snapshots[-1].overall.rate > 0
+
+
+def test_batch_reports_snapshots(tmp_path):
+    """CopyBatch がコピー元ごとの進捗をスナップショットで通知することをテスト"""
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "one.bin").write_bytes(b"x" * 1000)
+    (src / "sub" / "two.bin").write_bytes(b"x" * 2000)
+    snapshots = []
+
+    batch = CopyBatch(
+        [str(src)],
+        str(tmp_path / "dest"),
+        engine="native",
+        progress_callback=snapshots.append,
+    )
+
+    assert batch.run()
+    assert snapshots
+    final = snapshots[-1]
+    assert final.sources[str(src)].done == 3000
+    assert final.overall.percent == 100.0
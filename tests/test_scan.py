@@ -0,0 +1,43 @@
+import pytest
+from mod.copy_support.scan import scan_sources
+
+
+@pytest.fixture
+def source_dirs(tmp_path):
+    """サイズの分かっているコピー元を作成"""
+    first = tmp_path / "first"
+    (first / "a" / "b").mkdir(parents=True)
+    (first / "one.bin").write_bytes(b"x" * 100)
+    (first / "a" / "two.bin").write_bytes(b"x" * 200)
+    (first / "a" / "b" / "three.bin").write_bytes(b"x" * 300)
+    second = tmp_path / "second.bin"
+    second.write_bytes(b"y" * 50)
+    return [str(first), str(second)]
+
+
+class TestScanSources:
+    def test_counts_files_and_bytes(self, source_dirs):
+        """コピー元ごとのファイル数と合計サイズが集計されることをテスト"""
+        index = scan_sources(source_dirs, max_workers=3)
+
+        assert index[source_dirs[0]].files == 3
+        assert index[source_dirs[0]].size == 600
+        assert index[source_dirs[1]].files == 1
+        assert index[source_dirs[1]].size == 50
+        assert index.total_files == 4
+        assert index.total_bytes == 650
+
+    def test_percent_and_eta(self, source_dirs):
+        """バッチ全体の進捗率と残り時間の計算をテスト"""
+        index = scan_sources(source_dirs)
+
+        assert index.percent(325) == 50.0
+        assert index.eta(325, 10.0) == 10.0
+        assert index.eta(0, 10.0) is None
+
+    def test_missing_source(self, tmp_path):
+        """存在しないコピー元は 0 として扱われることをテスト"""
+        index = scan_sources([str(tmp_path / "missing")])
+
+        assert index.total_files == 0
+        assert index.percent(0) == 100.0
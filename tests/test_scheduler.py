@@ -0,0 +1,66 @@
+import os
+import pytest
+from mod.copy_support.main import CopyManager
+from mod.copy_support.native import NativeCopy
+from mod.copy_support.scheduler import CopyScheduler
+
+
+@pytest.fixture
+def source_dirs(tmp_path):
+    """大きさの異なる複数のコピー元ディレクトリを作成"""
+    big = tmp_path / "big"
+    for i in range(20):
+        sub = big / f"d{i}"
+        sub.mkdir(parents=True)
+        for j in range(10):
+            (sub / f"f{j}.txt").write_text(f"{i}-{j}")
+    small = tmp_path / "small"
+    small.mkdir()
+    (small / "only.txt").write_text("only")
+    return [big, small]
+
+
+class TestCopyScheduler:
+    def test_copies_all_trees(self, source_dirs, tmp_path):
+        """すべてのツリーのファイルがコピーされ、ジョブごとに進捗が報告されることをテスト"""
+        dest = tmp_path / "dest"
+        progress = []
+        jobs = [(str(src), str(dest / src.name)) for src in source_dirs]
+
+        scheduler = CopyScheduler(
+            NativeCopy(), max_workers=4, progress_callback=lambda *a: progress.append(a)
+        )
+        errors = scheduler.run(jobs)
+
+        assert errors == [[], []]
+        assert (dest / "big" / "d19" / "f9.txt").read_text() == "19-9"
+        assert (dest / "small" / "only.txt").read_text() == "only"
+        assert sorted(p[0] for p in progress) == [1, 2]
+        assert progress[-1][3] == 100
+
+    def test_reports_failed_files(self, source_dirs, tmp_path):
+        """コピーできないファイルがジョブごとに報告されることをテスト"""
+        dest = tmp_path / "dest"
+        # コピー先にディレクトリを置いてファイルの置き換えを失敗させる
+        (dest / "small" / "only.txt").mkdir(parents=True)
+        reported = []
+
+        scheduler = CopyScheduler(
+            NativeCopy(), retries=1, error_callback=lambda *a: reported.append(a)
+        )
+        errors = scheduler.run([(str(src), str(dest / src.name)) for src in source_dirs])
+
+        assert errors[0] == []
+        assert [path for path, _ in errors[1]] == [
+            os.path.join(str(source_dirs[1]), "only.txt")
+        ]
+        assert reported[-1] == (str(source_dirs[1]), 1, 1, "コピーに失敗しました。")
+
+    def test_copy_many_uses_native_scheduler(self, source_dirs, tmp_path):
+        """CopyManager.copy_many で複数のツリーがコピーされることをテスト"""
+        dest = tmp_path / "dest"
+        copy_manager = CopyManager(engine="native")
+        copy_manager.copy_many([(str(src), str(dest / src.name)) for src in source_dirs])
+
+        assert (dest / "big" / "d0" / "f0.txt").read_text() == "0-0"
+        assert (dest / "small" / "only.txt").exists()
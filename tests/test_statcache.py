@@ -0,0 +1,136 @@
+import os
+import shutil
+
+import pytest
+from mod.copy_support.batch import CopyBatch
+from mod.copy_support.native import NativeCopy
+from mod.copy_support.statcache import STAT_CACHE_NAME, StatCache
+
+# キャッシュの対象になるよう、コピー元のディレクトリの更新日時を過去にする
+_PAST_NS = 1_600_000_000_000_000_000
+
+
+def _age_dirs(root):
+    for path, dirs, _ in os.walk(root):
+        os.utime(path, ns=(_PAST_NS, _PAST_NS))
+
+
+@pytest.fixture
+def source_tree(make_tree):
+    """ディレクトリの更新日時を過去にずらしたテスト用のディレクトリツリーを作成"""
+    source_dir = make_tree(
+        {
+            "a.txt": "alpha",
+            "sub/b.bin": os.urandom(256 * 1024),
+            "sub/deep/c.txt": "gamma",
+        }
+    )
+    _age_dirs(source_dir)
+    return source_dir
+
+
+def _sync(source_tree, dest_root, parallel_copy=False):
+    batch = CopyBatch(
+        [str(source_tree)],
+        str(dest_root),
+        parallel_copy=parallel_copy,
+        engine="native",
+        sync=True,
+        stat_cache=True,
+    )
+    assert batch.run()
+    return batch
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    """readdir とコピー先の比較の回数を数える"""
+    counts = {"scandir": 0, "compare": 0}
+    scandir = os.scandir
+    is_unchanged = NativeCopy._is_unchanged
+
+    def counting_scandir(*args, **kwargs):
+        counts["scandir"] += 1
+        return scandir(*args, **kwargs)
+
+    def counting_is_unchanged(self, *args, **kwargs):
+        counts["compare"] += 1
+        return is_unchanged(self, *args, **kwargs)
+
+    def install():
+        monkeypatch.setattr(os, "scandir", counting_scandir)
+        monkeypatch.setattr(NativeCopy, "_is_unchanged", counting_is_unchanged)
+        return counts
+
+    return install
+
+
+class TestStatCache:
+    @pytest.mark.parametrize("parallel_copy", [False, True])
+    def test_unchanged_sync_skips_readdir_and_compare(
+        self, source_tree, tmp_path, counters, parallel_copy
+    ):
+        """変更のない同期で readdir とコピー先の比較が省略されることをテスト"""
+        dest_root = tmp_path / "dest"
+        _sync(source_tree, dest_root, parallel_copy)
+        assert (dest_root / STAT_CACHE_NAME).exists()
+
+        counts = counters()
+        _sync(source_tree, dest_root, parallel_copy)
+
+        assert counts == {"scandir": 0, "compare": 0}
+        assert (dest_root / "source" / "sub" / "deep" / "c.txt").read_text() == "gamma"
+
+    def test_changes_are_still_copied(self, source_tree, tmp_path):
+        """中身の変更と追加されたファイルがコピーされることをテスト"""
+        dest_root = tmp_path / "dest"
+        _sync(source_tree, dest_root)
+
+        # 中身だけの変更はディレクトリの更新日時に現れない
+        (source_tree / "a.txt").write_text("ALPHA!")
+        _age_dirs(source_tree)
+        (source_tree / "sub" / "deep" / "new.txt").write_text("new")
+        _sync(source_tree, dest_root)
+
+        assert (dest_root / "source" / "a.txt").read_text() == "ALPHA!"
+        assert (dest_root / "source" / "sub" / "deep" / "new.txt").read_text() == "new"
+
+    def test_deleted_destination_is_copied_again(self, source_tree, tmp_path):
+        """コピー先を削除した場合は記録があっても再コピーされることをテスト"""
+        dest_root = tmp_path / "dest"
+        _sync(source_tree, dest_root)
+        shutil.rmtree(dest_root / "source")
+
+        _sync(source_tree, dest_root)
+
+        assert (dest_root / "source" / "a.txt").read_text() == "alpha"
+
+    def test_deleted_or_truncated_file_is_repaired(self, source_tree, tmp_path):
+        """記録があってもコピー先で削除・切り詰められたファイルは再コピーされることをテスト"""
+        dest_root = tmp_path / "dest"
+        _sync(source_tree, dest_root)
+        (dest_root / "source" / "a.txt").unlink()
+        with open(dest_root / "source" / "sub" / "b.bin", "r+b") as f:
+            f.truncate(10)
+
+        _sync(source_tree, dest_root)
+
+        assert (dest_root / "source" / "a.txt").read_text() == "alpha"
+        assert (dest_root / "source" / "sub" / "b.bin").read_bytes() == (
+            source_tree / "sub" / "b.bin"
+        ).read_bytes()
+
+    def test_recently_modified_directory_is_not_cached(self, tmp_path):
+        """更新日時が新しいディレクトリの一覧はキャッシュしないことをテスト"""
+        cache = StatCache(str(tmp_path / "cache.jsonl"))
+        fresh = tmp_path / "fresh"
+        fresh.mkdir()
+
+        cache.put_listing(str(fresh), fresh.stat(), [("x", False, 1)])
+        assert cache.listing(str(fresh), fresh.stat()) is None
+
+        os.utime(fresh, ns=(_PAST_NS, _PAST_NS))
+        cache.put_listing(str(fresh), fresh.stat(), [("x", False, 1)])
+        cache.save()
+        reloaded = StatCache(str(tmp_path / "cache.jsonl"))
+        assert reloaded.listing(str(fresh), fresh.stat()) == [("x", False, 1)]
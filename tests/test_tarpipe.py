@@ -0,0 +1,235 @@
+import io
+import os
+import tarfile
+
+import pytest
+from mod.copy_support import tarpipe
+from mod.copy_support.backends import choose_backend
+from mod.copy_support.native import SMALL_FILE_THRESHOLD
+from mod.copy_support.scan import TreeSize
+from mod.copy_support.tarpipe import (
+    TarPipeCopy,
+    _PipeProgress,
+    _StreamCounter,
+    _tar_help,
+    tar_available,
+)
+
+pytestmark = pytest.mark.skipif(not tar_available(), reason="tar がない")
+
+
+@pytest.fixture
+def source_tree(make_tree):
+    """小さなファイルが多いテスト用のディレクトリツリーを作成"""
+    spec = {
+        f"dir{i}/file{j}.txt": f"{i}-{j}" * 10 for i in range(5) for j in range(20)
+    }
+    source_dir = make_tree(
+        {
+            **spec,
+            "empty_dir": None,
+            "-dash.txt": "option-like name",
+            "big.bin": os.urandom(2 * 1024 * 1024),
+            "dir0/readonly.txt": "readonly",
+        }
+    )
+    os.symlink("big.bin", source_dir / "link")
+    os.chmod(source_dir / "dir0" / "readonly.txt", 0o444)
+    return source_dir
+
+
+def _assert_same_tree(source_tree, dest):
+    for root, dirs, files in os.walk(source_tree):
+        rel = os.path.relpath(root, source_tree)
+        for name in dirs + files:
+            src_path = os.path.join(root, name)
+            dest_path = os.path.join(dest, rel, name)
+            src_stat, dest_stat = os.lstat(src_path), os.lstat(dest_path)
+            assert src_stat.st_mode == dest_stat.st_mode, src_path
+            if os.path.islink(src_path):
+                assert os.readlink(src_path) == os.readlink(dest_path)
+                continue
+            assert int(src_stat.st_mtime) == int(dest_stat.st_mtime), src_path
+            if name in files:
+                with open(src_path, "rb") as a, open(dest_path, "rb") as b:
+                    assert a.read() == b.read(), src_path
+
+
+class TestTarPipeCopy:
+    def test_copy_tree(self, source_tree, tmp_path):
+        """ツリーの中身と属性がコピー先に展開されることをテスト"""
+        progress = []
+
+        def on_progress(current, total, current_percent, total_percent):
+            progress.append((current, total, current_percent))
+
+        assert TarPipeCopy(on_progress).copy(str(source_tree), str(tmp_path / "dest"))
+
+        _assert_same_tree(source_tree, tmp_path / "dest")
+        total = sum(
+            os.lstat(os.path.join(root, name)).st_size
+            for root, _, files in os.walk(source_tree)
+            for name in files
+            if not os.path.islink(os.path.join(root, name))
+        )
+        assert progress[-1] == (total, total, 100)
+        assert all(current <= total for current, _, _ in progress)
+
+    def test_progress_with_transfer_stats(self, source_tree, tmp_path):
+        """rate/eta を受け取れるコールバックには転送速度も渡されることをテスト"""
+        progress = []
+
+        def on_progress(current, total, current_percent, total_percent, rate, eta):
+            progress.append((current, total, rate))
+
+        assert TarPipeCopy(on_progress).copy(str(source_tree), str(tmp_path / "dest"))
+        current, total, rate = progress[-1]
+        assert current == total > 0
+        assert rate > 0
+
+    def test_unchanged_files_are_not_sent(self, source_tree, tmp_path):
+        """変更のないファイルは送らず、変更したファイルだけを展開し直すことをテスト"""
+        dest = tmp_path / "dest"
+        TarPipeCopy().copy(str(source_tree), str(dest))
+        inode = (dest / "big.bin").stat().st_ino
+        (source_tree / "dir1" / "file3.txt").write_text("changed")
+        os.utime(source_tree / "dir1" / "file3.txt", (1, 1))
+
+        assert TarPipeCopy().copy(str(source_tree), str(dest))
+
+        assert (dest / "big.bin").stat().st_ino == inode
+        _assert_same_tree(source_tree, dest)
+
+    def test_single_file_source(self, tmp_path):
+        """ファイル単体のコピー元は既存のディレクトリの中にコピーされることをテスト"""
+        src = tmp_path / "file.txt"
+        src.write_text("content")
+        (tmp_path / "existing").mkdir()
+
+        assert TarPipeCopy().copy(str(src), str(tmp_path / "existing"))
+        assert (tmp_path / "existing" / "file.txt").read_text() == "content"
+
+    def test_failure_is_retried(self, source_tree, tmp_path):
+        """コピー先を作成できない場合にリトライしてエラーを報告することをテスト"""
+        blocker = tmp_path / "blocker"
+        blocker.write_text("not a directory")
+        errors = []
+        copier = TarPipeCopy(error_callback=lambda *args: errors.append(args))
+
+        assert not copier.copy(str(source_tree), str(blocker / "dest"), retries=2)
+        messages = [error[3] for error in errors]
+        assert "リトライ中..." in messages
+        assert messages[-1] == "コピーに失敗しました。"
+
+    def test_cancelled_copy_is_not_started(self, source_tree, tmp_path):
+        """キャンセル後はコピーもエラー報告も行わないことをテスト"""
+        errors = []
+        copier = TarPipeCopy(error_callback=lambda *args: errors.append(args))
+        copier.cancel()
+
+        assert not copier.copy(str(source_tree), str(tmp_path / "dest"))
+        assert not (tmp_path / "dest" / "big.bin").exists()
+        assert errors == []
+
+    def test_sparse_file_keeps_holes(self, tmp_path):
+        """穴のあるファイルを穴を埋めずに展開することをテスト"""
+        source_dir = tmp_path / "source"
+        source_dir.mkdir()
+        with open(source_dir / "disk.img", "wb") as f:
+            f.write(os.urandom(64 * 1024))
+            f.truncate(32 * 1024 * 1024)
+        src_stat = os.stat(source_dir / "disk.img")
+        if (
+            not hasattr(src_stat, "st_blocks")
+            or src_stat.st_blocks * 512 >= src_stat.st_size
+        ):
+            pytest.skip("ファイルシステムが穴のあるファイルに対応していない")
+
+        assert TarPipeCopy().copy(str(source_dir), str(tmp_path / "dest"))
+
+        _assert_same_tree(source_dir, tmp_path / "dest")
+        dest_stat = os.stat(tmp_path / "dest" / "disk.img")
+        if "--sparse" in _tar_help():
+            assert dest_stat.st_blocks * 512 <= src_stat.st_blocks * 512 + 256 * 1024
+
+
+class TestStreamCounter:
+    @pytest.mark.parametrize("chunk_size", [1, 100, 512, 4096, 1 << 20])
+    def test_counts_regular_file_data(self, chunk_size):
+        """任意の区切りで渡されたストリームから通常ファイルのデータ量を数えることをテスト"""
+        buffer = io.BytesIO()
+        sizes = [0, 1, 511, 512, 513, 70000]
+        with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+            directory = tarfile.TarInfo("dir")
+            directory.type = tarfile.DIRTYPE
+            tar.addfile(directory)
+            for i, size in enumerate(sizes):
+                # 長い名前と非 ASCII の名前は PAX 拡張ヘッダーになる
+                info = tarfile.TarInfo(f"dir/{'長い名前' * 30}{i}")
+                info.size = size
+                tar.addfile(info, io.BytesIO(b"x" * size))
+            link = tarfile.TarInfo("dir/link")
+            link.type = tarfile.SYMTYPE
+            link.linkname = "target"
+            tar.addfile(link)
+        data = buffer.getvalue()
+
+        counter = _StreamCounter()
+        counted = sum(
+            counter.feed(data[i : i + chunk_size])
+            for i in range(0, len(data), chunk_size)
+        )
+
+        assert counted == sum(sizes)
+
+
+def test_tar_without_required_options_is_unavailable(monkeypatch):
+    """名前の一覧などのオプションに対応しない tar (bsdtar など) は使わないことをテスト"""
+    monkeypatch.setattr(
+        tarpipe, "_tar_help", lambda: "Usage:\n  tar -c [options] [files]\n"
+    )
+    tarpipe.tar_available.cache_clear()
+    try:
+        assert not tar_available()
+    finally:
+        tarpipe.tar_available.cache_clear()
+
+
+def test_names_use_posix_separators(tmp_path):
+    """tar に渡す名前の区切りが "/" になることをテスト"""
+    (tmp_path / "src" / "sub").mkdir(parents=True)
+    (tmp_path / "src" / "sub" / "a.txt").write_text("a")
+    listing = io.BytesIO()
+
+    TarPipeCopy()._list_names(
+        str(tmp_path / "src"),
+        str(tmp_path / "dest"),
+        False,
+        listing,
+        _PipeProgress(),
+        [],
+    )
+
+    assert set(listing.getvalue().split(b"\0")[:-1]) == {
+        b"./",
+        b"./sub",
+        b"./sub/a.txt",
+    }
+
+
+def test_many_small_files_prefer_tar(tmp_path, monkeypatch):
+    """ローカルの小さなファイルが多いツリーには tar を選ぶことをテスト"""
+    monkeypatch.setattr(
+        "mod.copy_support.backends.filesystem_type", lambda path: "ext4"
+    )
+    small = TreeSize(files=5000, size=5000 * (SMALL_FILE_THRESHOLD // 4))
+
+    assert (
+        choose_backend(
+            str(tmp_path),
+            str(tmp_path / "dest"),
+            small,
+            frozenset({"native", "rsync", "tar"}),
+        )
+        == "tar"
+    )
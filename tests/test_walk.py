@@ -0,0 +1,81 @@
+import os
+import platform
+import threading
+
+import pytest
+from mod.copy_support.walk import WalkEntry, iter_dir, walk
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """走査用のディレクトリツリーを作成"""
+    root = tmp_path / "root"
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "c").mkdir()
+    (root / "top.txt").write_text("top")
+    (root / "a" / "one.txt").write_text("one")
+    (root / "a" / "b" / "two.txt").write_text("two")
+    return root
+
+
+class TestWalk:
+    def test_directories_precede_their_contents(self, tree):
+        """ディレクトリがその中身より先に、中身がまとめて返されることをテスト"""
+        entries = list(walk(str(tree)))
+        rels = [entry.rel for entry in entries]
+
+        assert rels[0] == ""
+        assert sorted(rels) == sorted(
+            ["", "top.txt", "a", "a/one.txt", "a/b", "a/b/two.txt", "c"]
+        )
+        for entry in entries:
+            if entry.rel:
+                parent = os.path.dirname(entry.rel)
+                assert rels.index(parent) < rels.index(entry.rel)
+        # ディレクトリ以外の中身はディレクトリのエントリの直後に続く
+        assert rels[1] == "top.txt"
+        assert all(entry.stat is not None for entry in entries)
+
+    def test_lookahead_returns_same_entries(self, tree):
+        """先読みを有効にしても同じ順序でエントリが返されることをテスト"""
+        plain = [entry.rel for entry in walk(str(tree))]
+        prefetched = [entry.rel for entry in walk(str(tree), lookahead=2)]
+        assert prefetched == plain
+
+    def test_abandoned_lookahead_stops_thread(self, tree):
+        """途中で利用をやめると先読みのスレッドが終了することをテスト"""
+        before = threading.active_count()
+        entries = walk(str(tree), lookahead=1)
+        next(entries)
+        entries.close()
+        for _ in range(50):
+            if threading.active_count() <= before:
+                break
+            threading.Event().wait(0.02)
+        assert threading.active_count() <= before
+
+    def test_unreadable_directory_is_reported(self, tree):
+        """読み取れないディレクトリが on_error で報告されることをテスト"""
+        if platform.system() == "Windows" or os.geteuid() == 0:
+            pytest.skip("権限によるアクセス拒否を再現できない環境")
+        os.chmod(tree / "c", 0)
+        errors = []
+        try:
+            list(walk(str(tree), lambda path, e: errors.append(path)))
+        finally:
+            os.chmod(tree / "c", 0o755)
+        assert errors == [str(tree / "c")]
+
+    def test_single_file_root(self, tree):
+        """起点がファイルの場合はそのファイルだけが返されることをテスト"""
+        entries = list(walk(str(tree / "top.txt")))
+        assert [(entry.rel, entry.is_dir) for entry in entries] == [("", False)]
+
+    def test_iter_dir_and_slots(self, tree):
+        """iter_dir がディレクトリの stat を取得せず、エントリが __slots__ を持つことをテスト"""
+        entries = {entry.name: entry for entry in iter_dir(str(tree), "x")}
+
+        assert entries["a"].is_dir and entries["a"].stat is None
+        assert entries["top.txt"].stat.st_size == 3
+        assert entries["top.txt"].rel == os.path.join("x", "top.txt")
+        assert not hasattr(WalkEntry("p", "", "p", None, False), "__dict__")